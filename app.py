@@ -1,32 +1,69 @@
+import importlib
+import os
+import sys
 import streamlit as st
 import streamlit_authenticator as stauth
-import yaml
-from yaml.loader import SafeLoader
-import page1
-import page2
-import page3
-import page4
-import warnings
-warnings.filterwarnings("ignore")
+import credential_store
+import metrics
+
+# Count and log warnings (pandas slow paths among them) instead of hiding them, and export the metrics
+metrics.capture_warnings()
+metrics.start_export()
+
+# Take bars from another market-data provider when DASHBOARD_PROVIDER is set (see providers.py), or serve a
+# recorded market day on a fast clock instead of Yahoo when DASHBOARD_REPLAY_DAY is set (see replay.py)
+if os.environ.get("DASHBOARD_PROVIDER"):
+    import providers
+    providers.install_from_env()
+if os.environ.get("DASHBOARD_REPLAY_DAY"):
+    import replay
+    replay.install_from_env()
+
+# Pages in navigation order and the module that draws each. A page's module, and with it yfinance, pandas,
+# plotly and ta, is only imported the first time someone opens the page, so the login form shows without them.
+PAGES = {
+    "Stock Dashboard": "page1",
+    "Price Chart": "page2",
+    "US & European Stock Indices": "page3",
+    "Nifty 50 Stock Scanner": "page4",
+    "Metrics": "page5",
+}
+
+# Pages only listed for the users under 'admins' in config.yaml
+ADMIN_PAGES = ["Metrics"]
 
 # Set page configuration at the top
 st.set_page_config(page_title="Stock Dashboard", layout="wide")
 
-with open('./config.yaml', 'r', encoding='utf-8') as file:
-    config = yaml.load(file, Loader=SafeLoader)
+# Users are read from config.yaml once per process; this run's authenticator gets its own copy of them
+credentials = credential_store.store.credentials()
+cookie = credential_store.store.section('cookie')
 
 authenticator = stauth.Authenticate(
-    config['credentials'],
-    config['cookie']['name'],
-    config['cookie']['key'],
-    config['cookie']['expiry_days'],
-    config['pre-authorized']
+    credentials,
+    cookie['name'],
+    cookie['key'],
+    cookie['expiry_days'],
+    credential_store.store.section('pre-authorized')
 )
 
-def save_configfile():
-    # Saving config file
-    with open('./config.yaml', 'w', encoding='utf-8') as file:
-        yaml.dump(config, file, default_flow_style=False)
+# Module of a page, imported on first use; later calls return the already imported module
+def load_page(page):
+    module_name = PAGES[page]
+    if module_name in sys.modules:
+        return sys.modules[module_name]
+    with metrics.span("import"):
+        return importlib.import_module(module_name)
+
+# Record the page this run shows, None for the login, registration and password screens. A session that moves
+# off a page drops the poller subscriptions its charts held, so their symbols stop being polled right away.
+# The poller is only imported with the pages that subscribe, so before that there is nothing to drop.
+def show_page(page):
+    if st.session_state.get('shown_page') != page:
+        poller = sys.modules.get("poller")
+        if poller is not None:
+            poller.unsubscribe()
+        st.session_state['shown_page'] = page
 
 def add_black_background_and_banner():
     st.markdown(
@@ -64,13 +101,14 @@ def main():
 
     # Toggle between login and registration
     if st.session_state.register:
+        show_page(None)
         st.title("Register User")
         try:
             email_of_registered_user, username_of_registered_user, name_of_registered_user = authenticator.register_user(pre_authorization=False)
             if email_of_registered_user:
+                credential_store.store.register(username_of_registered_user, credentials['usernames'][username_of_registered_user])
                 st.success('User registered successfully')
                 st.session_state.register = False
-                save_configfile()
                 st.experimental_rerun()
         except Exception as e:
             st.error(e)
@@ -88,42 +126,46 @@ def main():
 
         if st.session_state["authentication_status"]:
             authenticator.logout('Logout', 'sidebar')
+            if not st.session_state["authentication_status"]:
+                # Logged out on this run: drop the charts' subscriptions and go straight to the login form
+                show_page(None)
+                st.experimental_rerun()
             if st.sidebar.button("Reset Password"):
                 st.session_state.reset_password = True
 
             if st.session_state.reset_password:
+                show_page(None)
                 st.title("Reset Password")
                 try:
                     result = authenticator.reset_password(st.session_state["username"])
                     if result:
+                        credential_store.store.update(st.session_state["username"], credentials['usernames'][st.session_state["username"]])
                         st.success('Password modified successfully')
                         st.session_state.reset_password = False
-                        save_configfile()
                         st.experimental_rerun()
                 except Exception as e:
                     st.error(e)
             else:
                 st.title(f"Welcome {name}")
 
-                # Sidebar for page navigation
-                page = st.sidebar.selectbox("Select a Page", ["Stock Dashboard", "Price Chart", "US & European Stock Indices", "Nifty 50 Stock Scanner"])
+                # Sidebar for page navigation; admin pages are only listed for admins
+                is_admin = username in credential_store.store.section('admins', [])
+                pages = [page for page in PAGES if is_admin or page not in ADMIN_PAGES]
+                page = st.sidebar.selectbox("Select a Page", pages)
+                show_page(page)
 
-                if page == "Stock Dashboard":
-                    page1.display_page()
-                elif page == "Price Chart":
-                    page2.display_page()
-                elif page == "US & European Stock Indices":
-                    page3.display_page()
-                elif page == "Nifty 50 Stock Scanner":
-                    page4.display_page()
+                with metrics.span(f"page:{page}"):
+                    load_page(page).display_page()
 
         elif st.session_state["authentication_status"] is False:
+            show_page(None)
             st.error("Username/password is incorrect")
             if st.button("Register"):
                 st.session_state.register = True
                 st.experimental_rerun()
 
         elif st.session_state["authentication_status"] is None:
+            show_page(None)
             st.warning("Please enter your username and password")
             if st.button("Register"):
                 st.session_state.register = True
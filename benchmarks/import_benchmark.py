@@ -0,0 +1,79 @@
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+# Run from the repository root: python benchmarks/import_benchmark.py
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Third-party packages reported on their own, wherever they are first imported
+HEAVY_PACKAGES = ("streamlit", "streamlit_authenticator", "yaml", "pandas", "numpy", "pyarrow", "plotly", "yfinance", "ta")
+
+# What a fresh server process imports before the login form renders
+LOGIN = "import app"
+
+# Pages whose first visit is measured, each in its own process right after the login imports
+PAGES = ("page1", "page2", "page3", "page4", "page5")
+
+_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+# Cumulative import time in seconds of every top-level module imported by each step, run one after another
+# in a fresh interpreter with -X importtime
+def measure(steps):
+    code = "\n".join(f"print('--- {name}', file=__import__('sys').stderr)\n{statement}" for name, statement in steps)
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code], cwd=ROOT, capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        sys.exit(result.stderr)
+    timings = {}
+    current = None
+    for line in result.stderr.splitlines():
+        if line.startswith("--- "):
+            current = timings.setdefault(line[4:], {})
+            continue
+        match = _LINE.match(line)
+        if current is None or not match:
+            continue
+        _, cumulative, indent, module = match.groups()
+        # Only the outermost imports of a step: nested ones are already part of their cumulative time
+        if len(indent) == 1:
+            current[module] = int(cumulative) / 1e6
+        if module in HEAVY_PACKAGES:
+            current[f"[{module}]"] = int(cumulative) / 1e6
+    return timings
+
+
+def _report(name, runs):
+    modules = sorted({module for run in runs for module in run})
+    timings = {module: statistics.median(run.get(module, 0.0) for run in runs) for module in modules}
+    total = sum(seconds for module, seconds in timings.items() if not module.startswith("["))
+    print(f"{name}: {total * 1000:.0f} ms")
+    for module, seconds in sorted(timings.items(), key=lambda item: -item[1]):
+        if seconds >= 0.001:
+            print(f"  {module:<28} {seconds * 1000:>8.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import time of the login screen and of each page's first visit")
+    parser.add_argument("--pages", nargs="+", default=list(PAGES))
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    login_runs = []
+    page_runs = {page: [] for page in args.pages}
+    for _ in range(args.repeat):
+        for page in args.pages:
+            timings = measure([("login", LOGIN), (page, f"import {page}")])
+            login_runs.append(timings.get("login", {}))
+            page_runs[page].append(timings.get(page, {}))
+    _report("login", login_runs)
+    for page, runs in page_runs.items():
+        _report(f"first visit to {page}", runs)
+
+
+if __name__ == "__main__":
+    main()
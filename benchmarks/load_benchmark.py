@@ -0,0 +1,404 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+
+import numpy as np
+import yaml
+
+# Run from the repository root: python benchmarks/load_benchmark.py
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCHMARK_DIR)
+sys.path.insert(0, ROOT)
+sys.path.insert(0, BENCHMARK_DIR)
+
+from streamlit.proto.Alert_pb2 import Alert
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.Common_pb2 import SInt64Array
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+from streamlit.proto.WidgetStates_pb2 import WidgetState
+from tornado.websocket import websocket_connect
+
+# Concurrent users per step; every step runs against the same server, as users arrive at one instance
+USERS = (1, 5, 10, 25)
+
+# Seconds each step runs for, and over which its users log in
+DURATION_SECONDS = 60
+RAMP_SECONDS = 10
+
+# Seconds a user looks at a page between interactions, during which its charts redraw on their own
+THINK_SECONDS = (2, 8)
+
+# A rerun that takes longer than this counts as stalled, and its user gives up
+RERUN_TIMEOUT = 60
+
+PORT = 8599
+
+# Synthetic users written to the server's config.yaml, all with the same password
+USERNAME = "loaduser{:03d}"
+PASSWORD = "load-test-password"
+
+# The pages users move between, as listed in app.py's page selector
+PAGES = ("Stock Dashboard", "Price Chart", "US & European Stock Indices", "Nifty 50 Stock Scanner")
+
+# Interval and period combinations users pick on the Price Chart
+CHART_SETTINGS = (("1m", "1d"), ("5m", "5d"), ("15m", "5d"), ("1h", "1mo"), ("1d", "6mo"))
+
+# How often the server reports its upstream calls to the benchmark
+STATS_FILE = "load-stats.json"
+STATS_SECONDS = 1
+
+
+# Serve app.py from workdir without Yahoo. With synthetic or fixtures data only the calls to Yahoo are
+# answered by page_benchmark's stand-in, so caching, request coalescing and rate limiting run as they do
+# live; simulated data comes from the streaming provider, which pushes a new bar every second.
+def serve(workdir, port, data):
+    os.chdir(workdir)
+    import market_data
+    import page_benchmark
+    import providers
+    from streamlit.web import bootstrap
+
+    calls = {"upstream_calls": 0, "upstream_symbols": 0}
+    lock = threading.Lock()
+
+    def counted(upstream):
+        def call(symbols, **kwargs):
+            with lock:
+                calls["upstream_calls"] += 1
+                calls["upstream_symbols"] += len(symbols)
+            return upstream(symbols, **kwargs)
+        return call
+
+    def report():
+        while True:
+            with lock:
+                text = json.dumps(calls)
+            with open(STATS_FILE + ".tmp", "w") as file:
+                file.write(text)
+            os.replace(STATS_FILE + ".tmp", STATS_FILE)
+            time.sleep(STATS_SECONDS)
+
+    if data == "simulated":
+        provider = providers.SimulatedProvider()
+        provider.history = counted(provider.history)
+        providers.use(provider)
+    else:
+        market_data._call_upstream = counted(page_benchmark.replay_upstream if data == "fixtures" else page_benchmark.synthetic_upstream)
+    threading.Thread(target=report, name="load-stats", daemon=True).start()
+    flags = {
+        "server_port": port,
+        "server_headless": True,
+        "server_fileWatcherType": "none",
+        "browser_gatherUsageStats": False,
+        "global_developmentMode": False,
+    }
+    bootstrap.load_config_options(flags)
+    bootstrap.run(os.path.join(ROOT, "app.py"), False, [], flags)
+
+
+# A working directory for the server: config.yaml with the synthetic users, and the repository's universes
+def _workdir(users):
+    workdir = tempfile.mkdtemp(prefix="load-benchmark-")
+    os.symlink(os.path.join(ROOT, "universes"), os.path.join(workdir, "universes"))
+    shutil.copy(os.path.join(ROOT, "additional_symbols.json"), workdir)
+    from streamlit_authenticator.utilities.hasher import Hasher
+    password = Hasher([PASSWORD]).generate()[0]
+    with open(os.path.join(ROOT, "config.yaml")) as file:
+        config = yaml.safe_load(file)
+    config["admins"] = []
+    config["credentials"] = {"usernames": {
+        USERNAME.format(number): {"email": f"{USERNAME.format(number)}@example.com", "name": USERNAME.format(number), "password": password}
+        for number in range(users)
+    }}
+    with open(os.path.join(workdir, "config.yaml"), "w") as file:
+        yaml.safe_dump(config, file)
+    return workdir
+
+
+def _start_server(workdir, port, data):
+    log = open(os.path.join(workdir, "server.log"), "w")
+    server = subprocess.Popen([sys.executable, __file__, "--serve", workdir, "--port", str(port), "--data", data],
+                              stdout=log, stderr=subprocess.STDOUT)
+    deadline = time.monotonic() + 120
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            break
+        try:
+            with urllib.request.urlopen(f"http://localhost:{port}/_stcore/health", timeout=1) as response:
+                if response.status == 200:
+                    return server
+        except OSError:
+            time.sleep(0.5)
+    server.kill()
+    with open(os.path.join(workdir, "server.log")) as file:
+        sys.exit("The server did not start:\n" + file.read()[-4000:])
+
+
+# Threads and resident memory (MB) of a process
+def _process_stats(pid):
+    stats = {}
+    with open(f"/proc/{pid}/status") as file:
+        for line in file:
+            if line.startswith("Threads:"):
+                stats["threads"] = int(line.split()[1])
+            elif line.startswith("VmRSS:"):
+                stats["rss_mb"] = int(line.split()[1]) / 1024
+    return stats
+
+
+def _upstream_stats(workdir):
+    try:
+        with open(os.path.join(workdir, STATS_FILE)) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {"upstream_calls": 0, "upstream_symbols": 0}
+
+
+# One browser tab, speaking Streamlit's websocket protocol. Like the frontend it keeps the value of every
+# widget on the page and sends them all with each rerun, and reruns each fragment at the interval the
+# server asked for. Widgets are looked up by their label.
+class User:
+    def __init__(self, number, port, rng):
+        self.username = USERNAME.format(number)
+        self.url = f"ws://localhost:{port}/_stcore/stream"
+        self.rng = rng
+        self.widgets = {}
+        self.states = {}
+        self.fragments = {}
+        self.page_script_hash = ""
+        self.latencies = []
+        self.errors = 0
+        self.logged_in = False
+        self.stalled = False
+        self._cache = {}
+        self._socket = None
+
+    async def _read(self):
+        data = await self._socket.read_message()
+        if data is None:
+            raise ConnectionError("the server closed the connection")
+        msg = ForwardMsg()
+        msg.ParseFromString(data)
+        # Large messages the tab was sent before are only referred to by their hash
+        if msg.WhichOneof("type") == "ref_hash":
+            return self._cache[msg.ref_hash]
+        if msg.metadata.cacheable:
+            self._cache[msg.hash] = msg
+        return msg
+
+    # Send the widget values and wait for the script to finish, timing it as kind
+    async def rerun(self, kind, fragment_id=""):
+        back = BackMsg()
+        back.rerun_script.page_script_hash = self.page_script_hash
+        back.rerun_script.fragment_id = fragment_id
+        back.rerun_script.widget_states.widgets.extend(self.states.values())
+        # A button press is only sent once
+        self.states = {widget_id: state for widget_id, state in self.states.items() if not state.HasField("trigger_value")}
+        widgets = {}
+        started = time.perf_counter()
+        await self._socket.write_message(back.SerializeToString(), binary=True)
+        while True:
+            msg = await asyncio.wait_for(self._read(), started + RERUN_TIMEOUT - time.perf_counter())
+            kind_of_msg = msg.WhichOneof("type")
+            if kind_of_msg == "new_session":
+                self.page_script_hash = msg.new_session.page_script_hash
+                if not fragment_id:
+                    self.fragments = {}
+            elif kind_of_msg == "auto_rerun":
+                self.fragments[msg.auto_rerun.fragment_id] = msg.auto_rerun.interval
+            elif kind_of_msg == "delta" and msg.delta.WhichOneof("type") == "new_element":
+                element = msg.delta.new_element
+                element_type = element.WhichOneof("type")
+                # The login form always says the password is wrong before anything was entered; count page errors only
+                if self.logged_in and (element_type == "exception" or (element_type == "alert" and element.alert.format == Alert.ERROR)):
+                    self.errors += 1
+                proto = getattr(element, element_type) if element_type else None
+                if getattr(proto, "id", "") and getattr(proto, "label", ""):
+                    widgets[proto.label] = proto
+            elif kind_of_msg == "script_finished":
+                if msg.script_finished != ForwardMsg.FINISHED_EARLY_FOR_RERUN:
+                    break
+        self.latencies.append((kind, time.perf_counter() - started))
+        if fragment_id:
+            self.widgets.update(widgets)
+        else:
+            self.widgets = widgets
+            ids = {widget.id for widget in widgets.values()}
+            self.states = {widget_id: state for widget_id, state in self.states.items() if widget_id in ids}
+
+    def _set(self, label, **value):
+        widget = self.widgets[label]
+        self.states[widget.id] = WidgetState(id=widget.id, **value)
+
+    def _select(self, label, option=None):
+        options = list(self.widgets[label].options)
+        self._set(label, int_value=options.index(option) if option is not None else self.rng.randrange(len(options)))
+
+    def _select_some(self, label, most):
+        options = self.widgets[label].options
+        chosen = sorted(self.rng.sample(range(len(options)), self.rng.randint(1, min(most, len(options)))))
+        self._set(label, int_array_value=SInt64Array(data=chosen))
+
+    async def login(self):
+        self._socket = await websocket_connect(self.url, max_message_size=256 * 1024 * 1024)
+        await self.rerun("login form")
+        self._set("Username", string_value=self.username)
+        self._set("Password", string_value=PASSWORD)
+        self._set("Login", trigger_value=True)
+        await self.rerun("login")
+        if "Select a Page" not in self.widgets:
+            raise RuntimeError(f"{self.username} could not log in")
+        self.logged_in = True
+
+    async def open(self, page):
+        self._select("Select a Page", page)
+        await self.rerun("navigate")
+
+    # Change one of the page's settings the way a user would
+    async def interact(self, page):
+        if page == "Stock Dashboard":
+            label = self.rng.choice([label for label in ("Select Stocks", "Select Indexes") if label in self.widgets])
+            self._select_some(label, 5)
+        elif page == "Price Chart":
+            if self.rng.random() < 0.5:
+                self._select("Select an Index")
+            else:
+                interval, period = self.rng.choice(CHART_SETTINGS)
+                self._select("Select Data Interval", interval)
+                self._select("Select Period", period)
+        elif page == "US & European Stock Indices":
+            self._select_some(self.rng.choice(["Select US Indices", "Select European Indices"]), 3)
+        else:
+            self._select(self.rng.choice(["Universe", "Indicator Filter"]))
+        await self.rerun("interact")
+
+    # Look at the page for a while, rerunning fragments when they are due as the browser does
+    async def think(self, seconds):
+        now = time.monotonic()
+        until = now + seconds
+        due = {fragment_id: now + interval for fragment_id, interval in self.fragments.items()}
+        while due:
+            fragment_id = min(due, key=due.get)
+            if due[fragment_id] >= until:
+                break
+            await asyncio.sleep(max(due[fragment_id] - time.monotonic(), 0))
+            await self.rerun("fragment", fragment_id)
+            due[fragment_id] = time.monotonic() + self.fragments.get(fragment_id, seconds)
+        await asyncio.sleep(max(until - time.monotonic(), 0))
+
+    async def run(self, deadline, ramp):
+        await asyncio.sleep(self.rng.uniform(0, ramp))
+        try:
+            await self.login()
+            page = None
+            while time.monotonic() < deadline:
+                page = self.rng.choice([other for other in PAGES if other != page])
+                await self.open(page)
+                for _ in range(self.rng.randint(1, 3)):
+                    if time.monotonic() >= deadline:
+                        break
+                    await self.interact(page)
+                    await self.think(min(self.rng.uniform(*THINK_SECONDS), max(deadline - time.monotonic(), 0)))
+        except asyncio.TimeoutError:
+            self.stalled = True
+        finally:
+            if self._socket is not None:
+                self._socket.close()
+
+
+def _percentile(values, q):
+    return float(np.percentile(values, q)) if values else float("nan")
+
+
+# Run users against the server for duration seconds, sampling its threads and memory meanwhile
+async def _step(server, workdir, port, users, duration, seed):
+    deadline = time.monotonic() + duration
+    clients = [User(number, port, random.Random(seed * 1000 + number)) for number in range(users)]
+    before = _upstream_stats(workdir)
+    peak = {"threads": 0, "rss_mb": 0.0}
+
+    async def sample():
+        while True:
+            for name, value in _process_stats(server.pid).items():
+                peak[name] = max(peak[name], value)
+            await asyncio.sleep(0.5)
+
+    sampler = asyncio.ensure_future(sample())
+    results = await asyncio.gather(*(client.run(deadline, min(RAMP_SECONDS, duration / 4)) for client in clients), return_exceptions=True)
+    sampler.cancel()
+    # Let the server see the tabs close and write its upstream counts
+    await asyncio.sleep(STATS_SECONDS * 2)
+    after = _upstream_stats(workdir)
+    by_kind = {}
+    for client in clients:
+        for kind, seconds in client.latencies:
+            by_kind.setdefault(kind, []).append(seconds * 1000)
+    latencies = [milliseconds for samples in by_kind.values() for milliseconds in samples]
+    return {
+        "users": users,
+        "failed": sorted({f"{type(result).__name__}: {result}" for result in results if isinstance(result, Exception)}),
+        "stalled": sum(client.stalled for client in clients),
+        "reruns": len(latencies),
+        "p50_ms": _percentile(latencies, 50),
+        "p95_ms": _percentile(latencies, 95),
+        "p99_ms": _percentile(latencies, 99),
+        "max_ms": max(latencies, default=float("nan")),
+        "errors": sum(client.errors for client in clients),
+        "threads": peak["threads"],
+        "rss_mb": peak["rss_mb"],
+        "upstream_calls": after["upstream_calls"] - before["upstream_calls"],
+        "upstream_symbols": after["upstream_symbols"] - before["upstream_symbols"],
+        "p95_ms_by_kind": {kind: _percentile(samples, 95) for kind, samples in sorted(by_kind.items())},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Log in concurrent synthetic users to app.py and measure rerun latency as their number grows")
+    parser.add_argument("--users", type=int, nargs="+", default=list(USERS))
+    parser.add_argument("--duration", type=float, default=DURATION_SECONDS, help="seconds per step")
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--data", choices=("synthetic", "fixtures", "simulated"), default="synthetic",
+                        help="generated bars, the responses recorded by page_benchmark.py --record, or the streaming simulated provider")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="print the results as JSON lines")
+    parser.add_argument("--serve", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve, args.port, args.data)
+        return
+
+    workdir = _workdir(max(args.users))
+    server = _start_server(workdir, args.port, args.data)
+    try:
+        if not args.json:
+            print(f"{'users':>5} {'reruns':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8} {'errors':>7} "
+                  f"{'stalled':>8} {'failed':>7} {'threads':>8} {'RSS MB':>8} {'upstream':>9}")
+        for step, users in enumerate(args.users):
+            row = asyncio.run(_step(server, workdir, args.port, users, args.duration, args.seed + step))
+            if args.json:
+                print(json.dumps(row))
+                continue
+            print(f"{row['users']:>5} {row['reruns']:>7} {row['p50_ms']:>8.0f} {row['p95_ms']:>8.0f} {row['p99_ms']:>8.0f} "
+                  f"{row['max_ms']:>8.0f} {row['errors']:>7} {row['stalled']:>8} {len(row['failed']):>7} {row['threads']:>8} "
+                  f"{row['rss_mb']:>8.0f} {row['upstream_calls']:>9}")
+            print("      p95 ms by rerun: " + ", ".join(f"{kind} {p95:.0f}" for kind, p95 in row["p95_ms_by_kind"].items()))
+            for failure in row["failed"]:
+                print(f"      failed: {failure}")
+    finally:
+        server.terminate()
+        server.wait()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
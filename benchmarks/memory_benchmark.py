@@ -0,0 +1,115 @@
+import argparse
+import os
+import sys
+import tracemalloc
+
+import pandas as pd
+
+# Run from the repository root: python benchmarks/memory_benchmark.py
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARK_DIR))
+sys.path.insert(0, BENCHMARK_DIR)
+
+import intraday_store
+import ohlcv_store
+import page1
+import page_benchmark
+
+# Concurrent sessions showing the same symbols
+SESSIONS = (1, 10, 100)
+
+# The dashboard's default stocks and indexes
+SYMBOLS = page1.DEFAULT_SYMBOLS + page1.INDEX_SYMBOLS
+
+
+# Intraday series as the store held them before the ring buffers: a float64 DataFrame per symbol, with
+# a cached float64 percentage change per reference price
+class LegacySeries:
+    def __init__(self, bars, period):
+        self.bars = bars[[column for column in ohlcv_store.BAR_COLUMNS if column in bars.columns]]
+        self.period = period
+        self._pct = {}
+
+    def pct_change_from(self, reference, period):
+        if reference not in self._pct:
+            self._pct[reference] = (self.bars["Close"] / reference - 1) * 100
+        pct = self._pct[reference]
+        return pct.iloc[ohlcv_store.window_start(self.bars.index, period):]
+
+
+# The frame a session built on every refresh: a wide DataFrame of its own, its index set to Indian time
+def legacy_refresh(series, references, period):
+    frame = pd.DataFrame({symbol: series[symbol].pct_change_from(reference, period) for symbol, reference in references.items()})
+    frame.index = frame.index.tz_convert("Asia/Kolkata")
+    return frame
+
+
+# The frame a session gets now: the store's shared frame, shallow-converted to Indian time
+def ring_refresh(store, series, references, period):
+    frame = store.pct_frame({symbol: (series[symbol], reference) for symbol, reference in references.items()}, period)
+    return frame.tz_convert("Asia/Kolkata", copy=False)
+
+
+# Bytes still allocated after build() runs, and what it returned
+def _allocated(build):
+    tracemalloc.start()
+    try:
+        result = build()
+        size = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    return size, result
+
+
+# A store's series for bars with one percentage change cached on each, as after a first refresh
+def _load(make, bars, references, period):
+    series = {symbol: make(frame) for symbol, frame in bars.items()}
+    for symbol, reference in references.items():
+        series[symbol].pct_change_from(reference, period)
+    return series
+
+
+# Bytes held by the shared store, and per session by sessions refreshing concurrently
+def measure(bars, period, sessions):
+    references = {symbol: float(frame["Close"].iloc[0]) for symbol, frame in bars.items()}
+    results = {}
+
+    store_bytes, series = _allocated(lambda: _load(lambda frame: LegacySeries(frame, period), bars, references, period))
+    # The legacy frames share their index with the upstream response, which the store kept alive; count it
+    store_bytes += sum(frame.index.nbytes for frame in bars.values())
+    results["legacy"] = [store_bytes]
+    for count in sessions:
+        session_bytes, _ = _allocated(lambda: [legacy_refresh(series, references, period) for _ in range(count)])
+        results["legacy"].append(session_bytes / count)
+
+    store = intraday_store.IntradayStore()
+    store_bytes, series = _allocated(lambda: _load(lambda frame: intraday_store.IntradaySeries(frame, period, "1m"), bars, references, period))
+    results["ring"] = [store_bytes]
+    for count in sessions:
+        session_bytes, _ = _allocated(lambda: [ring_refresh(store, series, references, period) for _ in range(count)])
+        results["ring"].append(session_bytes / count)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Memory of the intraday store and of each session's refresh")
+    parser.add_argument("--sessions", type=int, nargs="+", default=list(SESSIONS))
+    parser.add_argument("--period", default="5d", choices=("1d", "5d"))
+    args = parser.parse_args()
+
+    # Bars as the store receives them: 1m bars of the loaded period, normalized to UTC
+    bars = {}
+    for symbol in SYMBOLS:
+        frame = page_benchmark._synthetic_frame(symbol, "1m").tz_convert("UTC")
+        bars[symbol] = frame.iloc[ohlcv_store.window_start(frame.index, args.period):]
+    rows = sum(len(frame) for frame in bars.values())
+
+    results = measure(bars, args.period, args.sessions)
+    print(f"{len(bars)} symbols, {rows} 1m bars ({args.period})")
+    print(f"{'':>8} {'store KB':>9}" + "".join(f" {f'KB/session @{count}':>16}" for count in args.sessions))
+    for name, (store_bytes, *session_bytes) in results.items():
+        print(f"{name:>8} {store_bytes / 1024:>9.1f}" + "".join(f" {size / 1024:>16.1f}" for size in session_bytes))
+
+
+if __name__ == "__main__":
+    main()
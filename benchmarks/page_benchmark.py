@@ -0,0 +1,261 @@
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+# Run from the repository root: python benchmarks/page_benchmark.py
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCHMARK_DIR)
+sys.path.insert(0, ROOT)
+
+from streamlit.testing.v1 import AppTest
+
+import indicators
+import intraday_store
+import market_data
+import metrics
+import ohlcv_store
+import poller
+import quotes
+import scan_snapshots
+
+PAGES = ("page1", "page2", "page3", "page4")
+
+# Recorded upstream responses: <FIXTURE_DIR>/<interval>/<symbol>.parquet
+FIXTURE_DIR = os.path.join(BENCHMARK_DIR, "fixtures")
+
+# Timings of the last accepted run, written with --update-baseline
+BASELINE_FILE = os.path.join(BENCHMARK_DIR, "baseline.json")
+
+# A phase regresses when it is this much slower than the baseline, and by at least MIN_REGRESSION_SECONDS
+TOLERANCE = 0.25
+MIN_REGRESSION_SECONDS = 0.02
+
+PHASES = ("fetch", "transform", "render", "total")
+
+# Trading hours, in exchange time, used for synthetic fixtures
+SESSIONS = {
+    "^DJI": ("America/New_York", "09:30", "15:59"),
+    "^IXIC": ("America/New_York", "09:30", "15:59"),
+    "^GSPC": ("America/New_York", "09:30", "15:59"),
+    "^GDAXI": ("Europe/Berlin", "09:00", "17:29"),
+    "^FTSE": ("Europe/London", "08:00", "16:29"),
+    "^FCHI": ("Europe/Paris", "09:00", "17:29"),
+}
+NSE_SESSION = ("Asia/Kolkata", "09:15", "15:29")
+
+
+def _fixture_path(symbol, interval):
+    return os.path.join(FIXTURE_DIR, interval, symbol.replace(os.sep, "_") + ".parquet")
+
+
+# Merge an upstream response into the fixture for its symbol and interval
+def _save_fixture(symbol, interval, frame):
+    frame = frame[[column for column in ohlcv_store.BAR_COLUMNS if column in frame.columns]]
+    path = _fixture_path(symbol, interval)
+    if os.path.exists(path):
+        existing = pd.read_parquet(path)
+        frame = pd.concat([existing[~existing.index.isin(frame.index)], frame]).sort_index()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    frame.to_parquet(path)
+
+
+_fixtures = {}
+
+
+# A recorded series moved forward by whole weeks so that it ends within the last week,
+# keeping weekdays and times of day as they were recorded
+def _load_fixture(symbol, interval):
+    key = (symbol, interval)
+    if key not in _fixtures:
+        path = _fixture_path(symbol, interval)
+        frame = pd.read_parquet(path) if os.path.exists(path) else None
+        if frame is not None and not frame.empty:
+            now = pd.Timestamp.now(tz=frame.index.tz)
+            weeks = max((now - frame.index[-1]) // pd.Timedelta(days=7), 0)
+            frame.index = frame.index + pd.Timedelta(days=7 * weeks)
+        _fixtures[key] = frame
+    return _fixtures[key]
+
+
+# Answer a request the way Yahoo would: the bars of the period, or the bars at or after start
+def _slice(frame, period=None, start=None):
+    if start is not None:
+        start = pd.Timestamp(start)
+        if frame.index.tz is not None and start.tz is None:
+            start = start.tz_localize(frame.index.tz)
+        return frame[frame.index >= start]
+    if period is not None:
+        return frame.iloc[ohlcv_store.window_start(frame.index, period):]
+    return frame
+
+
+# Stand-in for market_data._fetch_upstream that serves the recorded fixtures
+def replay_upstream(symbols, interval="1d", period=None, start=None, **kwargs):
+    frames = {}
+    for symbol in symbols:
+        frame = _load_fixture(symbol, interval)
+        if frame is None:
+            continue
+        frame = _slice(frame, period, start)
+        if not frame.empty:
+            frames[symbol] = frame
+    return frames
+
+
+# Deterministic random-walk bars shaped like a yfinance response: the last five sessions of intraday bars
+# in exchange time, or half a year of daily bars stamped at exchange midnight
+def _synthetic_frame(symbol, interval):
+    tz, open_time, close_time = SESSIONS.get(symbol, NSE_SESSION)
+    days = pd.bdate_range(end=pd.Timestamp.now(tz=tz).normalize().tz_localize(None), periods=5 if ohlcv_store.is_intraday(interval) else 130)
+    if ohlcv_store.is_intraday(interval):
+        freq = f"{market_data.INTERVAL_SECONDS[interval] // 60}min"
+        index = pd.DatetimeIndex(np.concatenate([
+            pd.date_range(f"{day:%Y-%m-%d} {open_time}", f"{day:%Y-%m-%d} {close_time}", freq=freq).tz_localize(tz).asi8
+            for day in days
+        ])).tz_localize("UTC").tz_convert(tz)
+    else:
+        index = days.tz_localize(tz)
+    rng = np.random.default_rng(sum(map(ord, symbol + interval)))
+    close = 1000 * np.exp(np.cumsum(rng.normal(0, 0.001 if ohlcv_store.is_intraday(interval) else 0.01, len(index))))
+    return pd.DataFrame({
+        "Open": close, "High": close * 1.001, "Low": close * 0.999, "Close": close,
+        "Volume": rng.integers(1_000, 1_000_000, len(index)).astype("int64"),
+    }, index=index.rename("Datetime" if ohlcv_store.is_intraday(interval) else "Date"))
+
+
+def synthetic_upstream(symbols, interval="1d", period=None, start=None, **kwargs):
+    frames = {}
+    for symbol in symbols:
+        frame = _slice(_synthetic_frame(symbol, interval), period, start)
+        if not frame.empty:
+            frames[symbol] = frame
+    return frames
+
+
+# Wrap an upstream so every response is also written to the fixtures
+def recording(upstream):
+    def fetch(symbols, interval="1d", **kwargs):
+        frames = upstream(symbols, interval=interval, **kwargs)
+        for symbol, frame in frames.items():
+            _save_fixture(symbol, interval, frame)
+        return frames
+    return fetch
+
+
+def _app(page):
+    import importlib
+    importlib.import_module(page).display_page()
+
+
+# Start every run from nothing: empty caches, streaming state, quotes, snapshots and local store
+def _reset():
+    market_data.cache.clear()
+    quotes.service = quotes.QuoteService()
+    intraday_store.store = intraday_store.IntradayStore()
+    indicators.engine = indicators.IndicatorEngine()
+    scan_snapshots.job = scan_snapshots.SnapshotJob()
+    ohlcv_store.STORE_DIR = tempfile.mkdtemp(prefix="page-benchmark-")
+
+
+def _phases(total):
+    spans = metrics.span_totals()
+    fetch = spans.get("fetch", (0, 0.0))[1]
+    transform = spans.get("transform", (0, 0.0))[1] + spans.get("indicators", (0, 0.0))[1]
+    return {"fetch": fetch, "transform": transform, "render": max(total - fetch - transform, 0.0), "total": total}
+
+
+# Render a page from scratch ("cold"), then rerun it as a refresh does ("warm")
+def measure(page):
+    _reset()
+    at = AppTest.from_function(_app, args=(page,), default_timeout=300)
+    timings = {}
+    for run in ("cold", "warm"):
+        metrics.reset()
+        started = time.perf_counter()
+        at.run()
+        timings[run] = _phases(time.perf_counter() - started)
+        if at.exception:
+            raise RuntimeError(f"{page} raised: {at.exception[0].value}")
+        for error in at.error:
+            print(f"{page}: {error.value}", file=sys.stderr)
+    return timings
+
+
+def _median(samples):
+    return {
+        run: {phase: statistics.median(sample[run][phase] for sample in samples) for phase in PHASES}
+        for run in ("cold", "warm")
+    }
+
+
+def _regressions(results, baseline):
+    found = []
+    for page, runs in results.items():
+        for run, phases in runs.items():
+            for phase, seconds in phases.items():
+                before = baseline.get(page, {}).get(run, {}).get(phase)
+                if before is not None and seconds > before * (1 + TOLERANCE) and seconds - before >= MIN_REGRESSION_SECONDS:
+                    found.append(f"{page} {run} {phase}: {before * 1000:.1f} ms -> {seconds * 1000:.1f} ms")
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render every page headlessly against recorded Yahoo responses")
+    parser.add_argument("--pages", nargs="+", default=list(PAGES))
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--record", choices=("yahoo", "synthetic"),
+                        help="render the pages once against Yahoo or generated data and save every response as fixtures")
+    parser.add_argument("--update-baseline", action="store_true")
+    args = parser.parse_args()
+
+    os.chdir(ROOT)
+    # Keep background work out of the measurements
+    poller.subscribe = lambda *args, **kwargs: None
+    scan_snapshots.SnapshotJob._run = lambda self: None
+
+    if args.record:
+        upstream = market_data._fetch_upstream if args.record == "yahoo" else synthetic_upstream
+        market_data._fetch_upstream = recording(upstream)
+        for page in args.pages:
+            measure(page)
+        print(f"Recorded fixtures for {', '.join(args.pages)} in {FIXTURE_DIR}")
+        return
+
+    if not os.path.isdir(FIXTURE_DIR):
+        sys.exit(f"No fixtures in {FIXTURE_DIR}; run with --record yahoo (or --record synthetic when offline) first")
+    market_data._fetch_upstream = replay_upstream
+
+    results = {page: _median([measure(page) for _ in range(args.repeat)]) for page in args.pages}
+
+    print(f"{'page':<7} {'run':<5} " + " ".join(f"{phase + ' ms':>13}" for phase in PHASES))
+    for page, runs in results.items():
+        for run, phases in runs.items():
+            print(f"{page:<7} {run:<5} " + " ".join(f"{phases[phase] * 1000:>13.1f}" for phase in PHASES))
+
+    if args.update_baseline:
+        with open(BASELINE_FILE, "w") as file:
+            json.dump(results, file, indent=2)
+        print(f"Baseline written to {BASELINE_FILE}")
+        return
+    if not os.path.exists(BASELINE_FILE):
+        print("No baseline yet; run with --update-baseline to save these timings")
+        return
+    with open(BASELINE_FILE) as file:
+        regressions = _regressions(results, json.load(file))
+    if regressions:
+        print("Regressions against the baseline:")
+        for regression in regressions:
+            print(f"  {regression}")
+        sys.exit(1)
+    print("No regressions against the baseline")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+# Run from the repository root: python benchmarks/scanner_benchmark.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import market_data
+import ohlcv_store
+import scanner
+
+SIZES = (50, 500, 2000)
+
+# Trading days of synthetic history per symbol, about three months
+HISTORY_DAYS = 63
+
+
+# Deterministic random-walk daily bars for one symbol
+def _bars(symbol, index):
+    rng = np.random.default_rng(sum(map(ord, symbol)))
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.02, len(index))))
+    return pd.DataFrame({
+        "Open": close, "High": close * 1.01, "Low": close * 0.99, "Close": close, "Adj Close": close,
+        "Volume": rng.integers(100_000, 50_000_000, len(index)).astype("float64"),
+    }, index=index)
+
+
+# Stand-in for yf.download(..., group_by='ticker') returning the same MultiIndex frame, so splitting,
+# normalizing and writing through to the store all run exactly as they do against Yahoo
+def fake_download(symbols, start=None, **kwargs):
+    index = pd.bdate_range(end=pd.Timestamp.now().normalize(), periods=HISTORY_DAYS, name="Date")
+    if start is not None:
+        index = index[index >= pd.Timestamp(start).tz_localize(None).normalize()]
+    symbols = [symbols] if isinstance(symbols, str) else list(symbols)
+    return pd.concat({symbol: _bars(symbol, index) for symbol in symbols}, axis=1)
+
+
+class FakeTicker:
+    def __init__(self, symbol):
+        self.symbol = symbol
+
+    def history(self, **kwargs):
+        return fake_download([self.symbol], **kwargs)[self.symbol]
+
+
+def _rss_mb():
+    with open("/proc/self/status") as file:
+        for line in file:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return float("nan")
+
+
+# One measurement in this process: a cold load into an empty store, then a warm load served from the store
+def run_one(size, chunk_size):
+    market_data.yf.download = fake_download
+    market_data.yf.Ticker = FakeTicker
+    ohlcv_store.STORE_DIR = tempfile.mkdtemp(prefix="scanner-benchmark-")
+    symbols = [f"SYN{number:04d}.NS" for number in range(size)]
+    baseline_rss = _rss_mb()
+    timings = {}
+    for run in ("cold", "warm"):
+        market_data.cache.clear()
+        started = time.perf_counter()
+        matrices = scanner.load_matrices(symbols, chunk_size=chunk_size)
+        loaded = time.perf_counter()
+        results = scanner.scan(matrices)
+        finished = time.perf_counter()
+        timings[run] = {"load_s": loaded - started, "scan_s": finished - loaded}
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return {
+        "symbols": size,
+        "rows": len(results),
+        "matrix_mb": (matrices.closes.nbytes + matrices.volumes.nbytes) / 1024 / 1024,
+        "cold_load_s": timings["cold"]["load_s"],
+        "warm_load_s": timings["warm"]["load_s"],
+        "scan_s": timings["warm"]["scan_s"],
+        "baseline_rss_mb": baseline_rss,
+        "peak_rss_mb": peak_rss,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time and peak memory of the stock scanner by universe size")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(SIZES))
+    parser.add_argument("--chunk-size", type=int, default=scanner.CHUNK_SIZE)
+    parser.add_argument("--single", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single is not None:
+        print(json.dumps(run_one(args.single, args.chunk_size)))
+        return
+
+    # Every size runs in a fresh interpreter so peak RSS is not inherited from a larger run
+    print(f"{'symbols':>8} {'loaded':>7} {'matrix MB':>10} {'cold load s':>12} {'warm load s':>12} {'scan s':>8} {'base RSS MB':>12} {'peak RSS MB':>12}")
+    for size in args.sizes:
+        output = subprocess.run(
+            [sys.executable, __file__, "--single", str(size), "--chunk-size", str(args.chunk_size)],
+            check=True, capture_output=True, text=True,
+        ).stdout
+        row = json.loads(output.strip().splitlines()[-1])
+        print(f"{row['symbols']:>8} {row['rows']:>7} {row['matrix_mb']:>10.2f} {row['cold_load_s']:>12.2f} "
+              f"{row['warm_load_s']:>12.2f} {row['scan_s']:>8.3f} {row['baseline_rss_mb']:>12.1f} {row['peak_rss_mb']:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+import copy
+import fcntl
+import json
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+
+import yaml
+
+import metrics
+
+# Users, cookie settings, pre-authorized emails and admins
+CONFIG_FILE = "config.yaml"
+
+# Changes to users since config.yaml was last written, one JSON line per registration or password reset
+JOURNAL_FILE = "credentials.jsonl"
+
+# Held while writing either file, so sessions and worker processes never interleave their writes
+LOCK_FILE = "config.yaml.lock"
+
+# Fold the journal back into config.yaml once it has this many entries
+COMPACT_ENTRIES = 1000
+
+# libyaml's parser and emitter when PyYAML was built with it, several times faster with thousands of users
+LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+DUMPER = getattr(yaml, "CSafeDumper", yaml.SafeDumper)
+
+
+# Credentials loaded once per process and kept in memory with a username index and an email index.
+# Registrations and password resets are appended to the journal under a file lock instead of rewriting
+# config.yaml, and the entries other processes append are picked up on the next read.
+class CredentialStore:
+    def __init__(self, config_file=CONFIG_FILE, journal_file=JOURNAL_FILE, lock_file=LOCK_FILE):
+        self.config_file = config_file
+        self.journal_file = journal_file
+        self.lock_file = lock_file
+        self._lock = threading.RLock()
+        self.config = None
+        self._users = {}
+        self._emails = {}
+        self._journal_id = None
+        self._offset = 0
+        self._entries = 0
+        self.compactions = 0
+
+    @contextmanager
+    def _file_lock(self):
+        with open(self.lock_file, "a") as file:
+            fcntl.flock(file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(file, fcntl.LOCK_UN)
+
+    def _index(self, username, record):
+        old = self._users.get(username)
+        if old is not None and self._emails.get(str(old.get("email", "")).lower()) == username:
+            del self._emails[str(old["email"]).lower()]
+        self._users[username] = record
+        if record.get("email"):
+            self._emails[str(record["email"]).lower()] = username
+
+    def _load(self):
+        with open(self.config_file, "r", encoding="utf-8") as file:
+            self.config = yaml.load(file, Loader=LOADER)
+        self._users = {}
+        self._emails = {}
+        for username, record in (self.config.get("credentials") or {}).get("usernames", {}).items():
+            self._index(username.lower(), record)
+        self._journal_id = None
+        self._offset = 0
+        self._entries = 0
+
+    # Apply the journal entries appended since the last read. A journal that was replaced by a compaction
+    # in another process means config.yaml changed too, so everything is reloaded.
+    def _catch_up(self):
+        try:
+            stat = os.stat(self.journal_file)
+        except FileNotFoundError:
+            if self.config is None or self._journal_id is not None:
+                self._load()
+            return
+        journal_id = (stat.st_dev, stat.st_ino)
+        if self.config is None or (self._journal_id is not None and journal_id != self._journal_id) or stat.st_size < self._offset:
+            self._load()
+        self._journal_id = journal_id
+        if stat.st_size == self._offset:
+            return
+        with open(self.journal_file, "rb") as file:
+            file.seek(self._offset)
+            data = file.read()
+        # A line still being written by another process ends without a newline; it is read next time
+        complete = data[:data.rfind(b"\n") + 1]
+        for line in complete.splitlines():
+            entry = json.loads(line)
+            self._index(entry["username"], entry["record"])
+            self._entries += 1
+        self._offset += len(complete)
+
+    # Credentials for one Authenticate instance. Each user's record is copied, so the login bookkeeping
+    # the authenticator does in one session does not leak into others.
+    def credentials(self):
+        with self._lock:
+            self._catch_up()
+            return {"usernames": {username: dict(record) for username, record in self._users.items()}}
+
+    def section(self, name, default=None):
+        with self._lock:
+            self._catch_up()
+            return copy.deepcopy(self.config.get(name, default))
+
+    def _append(self, username, record):
+        line = json.dumps({"username": username, "record": record}) + "\n"
+        with open(self.journal_file, "a", encoding="utf-8") as file:
+            file.write(line)
+            file.flush()
+            os.fsync(file.fileno())
+        self._catch_up()
+        if self._entries >= COMPACT_ENTRIES:
+            self._compact()
+
+    # Save a new user. Another session or process may have taken the username or email in the meantime,
+    # which only shows once the journal is read under the lock.
+    def register(self, username, record):
+        username = username.lower()
+        with self._lock, self._file_lock():
+            self._catch_up()
+            if username in self._users:
+                raise ValueError("Username already taken")
+            if record.get("email") and str(record["email"]).lower() in self._emails:
+                raise ValueError("Email already taken")
+            self._append(username, dict(record))
+
+    # Save changes to an existing user, e.g. a new password hash
+    def update(self, username, record):
+        username = username.lower()
+        with self._lock, self._file_lock():
+            self._catch_up()
+            if username not in self._users:
+                raise KeyError(f"Unknown user {username}")
+            self._append(username, dict(record))
+
+    # Write all users into config.yaml (to a temporary file first, then renamed over it) and start an empty journal
+    def _compact(self):
+        config = dict(self.config)
+        config["credentials"] = {"usernames": self._users}
+        directory = os.path.dirname(os.path.abspath(self.config_file))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as file:
+            yaml.dump(config, file, Dumper=DUMPER, default_flow_style=False)
+            file.flush()
+            os.fsync(file.fileno())
+        os.chmod(tmp_path, os.stat(self.config_file).st_mode & 0o777)
+        os.replace(tmp_path, self.config_file)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(self.journal_file)), suffix=".tmp")
+        os.close(fd)
+        os.replace(tmp_path, self.journal_file)
+        self.config = config
+        stat = os.stat(self.journal_file)
+        self._journal_id = (stat.st_dev, stat.st_ino)
+        self._offset = 0
+        self._entries = 0
+        self.compactions += 1
+
+    def compact(self):
+        with self._lock, self._file_lock():
+            self._catch_up()
+            self._compact()
+
+    def stats(self):
+        with self._lock:
+            return {"users": len(self._users), "journal_entries": self._entries, "compactions": self.compactions}
+
+
+store = CredentialStore()
+
+
+def _samples():
+    stats = store.stats()
+    return [
+        ("users", "gauge", stats["users"], {}),
+        ("credential_journal_entries", "gauge", stats["journal_entries"], {}),
+        ("credential_compactions_total", "counter", stats["compactions"], {}),
+    ]
+
+
+metrics.register_collector(_samples)
@@ -0,0 +1,46 @@
+import numpy as np
+
+import metrics
+
+# Width of the charts in pixels; a line never needs more points than it has pixel columns
+CHART_WIDTH = 1600
+
+
+# Positions of the points Largest-Triangle-Three-Buckets keeps out of (x, y). The first and last points
+# are always kept; every bucket in between keeps the point that forms the largest triangle with the point
+# kept before it and the average of the next bucket, which preserves peaks, troughs and the overall shape.
+def lttb_indices(x, y, threshold):
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    every = (n - 2) / (threshold - 2)
+    bounds = np.floor(np.arange(threshold - 1) * every).astype(np.int64) + 1
+    bounds[-1] = n - 1
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+    a = 0
+    for bucket in range(threshold - 2):
+        start, end = bounds[bucket], bounds[bucket + 1]
+        next_end = bounds[bucket + 2] if bucket + 2 < len(bounds) else n
+        avg_x = x[end:next_end].mean()
+        avg_y = y[end:next_end].mean()
+        area = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a]))
+        a = start + int(np.argmax(area))
+        selected[bucket + 1] = a
+    return selected
+
+
+# At most threshold points of a time series, chosen with LTTB. Missing values are dropped first.
+# The caller's series is left untouched, so the full resolution stays available for zooming in.
+@metrics.timed("transform")
+def downsample(series, threshold=CHART_WIDTH):
+    series = series.dropna()
+    if len(series) <= threshold:
+        return series
+    index = series.index
+    if hasattr(index, "asi8"):
+        x = (index.asi8 - index.asi8[0]) / 1e9
+    else:
+        x = np.arange(len(series), dtype=np.float64)
+    return series.iloc[lttb_indices(x, series.to_numpy(dtype=np.float64), threshold)]
@@ -0,0 +1,107 @@
+import asyncio
+import functools
+import random
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import metrics
+
+# Upper bound on upstream requests running at once across all sessions
+MAX_WORKERS = 8
+
+# Seconds a single upstream request may take before its result is given up on
+REQUEST_TIMEOUT = 20
+
+# Symbol requests per second Yahoo gets from this process on average, and how many may go out in a burst
+RATE_LIMIT_PER_SECOND = 20
+RATE_LIMIT_BURST = 100
+
+# Retries of a throttled request, and the backoff ceiling for the first retry, doubling per retry up to MAX_BACKOFF_SECONDS
+THROTTLE_RETRIES = 3
+BACKOFF_SECONDS = 2
+MAX_BACKOFF_SECONDS = 60
+
+# Shared pool that runs the blocking yfinance calls off the Streamlit script thread
+executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="fetch")
+
+
+# Merges identical calls that overlap in time: the first caller of a key runs the call, and callers that
+# arrive while it is running wait for it and get the same result (or exception) instead of calling again
+class SingleFlight:
+    def __init__(self):
+        self.calls = 0
+        self.merged = 0
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, func):
+        with self._lock:
+            future = self._in_flight.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._in_flight[key] = future
+                self.calls += 1
+            else:
+                self.merged += 1
+        if not leader:
+            return future.result()
+        try:
+            result = func()
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+
+
+# Token bucket shared by every session: tokens refill at rate per second up to burst, and a caller that
+# takes more than are left sleeps until its share has refilled. pause() holds everyone back, e.g. while
+# backing off after the upstream throttled us.
+class TokenBucket:
+    def __init__(self, rate=RATE_LIMIT_PER_SECOND, burst=RATE_LIMIT_BURST):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    # Take cost tokens, waiting as long as needed; returns the seconds waited
+    def acquire(self, cost=1):
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= cost
+            wait = max(-self._tokens / self.rate, self._paused_until - now, 0.0)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def pause(self, seconds):
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+
+# Exponential backoff with full jitter: a random delay up to BACKOFF_SECONDS * 2**attempt, capped,
+# so sessions that were throttled together do not all retry at the same moment
+def backoff_seconds(attempt):
+    return random.uniform(0, min(MAX_BACKOFF_SECONDS, BACKOFF_SECONDS * 2 ** attempt))
+
+
+# Single rate limiter for every request sent to Yahoo from this process
+rate_limiter = TokenBucket()
+
+
+# Run a blocking call on the shared pool and await it without blocking the event loop.
+# Raises asyncio.TimeoutError if the call takes longer than timeout seconds.
+@metrics.timed("fetch")
+async def run_blocking(func, *args, timeout=REQUEST_TIMEOUT, **kwargs):
+    loop = asyncio.get_running_loop()
+    future = loop.run_in_executor(executor, functools.partial(func, *args, **kwargs))
+    return await asyncio.wait_for(future, timeout)
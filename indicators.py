@@ -0,0 +1,243 @@
+import copy
+import math
+import threading
+from collections import OrderedDict, deque
+
+import pandas as pd
+
+import metrics
+
+# Streaming states kept across all sessions before the least recently used are dropped
+MAX_STATES = 512
+
+NAN = float("nan")
+
+
+# Exponentially weighted mean updated one observation at a time. It follows the same recurrence,
+# in the same floating-point order, as pandas' ewm(adjust=False).mean(), which the ta library uses,
+# so streamed values are bit-identical to a full recomputation.
+class EWM:
+    def __init__(self, com, min_periods):
+        self.alpha = 1. / (1. + com)
+        self.old_wt_factor = 1. - self.alpha
+        self.new_wt = self.alpha
+        self.min_periods = max(int(min_periods), 1)
+        self.weighted = None
+        self.old_wt = 1.
+        self.nobs = 0
+
+    @classmethod
+    def from_span(cls, span, min_periods):
+        return cls((span - 1) / 2, min_periods)
+
+    @classmethod
+    def from_alpha(cls, alpha, min_periods):
+        return cls((1 - alpha) / alpha, min_periods)
+
+    def update(self, value):
+        is_observation = value == value
+        if self.weighted is None:
+            self.weighted = value
+            self.nobs = int(is_observation)
+        else:
+            self.nobs += is_observation
+            if self.weighted == self.weighted:
+                self.old_wt *= self.old_wt_factor
+                if is_observation:
+                    if self.weighted != value:
+                        self.weighted = self.old_wt * self.weighted + self.new_wt * value
+                        self.weighted /= (self.old_wt + self.new_wt)
+                    self.old_wt = 1.
+            elif is_observation:
+                self.weighted = value
+        return self.weighted if self.nobs >= self.min_periods else NAN
+
+
+# Each indicator consumes one bar at a time: update() takes the values of its `inputs` columns
+# and returns a tuple with one value per entry in `columns`.
+
+# Same values as ta.trend.EMAIndicator(close, window).ema_indicator()
+class EMA:
+    inputs = ("Close",)
+
+    def __init__(self, window=14):
+        self.columns = (f"ema_{window}",)
+        self._ema = EWM.from_span(window, window)
+
+    def update(self, close):
+        return (self._ema.update(close),)
+
+
+# Same values as ta.momentum.RSIIndicator(close, window).rsi(), using Wilder smoothing
+class RSI:
+    inputs = ("Close",)
+
+    def __init__(self, window=14):
+        self.columns = ("rsi",)
+        self._up = EWM.from_alpha(1 / window, window)
+        self._down = EWM.from_alpha(1 / window, window)
+        self._prev_close = None
+
+    def update(self, close):
+        diff = NAN if self._prev_close is None else close - self._prev_close
+        self._prev_close = close
+        up = self._up.update(diff if diff > 0 else 0.0)
+        down = self._down.update(-(diff if diff < 0 else 0.0))
+        if down == 0:
+            return (100.0,)
+        return (100 - (100 / (1 + up / down)),)
+
+
+# Same values as ta.trend.MACD(close, window_slow, window_fast, window_sign)
+class MACD:
+    inputs = ("Close",)
+    columns = ("macd", "macd_signal", "macd_diff")
+
+    def __init__(self, window_slow=26, window_fast=12, window_sign=9):
+        self._fast = EWM.from_span(window_fast, window_fast)
+        self._slow = EWM.from_span(window_slow, window_slow)
+        self._signal = EWM.from_span(window_sign, window_sign)
+
+    def update(self, close):
+        macd = self._fast.update(close) - self._slow.update(close)
+        signal = self._signal.update(macd)
+        return (macd, signal, macd - signal)
+
+
+# Bollinger bands over a fixed window, like ta.volatility.BollingerBands. The window is constant,
+# so each bar costs the same however long the series gets; values agree with ta to rounding error.
+class BollingerBands:
+    inputs = ("Close",)
+    columns = ("bb_mavg", "bb_hband", "bb_lband")
+
+    def __init__(self, window=20, window_dev=2):
+        self.window = window
+        self.window_dev = window_dev
+        self._closes = deque(maxlen=window)
+
+    def update(self, close):
+        self._closes.append(close)
+        if len(self._closes) < self.window:
+            return (NAN, NAN, NAN)
+        mavg = math.fsum(self._closes) / self.window
+        mstd = math.sqrt(math.fsum((value - mavg) ** 2 for value in self._closes) / self.window)
+        return (mavg, mavg + self.window_dev * mstd, mavg - self.window_dev * mstd)
+
+
+# Session VWAP: cumulative typical price times volume over cumulative volume, restarting every trading day
+class VWAP:
+    inputs = ("High", "Low", "Close", "Volume", "timestamp")
+    columns = ("vwap",)
+
+    def __init__(self):
+        self._day = None
+        self._price_volume = 0.0
+        self._volume = 0.0
+
+    def update(self, high, low, close, volume, timestamp):
+        day = timestamp.date()
+        if day != self._day:
+            self._day = day
+            self._price_volume = 0.0
+            self._volume = 0.0
+        self._price_volume += (high + low + close) / 3 * volume
+        self._volume += volume
+        return (self._price_volume / self._volume if self._volume else NAN,)
+
+
+INDICATORS = {
+    "ema": EMA,
+    "rsi": RSI,
+    "macd": MACD,
+    "bollinger": BollingerBands,
+    "vwap": VWAP,
+}
+
+
+# Indicator values for one input series, extended bar by bar as the series grows
+class StreamingSeries:
+    def __init__(self, indicator):
+        self.indicator = indicator
+        self.index = []
+        self.values = []
+        self._before_last = None
+
+    def _consume(self, bars, start):
+        inputs = self.indicator.inputs
+        frame = bars.iloc[start:]
+        rows = zip(*[frame.index if name == "timestamp" else frame[name].tolist() for name in inputs])
+        last = len(frame) - 1
+        for position, (timestamp, row) in enumerate(zip(frame.index, rows)):
+            if position == last:
+                self._before_last = copy.deepcopy(self.indicator)
+            self.values.append(self.indicator.update(*row))
+            self.index.append(timestamp)
+
+    # Bring the state up to date with bars. Bars after the last one seen are applied one at a time and
+    # the last bar seen is re-applied from a checkpoint, since it may have been replaced while still forming.
+    # Returns False if bars is not a continuation of what was seen, so the caller can start over.
+    def extend(self, bars):
+        count = len(self.index)
+        if count == 0 or len(bars) < count or bars.index[0] != self.index[0] or bars.index[count - 1] != self.index[-1]:
+            return False
+        self.indicator = self._before_last
+        self.index.pop()
+        self.values.pop()
+        self._consume(bars, count - 1)
+        return True
+
+    def frame(self):
+        return pd.DataFrame(self.values, index=pd.Index(self.index), columns=list(self.indicator.columns))
+
+
+# Process-wide streaming states keyed by (symbol, interval, period) and indicator parameters
+class IndicatorEngine:
+    def __init__(self, max_states=MAX_STATES):
+        self.max_states = max_states
+        self.full_runs = 0
+        self.incremental_runs = 0
+        self._states = OrderedDict()
+        self._lock = threading.Lock()
+
+    # Values of indicator `name` with `params` over bars, as a DataFrame with one column per output.
+    # Only bars not seen on the previous call for the same key are processed.
+    @metrics.timed("indicators")
+    def compute(self, key, bars, name, **params):
+        state_key = (key, name, tuple(sorted(params.items())))
+        with self._lock:
+            state = self._states.get(state_key)
+            if state is not None and state.extend(bars):
+                self.incremental_runs += 1
+            else:
+                state = StreamingSeries(INDICATORS[name](**params))
+                state._consume(bars, 0)
+                self.full_runs += 1
+            self._states[state_key] = state
+            self._states.move_to_end(state_key)
+            while len(self._states) > self.max_states:
+                self._states.popitem(last=False)
+            return state.frame()
+
+    # Single-output convenience wrapper returning a Series
+    def series(self, key, bars, name, **params):
+        frame = self.compute(key, bars, name, **params)
+        return frame[frame.columns[0]]
+
+    def stats(self):
+        with self._lock:
+            return {"states": len(self._states), "full_runs": self.full_runs, "incremental_runs": self.incremental_runs}
+
+
+engine = IndicatorEngine()
+
+
+def _samples():
+    stats = engine.stats()
+    return [
+        ("indicator_states", "gauge", stats["states"], {}),
+        ("indicator_runs_total", "counter", stats["full_runs"], {"kind": "full"}),
+        ("indicator_runs_total", "counter", stats["incremental_runs"], {"kind": "incremental"}),
+    ]
+
+
+metrics.register_collector(_samples)
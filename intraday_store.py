@@ -0,0 +1,314 @@
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+import fetch_engine
+import market_data
+import metrics
+import ohlcv_store
+import resample
+import ring_buffer
+
+# Intervals the store keeps incrementally; daily and longer bars go through the market_data cache
+INTRADAY_INTERVALS = ("1m", "2m", "5m", "15m", "30m", "60m", "90m", "1h")
+
+# Periods the pages request, shortest first
+PERIODS = ("1d", "5d", "1mo", "3mo", "6mo", "1y")
+
+# Percentage-change series kept per entry, one per reference price in use
+MAX_REFERENCES = 4
+
+# The series longer intraday intervals are derived from while the period is within resample.BASE_PERIODS
+BASE_INTERVAL = "1m"
+
+# Room a series' ring buffer leaves for new bars, an hour of them; the buffer moves its window to fresh
+# arrays about once an hour, copying at most a few thousand rows
+HEADROOM_SECONDS = 3600
+
+# Wide percentage-change frames kept for the symbol selections sessions show
+MAX_PCT_FRAMES = 64
+
+# Row of the closes in a ring buffer's price arrays
+CLOSE_ROW = ring_buffer.PRICE_COLUMNS.index("Close")
+
+
+# Percentage change of a series' closes against one reference price, in float32 like the prices. The values sit
+# at the same slots as the ring buffer's bars, so after an append only the slots it wrote are derived again;
+# slots before valid are up to date. A ring buffer that moves its bars to new arrays starts a new one.
+class PctChange:
+    def __init__(self, prices, reference):
+        self.prices = prices
+        self.reference = ring_buffer.PRICE_DTYPE(reference)
+        self.values = np.full(prices.shape[1], np.nan, dtype=ring_buffer.PRICE_DTYPE)
+        self.valid = None
+        self.bars = None
+        self.series = None
+
+    # Derive the slots from valid up to end, or all of [start, end) the first time
+    def extend(self, start, end):
+        first = start if self.valid is None else max(self.valid, start)
+        if first < end:
+            values = self.values[first:end]
+            np.divide(self.prices[CLOSE_ROW, first:end], self.reference, out=values)
+            values -= 1
+            values *= 100
+        self.valid = end
+
+
+# Bars for one symbol at one interval, extended in place as new bars arrive. The bars live in a ring buffer
+# shared by every session; bars is a DataFrame of read-only views of it, rebuilt once per append, so no
+# session holds a copy of the prices. Any DataFrame or Series taken from a series must be treated as read-only.
+class IntradaySeries:
+    def __init__(self, bars, period, interval):
+        self.period = period
+        self.interval = interval
+        self.expires_at = market_data.expiry_for_interval(interval)
+        self.version = 0
+        self._ring = ring_buffer.BarRingBuffer.from_frame(bars, HEADROOM_SECONDS // market_data.INTERVAL_SECONDS[interval])
+        self.bars = self._ring.frame()
+        # The price arrays and slots bars was cut from
+        self._slots = (self._ring.prices, self._ring.start, self._ring.end)
+        self._pct = {}
+        self._window_starts = {}
+        # Sessions read the caches without the store lock; this one keeps them consistent with bars
+        self._cache_lock = threading.Lock()
+
+    @property
+    def last_timestamp(self):
+        return self.bars.index[-1] if len(self.bars) else None
+
+    @property
+    def nbytes(self):
+        return self._ring.nbytes
+
+    # Merge bars fetched since last_timestamp. The bar at last_timestamp is replaced because it was
+    # still forming when it was fetched.
+    def append(self, new_bars):
+        self.expires_at = market_data.expiry_for_interval(self.interval)
+        if new_bars is None or new_bars.empty:
+            return 0
+        if self.last_timestamp is not None:
+            new_bars = new_bars[new_bars.index >= self.last_timestamp]
+        if new_bars.empty:
+            return 0
+        count = self._ring.append(new_bars)
+        written = self._ring.end - count
+        index = self._trim(self._ring.index())
+        # Readers pick up the new frame in one assignment; frames handed out earlier stay valid
+        bars = self._ring.frame(index)
+        with self._cache_lock:
+            self.bars = bars
+            self._slots = (self._ring.prices, self._ring.start, self._ring.end)
+            for reference, pct in list(self._pct.items()):
+                if pct.prices is not self._ring.prices:
+                    del self._pct[reference]
+                elif pct.valid is not None:
+                    pct.valid = min(pct.valid, written)
+            self._window_starts = {}
+            self.version += 1
+        return count
+
+    # Drop bars that have fallen out of the loaded period
+    def _trim(self, index):
+        start = ohlcv_store.window_start(index, self.period)
+        if start:
+            self._ring.drop(start)
+            index = index[start:]
+        return index
+
+    # Position of the first bar of period in bars, cached while bars is the current frame
+    def _start(self, period, bars=None):
+        with self._cache_lock:
+            if bars is None:
+                bars = self.bars
+            start = self._window_starts.get(period) if self.bars is bars else None
+        if start is None:
+            start = ohlcv_store.window_start(bars.index, period)
+            with self._cache_lock:
+                if self.bars is bars:
+                    self._window_starts[period] = start
+        return start
+
+    def bars_for(self, period):
+        bars = self.bars
+        return bars.iloc[self._start(period, bars):]
+
+    # Percentage change of every close against reference. Each append only derives the bars it added, and the
+    # bar it replaced; a reference not seen before, or bars moved to new arrays, derive every bar once.
+    def pct_change_from(self, reference, period=None):
+        with self._cache_lock:
+            bars = self.bars
+            prices, start, end = self._slots
+            pct = self._pct.get(reference)
+            if pct is None:
+                if len(self._pct) >= MAX_REFERENCES:
+                    self._pct.pop(next(iter(self._pct)), None)
+                pct = self._pct[reference] = PctChange(prices, reference)
+            if pct.bars is not bars:
+                pct.extend(start, end)
+                pct.series = pd.Series(pct.values[start:end], index=bars.index, name="Close", copy=False)
+                pct.bars = bars
+            series = pct.series
+        return series if period is None else series.iloc[self._start(period, bars):]
+
+
+# Process-wide store of intraday series keyed by (symbol, interval)
+class IntradayStore:
+    def __init__(self):
+        self._series = {}
+        self._bases = {}
+        self._pct_frames = {}
+        self._lock = threading.Lock()
+        self._loads = fetch_engine.SingleFlight()
+        self.full_loads = 0
+        self.incremental_loads = 0
+        self.pushes = 0
+        self.derived = 0
+
+    # Bring the requested symbols up to date and return their series.
+    # New symbols, and symbols loaded for a shorter period, get one full batched download;
+    # everything else fetches only the bars since its last timestamp once per bar interval.
+    # With refresh_stale=False only the full loads happen, leaving refreshes to the background poller.
+    # Longer intervals over periods Yahoo keeps 1m bars for are derived from the 1m series instead, so
+    # switching a chart between 1m, 5m, 15m, 30m and 1h never downloads the same minutes again.
+    # The lock is only held to decide what to download and to install the bars; the downloads run without it,
+    # so other sessions and streaming pushes are not held up by Yahoo. Sessions asking for the same download
+    # at the same time share one.
+    def update(self, symbols, interval, period, refresh_stale=True):
+        if interval in resample.DERIVED_INTERVALS and period in resample.BASE_PERIODS:
+            bases = self.update(symbols, BASE_INTERVAL, period, refresh_stale)
+            with self._lock:
+                return {symbol: self._derive(symbol, interval, bases[symbol]) for symbol in symbols if symbol in bases}
+        with self._lock:
+            now = time.time()
+            full = []
+            incremental = []
+            for symbol in symbols:
+                series = self._series.get((symbol, interval))
+                if series is None or series.last_timestamp is None or PERIODS.index(series.period) < PERIODS.index(period):
+                    full.append(symbol)
+                elif refresh_stale and series.expires_at <= now:
+                    incremental.append(symbol)
+            start = min(self._series[(symbol, interval)].last_timestamp for symbol in incremental) if incremental else None
+
+        loaded = {}
+        if full:
+            loaded = self._loads.do(("full", tuple(full), interval, period), lambda: self._load_full(full, interval, period))
+        new_bars = {}
+        if incremental:
+            new_bars = self._loads.do(("since", tuple(incremental), interval, start), lambda: self._load_since(incremental, interval, start))
+
+        with self._lock:
+            for symbol, bars in loaded.items():
+                if bars.empty:
+                    continue
+                series = self._series.get((symbol, interval))
+                # Another update may have loaded the symbol for a period at least as long meanwhile
+                if series is None or series.last_timestamp is None or PERIODS.index(series.period) < PERIODS.index(period):
+                    self._series[(symbol, interval)] = IntradaySeries(bars, period, interval)
+            now = time.time()
+            for symbol in incremental:
+                series = self._series[(symbol, interval)]
+                # Skip series that a shared download, a full load or a push already brought up to date
+                if series.expires_at <= now:
+                    series.append(new_bars.get(symbol))
+            return {symbol: self._series[(symbol, interval)] for symbol in symbols if (symbol, interval) in self._series}
+
+    def _load_full(self, symbols, interval, period):
+        with self._lock:
+            self.full_loads += 1
+        return market_data.get_history_many(symbols, interval=interval, period=period)
+
+    def _load_since(self, symbols, interval, start):
+        with self._lock:
+            self.incremental_loads += 1
+        return market_data.get_history_since(symbols, interval=interval, start=start)
+
+    # Bring the series of interval derived from a symbol's 1m series up to date. Only the 1m bars from the
+    # start of the last derived bar on are aggregated again; a base series that was reloaded is derived anew.
+    def _derive(self, symbol, interval, base):
+        key = (symbol, interval)
+        series = self._series.get(key)
+        if series is None or series.last_timestamp is None or self._bases.get(key) is not base:
+            series = IntradaySeries(resample.resample(base.bars, interval, symbol), base.period, interval)
+            self._series[key] = series
+            self._bases[key] = base
+            self.derived += 1
+        elif series.last_timestamp is not None and base.last_timestamp is not None and base.last_timestamp >= series.last_timestamp:
+            tail = base.bars.iloc[base.bars.index.searchsorted(series.last_timestamp):]
+            series.append(resample.resample(tail, interval, symbol))
+        return series
+
+    # Merge bars a streaming provider pushed for one symbol. Only series a page has loaded are kept up to date;
+    # pushes for anything else are dropped, as the next full load fetches those bars anyway.
+    def push(self, symbol, interval, bars):
+        with self._lock:
+            series = self._series.get((symbol, interval))
+            if series is None:
+                return 0
+            self.pushes += 1
+            return series.append(bars)
+
+    # Percentage changes of several series against their references as one wide frame, where references maps
+    # each symbol to (series, reference price). Sessions showing the same symbols get the same frame until one
+    # of the series is appended to, so it is built once per update rather than once per session and refresh.
+    def pct_frame(self, references, period):
+        key = (tuple(references), period)
+        stamp = tuple((series, series.version, reference) for series, reference in references.values())
+        cached = self._pct_frames.get(key)
+        if cached is not None and cached[0] == stamp:
+            return cached[1]
+        frame = pd.DataFrame({symbol: series.pct_change_from(reference, period) for symbol, (series, reference) in references.items()})
+        with self._lock:
+            if key not in self._pct_frames and len(self._pct_frames) >= MAX_PCT_FRAMES:
+                self._pct_frames.pop(next(iter(self._pct_frames)))
+            self._pct_frames[key] = (stamp, frame)
+        return frame
+
+    def stats(self):
+        with self._lock:
+            return {
+                "series": len(self._series),
+                "bars": sum(len(series.bars) for series in self._series.values()),
+                "bytes": sum(series.nbytes for series in self._series.values()),
+                "pct_frames": len(self._pct_frames),
+                "full_loads": self.full_loads,
+                "incremental_loads": self.incremental_loads,
+                "pushes": self.pushes,
+                "derived": self.derived,
+            }
+
+
+store = IntradayStore()
+
+
+def _samples():
+    stats = store.stats()
+    return [
+        ("intraday_series", "gauge", stats["series"], {}),
+        ("intraday_bars", "gauge", stats["bars"], {}),
+        ("intraday_bytes", "gauge", stats["bytes"], {}),
+        ("intraday_pct_frames", "gauge", stats["pct_frames"], {}),
+        ("intraday_loads_total", "counter", stats["full_loads"], {"kind": "full"}),
+        ("intraday_loads_total", "counter", stats["incremental_loads"], {"kind": "incremental"}),
+        ("intraday_pushes_total", "counter", stats["pushes"], {}),
+        ("intraday_loads_total", "counter", stats["derived"], {"kind": "derived"}),
+    ]
+
+
+metrics.register_collector(_samples)
+
+
+# Percentage change of today's 1-minute closes against each symbol's previous close, as one wide frame.
+# Symbols Yahoo returned nothing for are left out. The frame is shared with other sessions showing the
+# same symbols, so it must be treated as read-only.
+def change_vs_prev_close(symbols, interval="1m", period="1d", refresh_stale=True):
+    prev_closes = market_data.get_previous_closes(symbols)
+    series = store.update(symbols, interval, period, refresh_stale=refresh_stale)
+    return store.pct_frame({
+        symbol: (series[symbol], prev_closes[symbol])
+        for symbol in symbols
+        if symbol in series and symbol in prev_closes.index
+    }, period)
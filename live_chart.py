@@ -0,0 +1,127 @@
+import json
+import os
+import shutil
+
+import numpy as np
+import plotly
+import plotly.graph_objects as go
+import streamlit as st
+import streamlit.components.v1 as components
+
+import metrics
+
+# Charts with more points than this across all traces, or more traces than this, are drawn with WebGL
+GL_POINT_THRESHOLD = 5000
+GL_TRACE_THRESHOLD = 20
+
+# Frontend sources in the repository, and the directory they are served from together with plotly.js
+SOURCE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "live_chart")
+BUILD_DIR = os.path.abspath(os.path.join("data", "components", "live_chart"))
+
+
+# Streamlit only serves files from inside a component's directory, so put the page next to a copy of
+# the plotly.js bundle that ships with the plotly package
+def _build():
+    os.makedirs(BUILD_DIR, exist_ok=True)
+    sources = [
+        os.path.join(SOURCE_DIR, "index.html"),
+        os.path.join(os.path.dirname(plotly.__file__), "package_data", "plotly.min.js"),
+    ]
+    for source in sources:
+        target = os.path.join(BUILD_DIR, os.path.basename(source))
+        if not os.path.exists(target) or os.path.getmtime(target) < os.path.getmtime(source):
+            shutil.copyfile(source, target)
+    return BUILD_DIR
+
+
+_component = components.declare_component("live_chart", path=_build())
+
+metrics.describe("chart_updates_total", "Chart draws by what was sent to the browser")
+metrics.describe("chart_points_sent_total", "Chart points sent to browsers")
+
+
+def _to_json(value):
+    return json.loads(json.dumps(value, cls=plotly.utils.PlotlyJSONEncoder))
+
+
+# Number of leading points that are the same in what was sent last time and what is drawn now
+def _common_prefix(old_x, old_y, x, y):
+    n = min(len(old_x), len(x))
+    same = (old_x[:n] == x[:n]) & ((old_y[:n] == y[:n]) | (np.isnan(old_y[:n]) & np.isnan(y[:n])))
+    mismatch = np.flatnonzero(~same)
+    return int(mismatch[0]) if len(mismatch) else n
+
+
+def _points(x_labels, y, start):
+    return [str(label) for label in x_labels[start:]], [None if np.isnan(value) else float(value) for value in y[start:]]
+
+
+# Draw time series as lines in a chart that stays in the browser between refreshes. traces is a list of
+# (name, series) pairs and layout takes the same arguments as go.Layout. The first draw sends the whole
+# figure; after that only the points that differ from the last draw are sent (normally the re-fetched
+# forming bar and the new bars), and the browser appends them to the traces it already holds.
+@metrics.timed("chart")
+def line_chart(key, traces, layout):
+    component_key = f"live_chart_{key}"
+    state_key = f"_live_chart_state_{key}"
+    state = st.session_state.get(state_key)
+
+    names = [name for name, _ in traces]
+    x_values = [series.index.asi8 if hasattr(series.index, "asi8") else np.arange(len(series)) for _, series in traces]
+    x_labels = [
+        (series.index.tz_localize(None) if getattr(series.index, "tz", None) is not None else series.index).astype(str).to_numpy()
+        for _, series in traces
+    ]
+    y_values = [series.to_numpy(dtype=np.float64) for _, series in traces]
+    points = sum(len(y) for y in y_values)
+    trace_type = "scattergl" if points > GL_POINT_THRESHOLD or len(traces) > GL_TRACE_THRESHOLD else "scatter"
+    # The frame is as wide as the page column, so Plotly sizes the chart to it instead of a fixed width
+    layout = {name: value for name, value in layout.items() if name != "width"}
+    layout = _to_json(go.Layout(uirevision=key, **layout).to_plotly_json())
+
+    # The browser bumps the component's value when it cannot apply a delta, e.g. after the frame was reloaded
+    resyncs = st.session_state.get(component_key) or 0
+
+    if state is None or state["names"] != names or state["type"] != trace_type or state["resyncs"] != resyncs:
+        revision = state["revision"] + 1 if state is not None else 1
+        full_traces = []
+        for name, labels, y in zip(names, x_labels, y_values):
+            x_points, y_points = _points(labels, y, 0)
+            full_traces.append({"type": trace_type, "mode": "lines", "name": name, "x": x_points, "y": y_points})
+        update = {"revision": revision, "base": None, "traces": full_traces, "layout": layout}
+        metrics.increment("chart_updates_total", kind="full")
+        metrics.increment("chart_points_sent_total", sum(len(y) for y in y_values))
+    else:
+        deltas = []
+        changed = layout != state["layout"]
+        for old_x, old_y, x, labels, y in zip(state["x"], state["y"], x_values, x_labels, y_values):
+            keep = _common_prefix(old_x, old_y, x, y)
+            x_points, y_points = _points(labels, y, keep)
+            changed = changed or keep != len(old_x) or len(x_points) > 0
+            deltas.append({"keep": keep, "x": x_points, "y": y_points})
+        if changed:
+            update = {
+                "revision": state["revision"] + 1,
+                "base": state["revision"],
+                "traces": deltas,
+                "layout": layout if layout != state["layout"] else None,
+            }
+            metrics.increment("chart_updates_total", kind="delta")
+            metrics.increment("chart_points_sent_total", sum(len(delta["y"]) for delta in deltas))
+        else:
+            # Nothing moved: send the same arguments again so the browser has nothing to do
+            update = state["update"]
+            metrics.increment("chart_updates_total", kind="unchanged")
+    update["height"] = layout.get("height", 450)
+
+    st.session_state[state_key] = {
+        "revision": update["revision"],
+        "names": names,
+        "type": trace_type,
+        "resyncs": resyncs,
+        "layout": layout,
+        "x": x_values,
+        "y": y_values,
+        "update": update,
+    }
+    _component(update=update, key=component_key, default=0)
@@ -0,0 +1,145 @@
+import time
+from datetime import datetime, timedelta
+from datetime import time as clock
+from zoneinfo import ZoneInfo
+
+# Regular trading session of every exchange the pages show, in exchange time, Monday to Friday.
+# Exchange holidays are not listed, so they are polled like a normal day.
+EXCHANGES = {
+    "NSE": ("Asia/Kolkata", clock(9, 15), clock(15, 30)),
+    "BSE": ("Asia/Kolkata", clock(9, 15), clock(15, 30)),
+    "NYSE": ("America/New_York", clock(9, 30), clock(16, 0)),
+    "XETRA": ("Europe/Berlin", clock(9, 0), clock(17, 30)),
+    "LSE": ("Europe/London", clock(8, 0), clock(16, 30)),
+    "EURONEXT": ("Europe/Paris", clock(9, 0), clock(17, 30)),
+}
+
+# Exchange of the index symbols the pages show
+INDEX_EXCHANGES = {
+    "^NSEI": "NSE",
+    "^NSEBANK": "NSE",
+    "^BSESN": "BSE",
+    "^DJI": "NYSE",
+    "^IXIC": "NYSE",
+    "^GSPC": "NYSE",
+    "^GDAXI": "XETRA",
+    "^FTSE": "LSE",
+    "^FCHI": "EURONEXT",
+}
+
+# Exchange of other symbols by their Yahoo suffix; symbols without one are US listings
+SUFFIX_EXCHANGES = {
+    ".NS": "NSE",
+    ".BO": "BSE",
+    ".DE": "XETRA",
+    ".L": "LSE",
+    ".PA": "EURONEXT",
+}
+
+# Days searched for the previous close or the next open; covers any weekend
+SEARCH_DAYS = 7
+
+# The final fetch of a session runs this long after the close, once the last bar has been published
+SETTLEMENT_SECONDS = 60
+
+# The calendar normally runs on Unix time. A replay (see replay.py) runs it on a virtual clock instead:
+# clock_origin is (virtual time, Unix time) when the clock was set, and clock_speed is how many virtual
+# seconds pass per real second.
+clock_origin = None
+clock_speed = 1
+
+
+def set_clock(start, speed=1):
+    global clock_origin, clock_speed
+    clock_origin = (start, time.time())
+    clock_speed = speed
+
+
+# Calendar time at Unix time timestamp
+def to_clock(timestamp):
+    if clock_origin is None:
+        return timestamp
+    start, real_start = clock_origin
+    return start + (timestamp - real_start) * clock_speed
+
+
+# Unix time at which the calendar reaches t
+def from_clock(t):
+    if clock_origin is None:
+        return t
+    start, real_start = clock_origin
+    return real_start + (t - start) / clock_speed
+
+
+def current_time():
+    return to_clock(time.time())
+
+
+# Exchange a symbol trades on, or None when it is not known (such symbols are treated as always open)
+def exchange_for(symbol):
+    if symbol in INDEX_EXCHANGES:
+        return INDEX_EXCHANGES[symbol]
+    if symbol.startswith("^CNX"):
+        return "NSE"
+    if symbol.startswith("^"):
+        return None
+    if "." not in symbol:
+        return "NYSE"
+    return SUFFIX_EXCHANGES.get(symbol[symbol.rindex("."):])
+
+
+def _sessions(exchange, now, days):
+    tz_name, open_time, close_time = EXCHANGES[exchange]
+    tz = ZoneInfo(tz_name)
+    today = datetime.fromtimestamp(now, tz).date()
+    for offset in days:
+        day = today + timedelta(days=offset)
+        if day.weekday() < 5:
+            yield (datetime.combine(day, open_time, tzinfo=tz).timestamp(),
+                   datetime.combine(day, close_time, tzinfo=tz).timestamp())
+
+
+def is_open(exchange, now=None):
+    now = current_time() if now is None else now
+    return any(start <= now < end for start, end in _sessions(exchange, now, [0]))
+
+
+# Unix time of the exchange's most recent close at or before now
+def last_close(exchange, now=None):
+    now = current_time() if now is None else now
+    for _, end in _sessions(exchange, now, range(0, -SEARCH_DAYS - 1, -1)):
+        if end <= now:
+            return end
+    return None
+
+
+# Unix time of the exchange's next open after now
+def next_open(exchange, now=None):
+    now = current_time() if now is None else now
+    for start, _ in _sessions(exchange, now, range(0, SEARCH_DAYS + 1)):
+        if start > now:
+            return start
+    return None
+
+
+def any_open(symbols, now=None):
+    now = current_time() if now is None else now
+    for exchange in {exchange_for(symbol) for symbol in symbols}:
+        if exchange is None or is_open(exchange, now):
+            return True
+    return False
+
+
+# Unix time a symbol last fetched at fetched_at (None if never) should be fetched next: right away while
+# its exchange is open, once more SETTLEMENT_SECONDS after the close, and after that not before the next open
+def next_fetch(symbol, fetched_at, now=None):
+    now = current_time() if now is None else now
+    exchange = exchange_for(symbol)
+    if exchange is None or is_open(exchange, now):
+        return now
+    close = last_close(exchange, now)
+    if close is not None and (fetched_at is None or fetched_at < close + SETTLEMENT_SECONDS):
+        return close + SETTLEMENT_SECONDS
+    if fetched_at is None:
+        return now
+    return next_open(exchange, now)
@@ -0,0 +1,362 @@
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+import pandas as pd
+import requests
+import yfinance as yf
+
+import fetch_engine
+import market_calendar
+import metrics
+import ohlcv_store
+
+# Bar length in seconds for every interval yfinance accepts
+INTERVAL_SECONDS = {
+    "1m": 60,
+    "2m": 120,
+    "5m": 300,
+    "15m": 900,
+    "30m": 1800,
+    "60m": 3600,
+    "90m": 5400,
+    "1h": 3600,
+    "1d": 86400,
+    "5d": 432000,
+    "1wk": 604800,
+    "1mo": 2592000,
+    "3mo": 7776000,
+}
+
+# Daily and longer bars keep changing while the session is open, so never hold them longer than this
+MAX_TTL_SECONDS = 300
+
+# Give Yahoo a moment to publish a bar after its boundary before the entry expires
+SETTLE_SECONDS = 2
+
+# Ticker.history and yf.download disagree on whether closes are adjusted for splits and dividends by
+# default; both get this, so a series is adjusted however many symbols it was fetched with
+AUTO_ADJUST = True
+
+# Upper bound on the memory held by cached frames across all sessions
+MAX_CACHE_BYTES = 256 * 1024 * 1024
+
+# yf.download collects per-call results in module-global state, so two downloads must never overlap.
+# Each download still fetches its symbols in parallel on its own bounded set of threads.
+_download_lock = threading.Lock()
+
+# Text of the errors Yahoo and yfinance give when requests are being throttled
+THROTTLE_MARKERS = ("429", "too many requests", "rate limit")
+
+
+# Time-to-live for an interval: one bar for intraday data, capped for daily and longer bars
+def ttl_for_interval(interval):
+    return min(INTERVAL_SECONDS.get(interval, MAX_TTL_SECONDS), MAX_TTL_SECONDS)
+
+
+# Expire entries on the next bar boundary so every session sees a new bar at the same moment.
+# Boundaries fall on the market calendar's clock, which runs faster than real time during a replay.
+def expiry_for_interval(interval, now=None):
+    now = market_calendar.current_time() if now is None else now
+    ttl = ttl_for_interval(interval)
+    return market_calendar.from_clock((now // ttl + 1) * ttl) + SETTLE_SECONDS / market_calendar.clock_speed
+
+
+# Approximate size of a cached value in bytes
+def _size_of(value):
+    try:
+        return int(value.memory_usage(index=True, deep=True).sum())
+    except (AttributeError, TypeError):
+        return sys.getsizeof(value)
+
+
+# Process-wide LRU cache shared by every Streamlit session
+class MarketDataCache:
+    def __init__(self, max_bytes=MAX_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, nbytes, value = entry
+            if time.time() >= expires_at:
+                del self._entries[key]
+                self.current_bytes -= nbytes
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value, expires_at):
+        nbytes = _size_of(value)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.current_bytes -= old[1]
+            # A single frame larger than the whole budget is served but never stored
+            if nbytes > self.max_bytes:
+                return
+            self._entries[key] = (expires_at, nbytes, value)
+            self.current_bytes += nbytes
+            while self.current_bytes > self.max_bytes:
+                _, (_, evicted_bytes, _) = self._entries.popitem(last=False)
+                self.current_bytes -= evicted_bytes
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+            }
+
+
+# Single cache instance; modules are imported once per server process so all sessions share it
+cache = MarketDataCache()
+
+
+# yfinance 0.2 turns a throttled response into an empty frame and a log line, so count the HTTP 429s
+# on the session every yfinance request goes through
+_throttled_responses = [0]
+_throttled_lock = threading.Lock()
+
+
+def _count_throttled(response, *args, **kwargs):
+    if response.status_code == 429:
+        with _throttled_lock:
+            _throttled_responses[0] += 1
+
+
+_session = requests.Session()
+_session.hooks["response"].append(_count_throttled)
+
+# Identical upstream requests running at the same time, e.g. several sessions opening the same chart
+_single_flight = fetch_engine.SingleFlight()
+
+
+def _is_throttle_error(error):
+    return any(marker in str(error).lower() for marker in THROTTLE_MARKERS)
+
+
+# Fetch bars from Yahoo. Identical requests already in flight are joined rather than repeated, every
+# request waits for its share of the rate limit, and throttled symbols are retried with jittered
+# exponential backoff during which all upstream requests pause.
+@metrics.timed("upstream")
+def _fetch_upstream(symbols, **kwargs):
+    key = (tuple(symbols), tuple(sorted(kwargs.items())))
+    return _single_flight.do(key, lambda: _request_upstream(list(symbols), **kwargs))
+
+
+def _request_upstream(symbols, **kwargs):
+    interval = kwargs.get("interval", "1d")
+    frames = {}
+    pending = symbols
+    for attempt in range(fetch_engine.THROTTLE_RETRIES + 1):
+        waited = fetch_engine.rate_limiter.acquire(len(pending))
+        if waited:
+            metrics.increment("upstream_rate_limit_waits_total", interval=interval)
+            metrics.increment("upstream_rate_limit_wait_seconds_total", waited, interval=interval)
+        metrics.increment("upstream_requests_total", interval=interval)
+        metrics.increment("upstream_symbols_total", len(pending), interval=interval)
+        # Other requests running at the same time can add to the count too; throttling affects all of them alike
+        throttled_before = _throttled_responses[0]
+        error = None
+        try:
+            frames.update(_call_upstream(pending, **kwargs))
+        except Exception as e:
+            error = e
+        pending = [symbol for symbol in pending if symbol not in frames]
+        throttled = _throttled_responses[0] > throttled_before or (error is not None and _is_throttle_error(error))
+        if not throttled or not pending:
+            break
+        metrics.increment("upstream_throttled_total", interval=interval)
+        if attempt < fetch_engine.THROTTLE_RETRIES:
+            metrics.increment("upstream_retries_total", interval=interval)
+            fetch_engine.rate_limiter.pause(fetch_engine.backoff_seconds(attempt))
+    if error is not None and not frames:
+        metrics.increment("upstream_errors_total", interval=interval)
+        raise error
+    metrics.increment("upstream_empty_symbols_total", len(pending), interval=interval)
+    return frames
+
+
+# One Ticker.history call for a single symbol, one batched download otherwise
+def _call_upstream(symbols, **kwargs):
+    if len(symbols) == 1:
+        hist = yf.Ticker(symbols[0], session=_session).history(timeout=fetch_engine.REQUEST_TIMEOUT, auto_adjust=AUTO_ADJUST, **kwargs)
+        return {symbols[0]: hist} if not hist.empty else {}
+    return _download(symbols, **kwargs)
+
+
+# One batched yf.download split into a frame per symbol
+def _download(symbols, **kwargs):
+    with _download_lock:
+        data = yf.download(
+            symbols,
+            group_by='ticker',
+            threads=min(len(symbols), fetch_engine.MAX_WORKERS),
+            timeout=fetch_engine.REQUEST_TIMEOUT,
+            progress=False,
+            session=_session,
+            auto_adjust=AUTO_ADJUST,
+            **kwargs,
+        )
+    return _split_download(data, symbols)
+
+
+# Split a yf.download(..., group_by='ticker') result into one frame per symbol. Symbols the download has
+# no bars for come back as all-NaN columns and are left out, as if Yahoo had not returned them.
+def _split_download(data, symbols):
+    frames = {}
+    if data is None or data.empty:
+        return frames
+    if not isinstance(data.columns, pd.MultiIndex):
+        # Single-symbol downloads come back with flat columns
+        data = {symbols[0]: data}
+        available = {symbols[0]}
+    else:
+        available = set(data.columns.get_level_values(0))
+    for symbol in symbols:
+        if symbol in available:
+            hist = data[symbol].dropna(how='all')
+            if not hist.empty:
+                frames[symbol] = hist
+    return frames
+
+
+# Fetch bars for a period, serving what the local store already holds and requesting only the
+# missing tail upstream. Everything fetched is written through to the store. Symbols without any bars
+# are left out, so they are neither cached nor stored empty and the next request asks Yahoo again.
+def _fetch(symbols, interval, period):
+    frames = {}
+    stored = {}
+    full = []
+    for symbol in symbols:
+        local = ohlcv_store.read_period(symbol, interval, period)
+        if local is None:
+            full.append(symbol)
+        else:
+            stored[symbol] = local
+
+    if full:
+        for symbol, hist in _fetch_upstream(full, interval=interval, period=period).items():
+            hist = ohlcv_store.normalize(hist, interval)
+            if hist.empty:
+                continue
+            ohlcv_store.write(symbol, interval, hist, covers_from=hist.index[0])
+            frames[symbol] = hist
+
+    if stored:
+        start = min(local.index[-1] for local in stored.values())
+        tails = _fetch_upstream(list(stored), interval=interval, start=start)
+        for symbol, local in stored.items():
+            tail = tails.get(symbol)
+            if tail is not None and not tail.empty:
+                tail = ohlcv_store.normalize(tail, interval)
+                ohlcv_store.write(symbol, interval, tail)
+                local = pd.concat([local.iloc[:local.index.searchsorted(tail.index[0])], tail])
+            frames[symbol] = local.iloc[ohlcv_store.window_start(local.index, period):]
+    return frames
+
+
+# Fetch bar history for a symbol through the shared cache.
+# Returned frames are shared between sessions and must be treated as read-only.
+def get_history(symbol, interval="1d", period="1mo"):
+    key = (symbol, interval, period)
+    hist = cache.get(key)
+    if hist is None:
+        hist = _fetch([symbol], interval, period).get(symbol)
+        if hist is None:
+            # Not cached, so the next request asks Yahoo again
+            return pd.DataFrame(columns=ohlcv_store.BAR_COLUMNS)
+        cache.put(key, hist, expiry_for_interval(interval))
+    return hist
+
+
+# Fetch bar history for several symbols, fetching only the ones missing from the cache in one request
+def get_history_many(symbols, interval="1d", period="1mo"):
+    frames = {}
+    missing = []
+    for symbol in symbols:
+        hist = cache.get((symbol, interval, period))
+        if hist is None:
+            missing.append(symbol)
+        else:
+            frames[symbol] = hist
+    if missing:
+        expires_at = expiry_for_interval(interval)
+        for symbol, hist in _fetch(missing, interval, period).items():
+            cache.put((symbol, interval, period), hist, expires_at)
+            frames[symbol] = hist
+    return frames
+
+
+# Fetch only the bars at or after start for several symbols in one request, bypassing the cache.
+# The new bars are written through to the local store.
+def get_history_since(symbols, interval, start):
+    frames = {}
+    for symbol, hist in _fetch_upstream(symbols, interval=interval, start=start).items():
+        hist = ohlcv_store.normalize(hist, interval)
+        if hist.empty:
+            continue
+        ohlcv_store.write(symbol, interval, hist)
+        frames[symbol] = hist
+    return frames
+
+
+# Previous session's close for several symbols, from the cached 5-day daily series
+def get_previous_closes(symbols):
+    # Daily bars only move once a day, so after the first refresh this is served from the cache
+    daily = get_history_many(symbols, interval="1d", period="5d")
+    return pd.Series(
+        {symbol: daily[symbol]['Close'].iloc[-2] for symbol in symbols if symbol in daily and len(daily[symbol]) > 1},
+        dtype='float64',
+    )
+
+
+def _samples():
+    stats = cache.stats()
+    return [
+        ("cache_hits_total", "counter", stats["hits"], {}),
+        ("cache_misses_total", "counter", stats["misses"], {}),
+        ("cache_evictions_total", "counter", stats["evictions"], {}),
+        ("cache_entries", "gauge", stats["entries"], {}),
+        ("cache_bytes", "gauge", stats["bytes"], {}),
+        ("upstream_calls_total", "counter", _single_flight.calls, {}),
+        ("upstream_calls_merged_total", "counter", _single_flight.merged, {}),
+    ]
+
+
+metrics.describe("upstream_requests_total", "Requests sent to Yahoo Finance")
+metrics.describe("upstream_symbols_total", "Symbols requested from Yahoo Finance")
+metrics.describe("upstream_errors_total", "Requests to Yahoo Finance that raised")
+metrics.describe("upstream_throttled_total", "Requests Yahoo Finance throttled")
+metrics.describe("upstream_retries_total", "Throttled requests retried after a backoff")
+metrics.describe("upstream_rate_limit_waits_total", "Requests held back by the rate limiter")
+metrics.describe("upstream_rate_limit_wait_seconds_total", "Seconds requests were held back by the rate limiter")
+metrics.describe("upstream_calls_total", "Distinct upstream fetches run")
+metrics.describe("upstream_calls_merged_total", "Upstream fetches saved by joining an identical one already in flight")
+metrics.describe("upstream_empty_symbols_total", "Requested symbols Yahoo Finance returned no bars for")
+metrics.register_collector(_samples)
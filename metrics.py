@@ -0,0 +1,203 @@
+import functools
+import inspect
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+import warnings
+from collections import defaultdict
+from contextlib import contextmanager
+
+# Prefix of every exported metric name
+PREFIX = "dashboard"
+
+# Prometheus textfile-collector export, rewritten every EXPORT_SECONDS once start_export() has been called
+EXPORT_FILE = os.path.join("data", "metrics.prom")
+EXPORT_SECONDS = 15
+
+_logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+
+# Per span name: [number of spans, seconds spent in them excluding nested spans, seconds including them]
+_spans = defaultdict(lambda: [0, 0.0, 0.0])
+
+# Per (counter name, sorted label pairs): running total
+_counters = defaultdict(float)
+
+# Help text per counter name
+_descriptions = {}
+
+# Functions returning the current (name, type, value, labels) samples of the modules that keep their own stats
+_collectors = []
+
+# Open spans on each thread, innermost last, each as [name, start, seconds spent in nested spans]
+_local = threading.local()
+
+_export_thread = None
+
+
+# Time a block under name. Time spent in spans nested inside it is booked to those spans only,
+# so the self times of different names add up to the wall time covered and never double count.
+@contextmanager
+def span(name):
+    stack = _local.__dict__.setdefault("stack", [])
+    frame = [name, time.perf_counter(), 0.0]
+    stack.append(frame)
+    try:
+        yield
+    finally:
+        stack.pop()
+        elapsed = time.perf_counter() - frame[1]
+        if stack:
+            stack[-1][2] += elapsed
+        with _lock:
+            totals = _spans[name]
+            totals[0] += 1
+            totals[1] += elapsed - frame[2]
+            totals[2] += elapsed
+
+
+# Decorator form of span for plain and async functions
+def timed(name):
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+# Count, self seconds and total seconds per span name since the last reset
+def span_totals():
+    with _lock:
+        return {name: tuple(totals) for name, totals in _spans.items()}
+
+
+def describe(name, help_text):
+    _descriptions[name] = help_text
+
+
+def increment(name, amount=1, **labels):
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        _counters[key] += amount
+
+
+# Register a function that reports a module's own stats as (name, type, value, labels) samples at export time
+def register_collector(func):
+    _collectors.append(func)
+
+
+def reset():
+    with _lock:
+        _spans.clear()
+        _counters.clear()
+
+
+# Show each distinct warning once in the server log and count every occurrence by category,
+# instead of silencing them
+def capture_warnings():
+    if getattr(warnings.showwarning, "_counted", False):
+        return
+    logging.captureWarnings(True)
+    original = warnings.showwarning
+
+    def showwarning(message, category, filename, lineno, file=None, line=None):
+        increment("warnings_total", category=category.__name__)
+        original(message, category, filename, lineno, file, line)
+
+    showwarning._counted = True
+    warnings.showwarning = showwarning
+    warnings.simplefilter("default")
+    describe("warnings_total", "Warnings raised, by category")
+
+
+# Every sample as (name, type, value, labels), spans first, then counters, then collected stats
+def samples():
+    with _lock:
+        spans = {name: tuple(totals) for name, totals in _spans.items()}
+        counters = dict(_counters)
+    result = []
+    for name, (count, self_seconds, total_seconds) in sorted(spans.items()):
+        result.append(("spans_total", "counter", count, {"span": name}))
+        result.append(("span_seconds_total", "counter", total_seconds, {"span": name}))
+        result.append(("span_self_seconds_total", "counter", self_seconds, {"span": name}))
+    for (name, labels), value in sorted(counters.items()):
+        result.append((name, "counter", value, dict(labels)))
+    for collector in _collectors:
+        try:
+            result.extend(collector())
+        except Exception:
+            _logger.exception("metrics collector %s failed", collector)
+    return result
+
+
+SPAN_HELP = {
+    "spans_total": "Number of times each instrumented block ran",
+    "span_seconds_total": "Seconds spent in each instrumented block, including nested blocks",
+    "span_self_seconds_total": "Seconds spent in each instrumented block, excluding nested blocks",
+}
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _metric_name(name):
+    return f"{PREFIX}_" + re.sub(r"[^a-zA-Z0-9_]", "_", name)
+
+
+# All samples in the Prometheus text exposition format, with the samples of each metric grouped under its HELP and TYPE lines
+def prometheus_text():
+    groups = {}
+    for name, kind, value, labels in samples():
+        groups.setdefault(name, (kind, []))[1].append((value, labels))
+    lines = []
+    for name, (kind, group) in groups.items():
+        metric = _metric_name(name)
+        help_text = SPAN_HELP.get(name) or _descriptions.get(name) or name.replace("_", " ")
+        lines.append(f"# HELP {metric} {help_text}")
+        lines.append(f"# TYPE {metric} {kind}")
+        for value, labels in group:
+            label_text = ",".join(f'{key}="{_escape(label)}"' for key, label in labels.items())
+            lines.append(f"{metric}{{{label_text}}} {float(value)!r}" if label_text else f"{metric} {float(value)!r}")
+    return "\n".join(lines) + "\n"
+
+
+def write_export(path=EXPORT_FILE):
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    with os.fdopen(fd, "w") as file:
+        file.write(prometheus_text())
+    os.replace(tmp_path, path)
+
+
+# Keep EXPORT_FILE up to date from a background thread, for node_exporter's textfile collector
+def start_export(path=EXPORT_FILE, interval=EXPORT_SECONDS):
+    global _export_thread
+    with _lock:
+        if _export_thread is not None and _export_thread.is_alive():
+            return
+
+        def run():
+            while True:
+                try:
+                    write_export(path)
+                except Exception:
+                    _logger.exception("writing %s failed", path)
+                time.sleep(interval)
+
+        _export_thread = threading.Thread(target=run, name="metrics-export", daemon=True)
+        _export_thread.start()
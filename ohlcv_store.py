@@ -0,0 +1,178 @@
+import json
+import os
+import tempfile
+import threading
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+import market_calendar
+
+# Root of the on-disk store: <STORE_DIR>/<symbol>/<interval>/<partition>.parquet
+STORE_DIR = os.path.join("data", "ohlcv")
+
+BAR_COLUMNS = ["Open", "High", "Low", "Close", "Volume"]
+
+# Calendar length of the periods that are not counted in trading days
+PERIOD_OFFSETS = {
+    "1mo": pd.DateOffset(months=1),
+    "3mo": pd.DateOffset(months=3),
+    "6mo": pd.DateOffset(months=6),
+    "1y": pd.DateOffset(years=1),
+}
+
+# Slack for weekends and holidays at the start of a calendar period
+COVERAGE_GRACE = pd.Timedelta(days=5)
+
+# How far back Yahoo serves intraday bars; a stored series older than this cannot be topped up
+TAIL_LIMITS = {
+    "1m": pd.Timedelta(days=7),
+    "1h": pd.Timedelta(days=730),
+    "60m": pd.Timedelta(days=730),
+}
+DEFAULT_INTRADAY_TAIL_LIMIT = pd.Timedelta(days=60)
+
+_lock = threading.Lock()
+
+
+def is_intraday(interval):
+    return interval.endswith(("m", "h"))
+
+
+# One file per day for minute bars, per month for hourly-ish bars and per year for daily and longer bars,
+# so that any period the pages offer is a handful of files
+def _partition_format(interval):
+    if interval in ("1m", "2m", "5m"):
+        return "%Y-%m-%d"
+    if is_intraday(interval):
+        return "%Y-%m"
+    return "%Y"
+
+
+def _series_dir(symbol, interval, directory=None):
+    return os.path.join(directory or STORE_DIR, symbol.replace(os.sep, "_"), interval)
+
+
+# Position of the first bar inside a period window ending at the latest bar
+def window_start(index, period):
+    if len(index) == 0:
+        return 0
+    if period in PERIOD_OFFSETS:
+        return index.searchsorted(index[-1] - PERIOD_OFFSETS[period])
+    days = int(period[:-1])
+    dates = index.normalize().unique()
+    if len(dates) <= days:
+        return 0
+    return index.searchsorted(dates[-days])
+
+
+# Bring a frame from any yfinance call into the store's shape: OHLCV columns only, intraday bars in UTC
+# and daily or longer bars on naive exchange dates, so frames from different sources line up
+def normalize(frame, interval):
+    frame = frame[[column for column in BAR_COLUMNS if column in frame.columns]]
+    if is_intraday(interval):
+        frame = frame.tz_convert("UTC") if frame.index.tz is not None else frame.tz_localize("UTC")
+    elif frame.index.tz is not None:
+        frame = frame.tz_localize(None)
+    return frame.rename_axis("timestamp")
+
+
+def _read_file(path, columns=None):
+    if columns is not None:
+        columns = ["timestamp"] + [column for column in columns if column != "timestamp"]
+    return pq.read_table(path, columns=columns, memory_map=True).to_pandas().set_index("timestamp")
+
+
+def _write_file(path, frame):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    table = pa.Table.from_pandas(frame.reset_index(), preserve_index=False)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    os.close(fd)
+    try:
+        pq.write_table(table, tmp_path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+def _coverage_path(symbol, interval):
+    return os.path.join(_series_dir(symbol, interval), "coverage.json")
+
+
+# Earliest timestamp from which the store holds every bar, or None if nothing has been fully loaded yet
+def coverage_start(symbol, interval):
+    try:
+        with open(_coverage_path(symbol, interval), 'r') as file:
+            return pd.Timestamp(json.load(file)["start"])
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+# Merge normalized bars into their partitions; rows already on disk for the same timestamp are replaced.
+# Pass covers_from when the bars are a complete upstream download starting at that timestamp.
+def write(symbol, interval, frame, covers_from=None):
+    if frame is None or frame.empty:
+        return
+    fmt = _partition_format(interval)
+    directory = _series_dir(symbol, interval)
+    with _lock:
+        for partition, rows in frame.groupby(frame.index.strftime(fmt)):
+            path = os.path.join(directory, f"{partition}.parquet")
+            if os.path.exists(path):
+                existing = _read_file(path)
+                rows = pd.concat([existing[~existing.index.isin(rows.index)], rows]).sort_index()
+            _write_file(path, rows)
+        if covers_from is not None:
+            known = coverage_start(symbol, interval)
+            if known is None or covers_from < known:
+                os.makedirs(directory, exist_ok=True)
+                with open(_coverage_path(symbol, interval), 'w') as file:
+                    json.dump({"start": pd.Timestamp(covers_from).isoformat()}, file)
+
+
+# Read bars at or after start from the partitions that can hold them, using memory-mapped,
+# column-pruned Parquet reads. directory reads another tree with the store's layout, e.g. a recording.
+def read(symbol, interval, start=None, columns=None, directory=None):
+    directory = _series_dir(symbol, interval, directory)
+    try:
+        names = sorted(name for name in os.listdir(directory) if name.endswith(".parquet"))
+    except FileNotFoundError:
+        return None
+    if start is not None:
+        first = pd.Timestamp(start).strftime(_partition_format(interval))
+        names = [name for name in names if name[:-len(".parquet")] >= first]
+    if not names:
+        return None
+    frame = pd.concat([_read_file(os.path.join(directory, name), columns) for name in names])
+    if start is not None:
+        frame = frame.iloc[frame.index.searchsorted(start):]
+    return frame
+
+
+# Bars for the period ending now if the store already holds the whole window, otherwise None.
+# The newest bars may still be missing; callers fetch the tail after the last stored bar.
+def read_period(symbol, interval, period, columns=BAR_COLUMNS):
+    covered_from = coverage_start(symbol, interval)
+    if covered_from is None:
+        return None
+    now = pd.Timestamp(market_calendar.current_time(), unit="s", tz="UTC")
+    if covered_from.tz is None:
+        now = now.tz_localize(None)
+    if period in PERIOD_OFFSETS:
+        start = now - PERIOD_OFFSETS[period]
+        if covered_from > start + COVERAGE_GRACE:
+            return None
+        frame = read(symbol, interval, start, columns)
+    else:
+        # Trading-day periods: read a generous calendar span and check it holds enough sessions
+        days = int(period[:-1])
+        frame = read(symbol, interval, max(covered_from, now - pd.Timedelta(days=2 * days + 7)), columns)
+        if frame is not None and len(frame.index.normalize().unique()) < days:
+            return None
+    if frame is None or frame.empty:
+        return None
+    if is_intraday(interval) and now - frame.index[-1] > TAIL_LIMITS.get(interval, DEFAULT_INTRADAY_TAIL_LIMIT):
+        return None
+    return frame
@@ -1,40 +1,13 @@
-import yfinance as yf
-import pandas as pd
-import plotly.graph_objects as go
 import streamlit as st
-import json
-import os
 import asyncio
-import warnings
-warnings.filterwarnings("ignore")
-
-# File to store additional symbols
-SYMBOLS_FILE = 'additional_symbols.json'
-
-# Load additional symbols from the file
-def load_additional_symbols():
-    if os.path.exists(SYMBOLS_FILE):
-        with open(SYMBOLS_FILE, 'r') as file:
-            return json.load(file)
-    return {"stocks": [], "indexes": []}
-
-# Save additional symbols to the file
-def save_additional_symbols(symbols):
-    with open(SYMBOLS_FILE, 'w') as file:
-        json.dump(symbols, file)
-
-def fetch_latest_price_and_change(symbol):
-    try:
-        stock = yf.Ticker(symbol)
-        hist = stock.history(period="5d")
-        current_price = hist['Close'][-2]
-        previous_close = hist['Close'][-3]
-        price_change = current_price - previous_close
-        price_change_percentage = (price_change / previous_close) * 100
-    except Exception as e:
-        st.error(f"Error fetching data for {symbol}: {e}")
-        return None
-    return current_price, price_change, price_change_percentage
+import downsample
+import fetch_engine
+import intraday_store
+import live_chart
+import metrics
+import poller
+import quotes
+import watchlists
 
 def display_price_with_arrow(label, price, change, change_percentage):
     direction = "up" if change > 0 else "down"
@@ -52,36 +25,28 @@ def display_price_with_arrow(label, price, change, change_percentage):
         unsafe_allow_html=True
     )
 
+# List of default symbols
+DEFAULT_SYMBOLS = [
+    "RELIANCE.NS",
+    "TCS.NS",
+    "HDFCBANK.NS",
+    "BHARTIARTL.NS",
+    "ICICIBANK.NS",
+    "SBIN.NS",
+    "INFY.NS",
+]
+
+# List of index symbols
+INDEX_SYMBOLS = [
+    "^NSEI",
+    "^NSEBANK",
+    "^BSESN"
+]
+
 def display_page():
-    # List of default symbols
-    default_symbols = [
-        "RELIANCE.NS",
-        "TCS.NS",
-        "HDFCBANK.NS",
-        "BHARTIARTL.NS",
-        "ICICIBANK.NS",
-        "SBIN.NS",
-        "INFY.NS",
-    ]
-
-    # List of index symbols
-    index_symbols = [
-        "^NSEI",
-        "^NSEBANK",
-        "^BSESN"
-    ]
-
-    # Initialize session state for additional symbols
-    if 'additional_symbols' not in st.session_state:
-        st.session_state['additional_symbols'] = load_additional_symbols()
-    else:
-        # Ensure that additional_symbols is a dictionary with 'stocks' and 'indexes'
-        if not isinstance(st.session_state['additional_symbols'], dict):
-            st.session_state['additional_symbols'] = {"stocks": [], "indexes": []}
-        if 'stocks' not in st.session_state['additional_symbols']:
-            st.session_state['additional_symbols']['stocks'] = []
-        if 'indexes' not in st.session_state['additional_symbols']:
-            st.session_state['additional_symbols']['indexes'] = []
+
+    # Additional symbols come from the logged-in user's own watchlist
+    username = st.session_state.get('username') or watchlists.GUEST
 
     # Sidebar for stock selection and adding more stocks
     st.sidebar.header("Stock Selection")
@@ -94,23 +59,20 @@ def display_page():
     if st.sidebar.button("Add Stock"):
         if new_symbol:
             if add_to_group == "Stocks":
-                if new_symbol not in st.session_state['additional_symbols']["stocks"] and new_symbol not in default_symbols:
-                    st.session_state['additional_symbols']["stocks"].append(new_symbol)
-                    save_additional_symbols(st.session_state['additional_symbols'])
+                if new_symbol not in DEFAULT_SYMBOLS and watchlists.store.add(username, "stocks", new_symbol):
                     new_symbol = ""  # Clear input field
                 else:
                     st.sidebar.error(f"The stock symbol '{new_symbol}' is already in the list.")
             else:
-                if new_symbol not in st.session_state['additional_symbols']["indexes"] and new_symbol not in index_symbols:
-                    st.session_state['additional_symbols']["indexes"].append(new_symbol)
-                    save_additional_symbols(st.session_state['additional_symbols'])
+                if new_symbol not in INDEX_SYMBOLS and watchlists.store.add(username, "indexes", new_symbol):
                     new_symbol = ""  # Clear input field
                 else:
                     st.sidebar.error(f"The index symbol '{new_symbol}' is already in the list.")
 
     # Combine default symbols with additional symbols
-    all_stock_symbols = default_symbols + st.session_state['additional_symbols']["stocks"]
-    all_index_symbols = index_symbols + st.session_state['additional_symbols']["indexes"]
+    watchlist = watchlists.store.get(username)
+    all_stock_symbols = DEFAULT_SYMBOLS + watchlist["stocks"]
+    all_index_symbols = INDEX_SYMBOLS + watchlist["indexes"]
 
     # Initialize session state for visibility toggle
     if 'show_stocks' not in st.session_state:
@@ -136,15 +98,11 @@ def display_page():
 
     # Function to remove a stock
     def remove_stock(symbol, group):
-        if group == "Stocks" and symbol in st.session_state['additional_symbols']["stocks"]:
-            st.session_state['additional_symbols']["stocks"].remove(symbol)
-        elif group == "Indexes" and symbol in st.session_state['additional_symbols']["indexes"]:
-            st.session_state['additional_symbols']["indexes"].remove(symbol)
-        save_additional_symbols(st.session_state['additional_symbols'])
+        watchlists.store.remove(username, "stocks" if group == "Stocks" else "indexes", symbol)
 
     # Multi-select for stocks
     if st.session_state['show_stocks']:
-        selected_stocks = st.sidebar.multiselect('Select Stocks', options=all_stock_symbols, default=default_symbols[:3])
+        selected_stocks = st.sidebar.multiselect('Select Stocks', options=all_stock_symbols, default=DEFAULT_SYMBOLS[:3])
     else:
         selected_stocks = []
 
@@ -154,13 +112,13 @@ def display_page():
 
     # Dropdown and button to remove a selected stock
     if st.session_state['show_remove_stock_dropdown']:
-        stock_to_remove = st.sidebar.selectbox("Select Stock to Remove", options=st.session_state['additional_symbols']["stocks"], key="remove_stock")
+        stock_to_remove = st.sidebar.selectbox("Select Stock to Remove", options=watchlist["stocks"], key="remove_stock")
         if st.sidebar.button("Confirm Remove Stock"):
             remove_stock(stock_to_remove, "Stocks")
 
     # Multi-select for indexes
     if st.session_state['show_indexes']:
-        selected_indexes = st.sidebar.multiselect('Select Indexes', options=all_index_symbols, default=index_symbols[:1])
+        selected_indexes = st.sidebar.multiselect('Select Indexes', options=all_index_symbols, default=INDEX_SYMBOLS[:1])
     else:
         selected_indexes = []
 
@@ -170,99 +128,90 @@ def display_page():
 
     # Dropdown and button to remove a selected index
     if st.session_state['show_remove_index_dropdown']:
-        index_to_remove = st.sidebar.selectbox("Select Index to Remove", options=st.session_state['additional_symbols']["indexes"], key="remove_index")
+        index_to_remove = st.sidebar.selectbox("Select Index to Remove", options=watchlist["indexes"], key="remove_index")
         if st.sidebar.button("Confirm Remove Index"):
             remove_stock(index_to_remove, "Indexes")
 
-    # Function to fetch 1-minute data for the selected stocks and indexes
+    # Function to fetch the 1-minute percentage change against the previous close for the selected stocks and indexes.
+    # Symbols seen for the first time are loaded here; after that the background poller appends new bars.
     async def fetch_data(selected_symbols):
-        data = {}
+        try:
+            df_percentage = await fetch_engine.run_blocking(intraday_store.change_vs_prev_close, selected_symbols, refresh_stale=False)
+        except asyncio.TimeoutError:
+            st.error(f"Timed out fetching data for {', '.join(selected_symbols)}")
+            return None
+        except Exception as e:
+            st.error(f"Error fetching data for {', '.join(selected_symbols)}: {e}")
+            return None
         for symbol in selected_symbols:
-            try:
-                stock = yf.Ticker(symbol)
-                hist = stock.history(interval="1m", period="1d")
-                prev_close = stock.history(period="5d")['Close'][-2]
-                data[symbol] = hist['Close']
-                data[symbol + '_prev_close'] = prev_close
-            except Exception as e:
-                st.error(f"Error fetching data for {symbol}: {e}")
-        return data
+            if symbol not in df_percentage.columns:
+                st.error(f"Error fetching data for {symbol}: no data returned")
+        return df_percentage
 
     # Main content
     st.title('Stock & FNO Dashboard')
 
-    # Display the current prices and percentage changes for Nifty, Bank Nifty, and Sensex
-    nifty_price, nifty_change, nifty_change_pct = fetch_latest_price_and_change("^NSEI")
-    banknifty_price, banknifty_change, banknifty_change_pct = fetch_latest_price_and_change("^NSEBANK")
-    sensex_price, sensex_change, sensex_change_pct = fetch_latest_price_and_change("^BSESN")
+    # Display the current prices and percentage changes for Nifty, Bank Nifty, and Sensex.
+    # Quotes are shared by all sessions and refreshed in the background, so reruns do not wait on Yahoo.
+    header_indices = [("Nifty 50", "^NSEI"), ("Bank Nifty", "^NSEBANK"), ("Sensex", "^BSESN")]
+    header_quotes, header_errors = quotes.service.latest([symbol for _, symbol in header_indices])
+    for symbol, error in header_errors.items():
+        st.error(f"Error fetching data for {symbol}: {error}")
 
-    col1, col2, col3 = st.columns(3)
-    with col1:
-        display_price_with_arrow("Nifty 50", nifty_price, nifty_change, nifty_change_pct)
-    with col2:
-        display_price_with_arrow("Bank Nifty", banknifty_price, banknifty_change, banknifty_change_pct)
-    with col3:
-        display_price_with_arrow("Sensex", sensex_price, sensex_change, sensex_change_pct)
+    for column, (label, symbol) in zip(st.columns(len(header_indices)), header_indices):
+        with column:
+            if symbol in header_quotes:
+                quote = header_quotes[symbol]
+                display_price_with_arrow(label, quote.price, quote.change, quote.change_percentage)
 
     st.divider()
 
-    # Placeholder for the charts
-    stock_chart_placeholder = st.empty()
-    index_chart_placeholder = st.empty()
-
-    # Function to update the data periodically
-    async def update_data():
-        while True:
-            selected_symbols = selected_stocks + selected_indexes
-            if selected_symbols:
-                data = await fetch_data(selected_symbols)
-                if data:
-                    df = pd.DataFrame(data)
-                    prev_closes = {symbol: data[symbol + '_prev_close'] for symbol in selected_symbols}
-
-                    # Calculate the normalized value against the previous close and convert it to percentage change
-                    df_normalized = df[selected_symbols].div(pd.Series(prev_closes))
-                    df_percentage = (df_normalized - 1) * 100
-
-                    # Update the stock chart
-                    with stock_chart_placeholder.container():
-                        st.subheader('Stock Prices')
-                        if selected_stocks:
-                            fig = go.Figure()
-                            for symbol in selected_stocks:
-                                fig.add_trace(go.Scatter(x=df_percentage.index, y=df_percentage[symbol], mode='lines', name=symbol))
-                            fig.update_layout(
-                                xaxis_title='Time',
-                                yaxis_title='Percentage Change (%)',
-                                legend_title_text='Stocks',
-                                height=750,  # Adjust the height of the figure
-                                width=1600,   # Adjust the width of the figure
-                                margin=dict(l=0, r=0, t=30, b=0)
-                            )
-                            st.plotly_chart(fig)
-
-                    # Update the index chart
-                    with index_chart_placeholder.container():
-                        st.subheader('Index Prices')
-                        if selected_indexes:
-                            fig = go.Figure()
-                            for symbol in selected_indexes:
-                                fig.add_trace(go.Scatter(x=df_percentage.index, y=df_percentage[symbol], mode='lines', name=symbol))
-                            fig.update_layout(
-                                xaxis_title='Time',
-                                yaxis_title='Percentage Change (%)',
-                                legend_title_text='Indexes',
-                                height=750,  # Adjust the height of the figure
-                                width=1600,   # Adjust the width of the figure
-                                margin=dict(l=0, r=0, t=30, b=0)
-                            )
-                            st.plotly_chart(fig)
-            else:
-                st.write("Please select at least one stock or index to display the chart.")
-            await asyncio.sleep(60)  # Wait for 1 minute before fetching the data again
-
-    # Run the update data function
-    asyncio.run(update_data())
+    # Function to redraw the charts; it reruns on its own every poll interval without rerunning the whole page,
+    # reading bars the background poller keeps up to date, and far less often while the markets are closed
+    refresh = poller.refresh_seconds(selected_stocks + selected_indexes)
+
+    @st.experimental_fragment(run_every=refresh)
+    def update_data():
+        selected_symbols = selected_stocks + selected_indexes
+        # A market opened or closed since the page was drawn; draw it again to switch cadence
+        if poller.refresh_seconds(selected_symbols) != refresh:
+            st.rerun()
+        poller.subscribe(selected_symbols, "1m", "1d")
+        if selected_symbols:
+            df_percentage = asyncio.run(fetch_data(selected_symbols))
+            if df_percentage is not None and not df_percentage.empty:
+                # Bars are stored in UTC; chart them on Indian market time. The frame is shared with other
+                # sessions, so convert a shallow copy instead of setting its index.
+                with metrics.span("transform"):
+                    df_percentage = df_percentage.tz_convert("Asia/Kolkata", copy=False)
+                # Update the stock chart
+                st.subheader('Stock Prices')
+                if selected_stocks:
+                    traces = [(symbol, downsample.downsample(df_percentage[symbol])) for symbol in selected_stocks if symbol in df_percentage.columns]
+                    live_chart.line_chart("dashboard_stocks", traces, dict(
+                        xaxis_title='Time',
+                        yaxis_title='Percentage Change (%)',
+                        legend_title_text='Stocks',
+                        height=750,  # Adjust the height of the figure
+                        margin=dict(l=0, r=0, t=30, b=0)
+                    ))
+
+                # Update the index chart
+                st.subheader('Index Prices')
+                if selected_indexes:
+                    traces = [(symbol, downsample.downsample(df_percentage[symbol])) for symbol in selected_indexes if symbol in df_percentage.columns]
+                    live_chart.line_chart("dashboard_indexes", traces, dict(
+                        xaxis_title='Time',
+                        yaxis_title='Percentage Change (%)',
+                        legend_title_text='Indexes',
+                        height=750,  # Adjust the height of the figure
+                        margin=dict(l=0, r=0, t=30, b=0)
+                    ))
+        else:
+            st.write("Please select at least one stock or index to display the chart.")
+
+    # Draw the charts
+    update_data()
 
 # Display the page
 if __name__ == "__main__":
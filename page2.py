@@ -1,101 +1,147 @@
-import yfinance as yf
 import pandas as pd
-import plotly.graph_objects as go
 import streamlit as st
 import asyncio
-from ta.trend import EMAIndicator
-from ta.momentum import RSIIndicator
+import downsample
+import fetch_engine
+import indicators
+import intraday_store
+import live_chart
+import market_calendar
+import market_data
+import metrics
+import poller
+
+# List of index symbols
+INDEX_SYMBOLS = [
+    "^NSEI",
+    "^NSEBANK",
+    "^CNXIT"
+]
 
 def display_page():
-    # List of index symbols
-    index_symbols = [
-        "^NSEI",
-        "^NSEBANK",
-        "^CNXIT"
-    ]
 
     st.title("Nifty Price Chart")
 
     # Sidebar for index selection, EMA period input, and data interval selection
-    selected_index = st.sidebar.selectbox("Select an Index", index_symbols, index=0)
+    selected_index = st.sidebar.selectbox("Select an Index", INDEX_SYMBOLS, index=0)
     ema_periods = [20, 50, 100]
     interval = st.sidebar.selectbox("Select Data Interval", ("1m", "5m", "15m", "30m", "1h", "1d", "1wk"))
     period = st.sidebar.selectbox("Select Period", ("1d", "5d", "1mo", "3mo", "6mo", "1y"))
 
-    # Function to fetch data for the selected index with the chosen interval
+    # Function to keep only the NSE session; frames from a mixed-timezone batch download are in UTC, so pin IST first
+    nse_timezone, nse_open, nse_close = market_calendar.EXCHANGES["NSE"]
+
+    @metrics.timed("transform")
+    def session_only(frame):
+        if frame.index.tz is not None:
+            frame = frame.tz_convert(nse_timezone)
+        return frame.between_time(nse_open, nse_close)
+
+    # Function to fetch data for the selected index with the chosen interval.
+    # Intraday bars come from the incremental store, which the background poller extends with the newest bars.
     async def fetch_index_data(symbol, interval, period):
         data = {}
         try:
-            stock = yf.Ticker(symbol)
-            hist = stock.history(interval=interval, period=period)
             if interval in ["1m", "5m", "15m", "30m", "1h"]:
-                hist = hist.between_time("09:15", "15:30")
-            data[symbol] = hist
+                series = await fetch_engine.run_blocking(intraday_store.store.update, [symbol], interval, period, refresh_stale=False)
+                if symbol not in series:
+                    raise ValueError("no data returned")
+                hist = session_only(series[symbol].bars_for(period))
+                data[symbol] = hist
+                data[symbol + '_pct'] = session_only(series[symbol].pct_change_from(hist['Close'].iloc[0], period))
+            else:
+                hist = await fetch_engine.run_blocking(market_data.get_history, symbol, interval=interval, period=period)
+                data[symbol] = hist
+                data[symbol + '_pct'] = (hist['Close'] / hist['Close'].iloc[0] - 1) * 100
+        except asyncio.TimeoutError:
+            st.error(f"Timed out fetching data for {symbol}")
         except Exception as e:
             st.error(f"Error fetching data for {symbol}: {e}")
         return data
 
-    # Function to calculate EMA and RSI
-    def calculate_indicators(df, ema_periods, rsi_period=14):
-        close_prices = df['Close']
-        ema = {period: EMAIndicator(close_prices, window=period).ema_indicator() for period in ema_periods}
-        rsi = RSIIndicator(close_prices, window=rsi_period).rsi()
+    # Function to calculate EMA and RSI; the streaming engine only processes bars added since the last refresh
+    def calculate_indicators(key, df, ema_periods, rsi_period=14):
+        ema = {period: indicators.engine.series(key, df, "ema", window=period) for period in ema_periods}
+        rsi = indicators.engine.series(key, df, "rsi", window=rsi_period)
         return ema, rsi
 
-    # Function to update the data periodically
-    async def update_index_data(symbol, interval, period):
-        while True:
-            data = await fetch_index_data(symbol, interval, period)
-            if data:
-                df = pd.DataFrame(data[symbol])
-                df_close = df['Close']
-
-                # Calculate the normalized value and convert it to percentage change
-                df_normalized = df_close / df_close.iloc[0]
-                df_percentage = (df_normalized - 1) * 100
-
-                # Calculate indicators
-                ema, rsi = calculate_indicators(df, ema_periods, rsi_period=14)
-                
-                # Display EMA values with background color based on the price
-                current_price = df_close.iloc[-1]
-                ema_display = f'**Current Price: {current_price:.2f}**'
-                for period in ema_periods:
-                    ema_value = ema[period].iloc[-1]
-                    color = "green" if current_price > ema_value else "red"
-                    ema_display += f' <span style="background-color: {color}; color: white; padding: 0.25em; margin-right: 5px;">EMA ({period}): {ema_value:.2f}</span> '
-
-                # Display RSI value with background color based on its value
-                rsi_value = rsi.iloc[-1]
-                rsi_color = "green" if rsi_value > 60 else "red" if rsi_value < 40 else "white"
-                rsi_text_color = "white" if rsi_color != "white" else "black"
-                ema_display += f' <span style="background-color: {rsi_color}; color: {rsi_text_color}; padding: 0.25em;">RSI: {rsi_value:.2f}</span>'
-                st.markdown(ema_display, unsafe_allow_html=True)
-
-                # Plot the index data with percentage change
-                st.subheader('Index Prices')
-                fig = go.Figure()
-
-                fig.add_trace(go.Scatter(x=df_percentage.index, y=df_percentage, mode='lines', name=symbol))
-                for period in ema_periods:
-                    fig.add_trace(go.Scatter(x=df_percentage.index, y=(ema[period] / df_close.iloc[0] - 1) * 100, mode='lines', name=f'EMA ({period})'))
-
-                fig.update_layout(
-                    xaxis_title='Time',
-                    yaxis_title='Percentage Change (%)',
-                    legend_title_text='Index',
-                    height=750,  # Adjust the height of the figure
-                    width=1600,  # Adjust the width of the figure
-                    margin=dict(l=0, r=0, t=30, b=0),
-                    xaxis_rangeslider_visible=False  # Hide the range slider to avoid gaps
-                )
-                st.plotly_chart(fig)
-            else:
-                st.write("Please select an index to display the chart.")
-            await asyncio.sleep(60)  # Wait for 1 minute before fetching the data again
+    # Function to redraw the indicators and chart; it reruns on its own every poll interval without rerunning
+    # the whole page, reading intraday bars the background poller keeps up to date, and far less often while
+    # the market is closed
+    refresh = poller.refresh_seconds([selected_index])
+
+    @st.experimental_fragment(run_every=refresh)
+    def update_index_data(symbol, interval, period):
+        # The market opened or closed since the page was drawn; draw it again to switch cadence
+        if poller.refresh_seconds([symbol]) != refresh:
+            st.rerun()
+        poller.subscribe([symbol] if interval in intraday_store.INTRADAY_INTERVALS else [], interval, period)
+        data = asyncio.run(fetch_index_data(symbol, interval, period))
+        if data:
+            df = pd.DataFrame(data[symbol])
+            df_close = df['Close']
+
+            # Percentage change against the first close of the period
+            df_percentage = data[symbol + '_pct']
+
+            # Calculate indicators
+            ema, rsi = calculate_indicators((symbol, interval, period), df, ema_periods, rsi_period=14)
+            
+            # Display EMA values with background color based on the price
+            current_price = df_close.iloc[-1]
+            ema_display = f'**Current Price: {current_price:.2f}**'
+            for ema_period in ema_periods:
+                ema_value = ema[ema_period].iloc[-1]
+                color = "green" if current_price > ema_value else "red"
+                ema_display += f' <span style="background-color: {color}; color: white; padding: 0.25em; margin-right: 5px;">EMA ({ema_period}): {ema_value:.2f}</span> '
+
+            # Display RSI value with background color based on its value
+            rsi_value = rsi.iloc[-1]
+            rsi_color = "green" if rsi_value > 60 else "red" if rsi_value < 40 else "white"
+            rsi_text_color = "white" if rsi_color != "white" else "black"
+            ema_display += f' <span style="background-color: {rsi_color}; color: {rsi_text_color}; padding: 0.25em;">RSI: {rsi_value:.2f}</span>'
+            st.markdown(ema_display, unsafe_allow_html=True)
+
+            # Plot the index data with percentage change
+            st.subheader('Index Prices')
+
+            # Longer series are thinned to one point per pixel column; zooming in slices the full-resolution
+            # bars kept on the server, so the chosen range is drawn in full detail
+            visible = slice(None)
+            if len(df_percentage) > downsample.CHART_WIDTH:
+                times = df_percentage.index.tz_localize(None) if df_percentage.index.tz is not None else df_percentage.index
+                first, last = times[0].to_pydatetime(), times[-1].to_pydatetime()
+                step = pd.Timedelta(seconds=market_data.INTERVAL_SECONDS.get(interval, 86400)).to_pytimedelta()
+                # The slider's bounds move with every new bar, which makes it a new widget, so the chosen range is
+                # kept in the session and fed back in; a range reaching the newest bar keeps following it
+                chosen = st.session_state.get('price_chart_zoom')
+                start, end = first, last
+                if chosen is not None and chosen[0] == (symbol, interval, period):
+                    start = min(max(chosen[1], first), last)
+                    end = last if chosen[3] else min(max(chosen[2], first), last)
+                    if start >= end:
+                        start, end = first, last
+                zoom = st.slider("Zoom", min_value=first, max_value=last, value=(start, end), step=step, format="DD MMM YY HH:mm")
+                st.session_state['price_chart_zoom'] = ((symbol, interval, period), zoom[0], zoom[1], zoom[1] >= last)
+                visible = slice(times.searchsorted(zoom[0]), times.searchsorted(zoom[1], side='right'))
+
+            traces = [(symbol, downsample.downsample(df_percentage.iloc[visible]))]
+            for ema_period in ema_periods:
+                traces.append((f'EMA ({ema_period})', downsample.downsample(((ema[ema_period] / df_close.iloc[0] - 1) * 100).iloc[visible])))
+
+            live_chart.line_chart("price_chart", traces, dict(
+                xaxis_title='Time',
+                yaxis_title='Percentage Change (%)',
+                legend_title_text='Index',
+                height=750,  # Adjust the height of the figure
+                margin=dict(l=0, r=0, t=30, b=0),
+                xaxis_rangeslider_visible=False  # Hide the range slider to avoid gaps
+            ))
+        else:
+            st.write("Please select an index to display the chart.")
 
-    # Run the update data function with the selected index, interval, and period
-    asyncio.run(update_index_data(selected_index, interval, period))
+    # Draw the chart for the selected index, interval, and period
+    update_index_data(selected_index, interval, period)
 
 # Display the page
 if __name__ == "__main__":
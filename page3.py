@@ -1,95 +1,111 @@
-import yfinance as yf
-import pandas as pd
-import plotly.graph_objects as go
 import streamlit as st
 import asyncio
+import downsample
+import fetch_engine
+import intraday_store
+import live_chart
+import metrics
+import poller
 
-def display_page():
-    st.title("US & European Stock Indices Real-Time Prices")
+# List of US and European indices
+US_INDICES = {
+    "Dow Jones": "^DJI",
+    "Nasdaq": "^IXIC",
+    "S&P 500": "^GSPC"
+}
 
-    # List of US and European indices
-    us_indices = {
-        "Dow Jones": "^DJI",
-        "Nasdaq": "^IXIC",
-        "S&P 500": "^GSPC"
-    }
+EUROPEAN_INDICES = {
+    "DAX": "^GDAXI",
+    "FTSE 100": "^FTSE",
+    "CAC 40": "^FCHI"
+}
 
-    european_indices = {
-        "DAX": "^GDAXI",
-        "FTSE 100": "^FTSE",
-        "CAC 40": "^FCHI"
-    }
+def display_page():
+    st.title("US & European Stock Indices Real-Time Prices")
 
     st.sidebar.header("Index Selection")
 
-    selected_us_indices = st.sidebar.multiselect('Select US Indices', options=list(us_indices.keys()), default=list(us_indices.keys()))
-    selected_european_indices = st.sidebar.multiselect('Select European Indices', options=list(european_indices.keys()), default=list(european_indices.keys()))
-
-    all_selected_us_indices = {k: us_indices[k] for k in selected_us_indices}
-    all_selected_european_indices = {k: european_indices[k] for k in selected_european_indices}
+    selected_us_indices = st.sidebar.multiselect('Select US Indices', options=list(US_INDICES.keys()), default=list(US_INDICES.keys()))
+    selected_european_indices = st.sidebar.multiselect('Select European Indices', options=list(EUROPEAN_INDICES.keys()), default=list(EUROPEAN_INDICES.keys()))
 
-    # Placeholder for the charts
-    chart_placeholder = st.empty()
+    all_selected_us_indices = {k: US_INDICES[k] for k in selected_us_indices}
+    all_selected_european_indices = {k: EUROPEAN_INDICES[k] for k in selected_european_indices}
 
-    # Function to fetch 1-minute data for the selected indices
+    # Function to fetch the 1-minute percentage change against the previous close for the selected indices.
+    # Indices seen for the first time are loaded here; after that the background poller appends new bars.
     async def fetch_data(selected_symbols):
         data = {}
+        if not selected_symbols:
+            return data
+        try:
+            df_percentage = await fetch_engine.run_blocking(intraday_store.change_vs_prev_close, selected_symbols, refresh_stale=False)
+        except asyncio.TimeoutError:
+            st.error(f"Timed out fetching data for {', '.join(selected_symbols)}")
+            return data
+        except Exception as e:
+            st.error(f"Error fetching data for {', '.join(selected_symbols)}: {e}")
+            return data
         for symbol in selected_symbols:
-            try:
-                stock = yf.Ticker(symbol)
-                hist = stock.history(interval="1m", period="1d")
-                prev_close = stock.history(period="5d")['Close'][-2]
-                hist['Close'] = hist['Close'].fillna(method='ffill').fillna(method='bfill')  # Fill missing data points
-                data[symbol] = (hist['Close'] / prev_close - 1) * 100
-            except Exception as e:
-                st.error(f"Error fetching data for {symbol}: {e}")
+            if symbol in df_percentage.columns:
+                pct = df_percentage[symbol]
+                data[symbol] = pct.ffill().bfill() if pct.hasnans else pct  # Fill missing data points
+            else:
+                st.error(f"Error fetching data for {symbol}: no data returned")
         return data
 
-    # Function to update the data periodically
-    async def update_data():
-        while True:
-            selected_us_symbols = list(all_selected_us_indices.values())
-            selected_european_symbols = list(all_selected_european_indices.values())
-            us_data = await fetch_data(selected_us_symbols)
-            european_data = await fetch_data(selected_european_symbols)
+    # Functions to redraw the charts; each reruns on its own every poll interval while its market is open and
+    # far less often while it is closed, without rerunning the whole page, reading bars the background poller
+    # keeps up to date. US and European indices trade at different hours, so each chart keeps its own cadence.
+    us_refresh = poller.refresh_seconds(list(all_selected_us_indices.values()))
+    european_refresh = poller.refresh_seconds(list(all_selected_european_indices.values()))
+
+    @st.experimental_fragment(run_every=us_refresh)
+    def update_us_data():
+        selected_us_symbols = list(all_selected_us_indices.values())
+        # The market opened or closed since the page was drawn; draw it again to switch cadence
+        if poller.refresh_seconds(selected_us_symbols) != us_refresh:
+            st.rerun()
+        poller.subscribe(selected_us_symbols, "1m", "1d", name="us")
+        us_data = asyncio.run(fetch_data(selected_us_symbols))
 
-            with chart_placeholder.container():
-                if us_data:
-                    df_us = pd.DataFrame(us_data)
-                    st.subheader('US Indices Prices')
-                    fig_us = go.Figure()
-                    for name, symbol in all_selected_us_indices.items():
-                        fig_us.add_trace(go.Scatter(x=df_us.index, y=df_us[symbol], mode='lines', name=name))
-                    fig_us.update_layout(
-                        xaxis_title='Time',
-                        yaxis_title='Percentage Change (%)',
-                        legend_title_text='US Indices',
-                        height=400,
-                        width=1600,
-                        margin=dict(l=0, r=0, t=30, b=0)
-                    )
-                    st.plotly_chart(fig_us)
+        if us_data:
+            # The series are views of the shared store, so they are charted as they are rather than copied into a frame
+            with metrics.span("transform"):
+                # Bars are stored in UTC, so show US indices on New York time as before
+                us_data = {symbol: pct.tz_convert("America/New_York", copy=False) if pct.index.tz is not None else pct for symbol, pct in us_data.items()}
+            st.subheader('US Indices Prices')
+            traces = [(name, downsample.downsample(us_data[symbol])) for name, symbol in all_selected_us_indices.items() if symbol in us_data]
+            live_chart.line_chart("us_indices", traces, dict(
+                xaxis_title='Time',
+                yaxis_title='Percentage Change (%)',
+                legend_title_text='US Indices',
+                height=400,
+                margin=dict(l=0, r=0, t=30, b=0)
+            ))
 
-                if european_data:
-                    df_european = pd.DataFrame(european_data)
-                    st.subheader('European Indices Prices')
-                    fig_european = go.Figure()
-                    for name, symbol in all_selected_european_indices.items():
-                        fig_european.add_trace(go.Scatter(x=df_european.index, y=df_european[symbol], mode='lines', name=name))
-                    fig_european.update_layout(
-                        xaxis_title='Time',
-                        yaxis_title='Percentage Change (%)',
-                        legend_title_text='European Indices',
-                        height=400,
-                        width=1600,
-                        margin=dict(l=0, r=0, t=30, b=0)
-                    )
-                    st.plotly_chart(fig_european)
+    @st.experimental_fragment(run_every=european_refresh)
+    def update_european_data():
+        selected_european_symbols = list(all_selected_european_indices.values())
+        # A market opened or closed since the page was drawn; draw it again to switch cadence
+        if poller.refresh_seconds(selected_european_symbols) != european_refresh:
+            st.rerun()
+        poller.subscribe(selected_european_symbols, "1m", "1d", name="european")
+        european_data = asyncio.run(fetch_data(selected_european_symbols))
 
-            await asyncio.sleep(60)  # Wait for 1 minute before fetching the data again
+        if european_data:
+            st.subheader('European Indices Prices')
+            traces = [(name, downsample.downsample(european_data[symbol])) for name, symbol in all_selected_european_indices.items() if symbol in european_data]
+            live_chart.line_chart("european_indices", traces, dict(
+                xaxis_title='Time',
+                yaxis_title='Percentage Change (%)',
+                legend_title_text='European Indices',
+                height=400,
+                margin=dict(l=0, r=0, t=30, b=0)
+            ))
 
-    # Run the update data function
-    asyncio.run(update_data())
+    # Draw the charts
+    update_us_data()
+    update_european_data()
 
 # Display the page
 if __name__ == "__main__":
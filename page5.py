@@ -0,0 +1,37 @@
+import streamlit as st
+import pandas as pd
+import metrics
+
+def display_page():
+    st.title("Metrics")
+    st.caption(f"Also written every {metrics.EXPORT_SECONDS} seconds to {metrics.EXPORT_FILE} in the Prometheus text format")
+
+    # Time spent per instrumented block since the server started
+    spans = metrics.span_totals()
+    if spans:
+        df_spans = pd.DataFrame(
+            [(name, count, self_seconds * 1000, total_seconds * 1000, total_seconds * 1000 / count)
+             for name, (count, self_seconds, total_seconds) in spans.items()],
+            columns=["Span", "Count", "Self ms", "Total ms", "Mean ms"],
+        ).sort_values("Self ms", ascending=False)
+        st.subheader("Timings")
+        st.dataframe(df_spans, hide_index=True, use_container_width=True)
+
+    # Counters and the stats the caches, stores and background jobs keep
+    rows = [
+        (name, ", ".join(f"{key}={value}" for key, value in labels.items()), value)
+        for name, kind, value, labels in metrics.samples()
+        if name not in metrics.SPAN_HELP
+    ]
+    st.subheader("Counters")
+    st.dataframe(pd.DataFrame(rows, columns=["Metric", "Labels", "Value"]), hide_index=True, use_container_width=True)
+
+    # The same numbers as the export file, for scraping or a quick copy
+    text = metrics.prometheus_text()
+    st.download_button("Download Prometheus export", text, file_name="metrics.prom", mime="text/plain")
+    with st.expander("Prometheus export"):
+        st.code(text, language="text")
+
+# Display the page
+if __name__ == "__main__":
+    display_page()
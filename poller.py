@@ -0,0 +1,223 @@
+import threading
+import time
+
+from streamlit.runtime import Runtime
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+import intraday_store
+import market_calendar
+import market_data
+import metrics
+import providers
+
+# Seconds between polls while a subscribed exchange is open; the page charts redraw on the same cadence
+POLL_SECONDS = 60
+
+# Seconds between chart redraws while every exchange on the chart is closed; the poller fetches nothing then
+CLOSED_REFRESH_SECONDS = 5 * 60
+
+# A session that has not renewed its subscription for this long is treated as gone
+LEASE_SECONDS = 3 * CLOSED_REFRESH_SECONDS
+
+# Interval a streaming provider pushes; subscriptions at other intervals are still polled
+STREAM_INTERVAL = "1m"
+
+# Seconds between chart redraws while the provider streams bars; a redraw only sends the points that changed
+STREAM_REFRESH_SECONDS = 1
+
+
+# True while the browser tab behind session_id is still connected
+def _session_alive(session_id):
+    if not Runtime.exists():
+        return True
+    return Runtime.instance().is_active_session(session_id)
+
+
+# One background thread that polls the union of symbols subscribed by any session.
+# Each session holds one subscription per name (the charts of the page it is looking at), renewed on every
+# redraw, so upstream load grows with the number of distinct symbols rather than with the number of users.
+# Symbols are only polled while their exchange is open, plus one final fetch after it closes. When the
+# market-data provider streams, 1m symbols are subscribed with it instead and their bars pushed into the store.
+class Poller:
+    def __init__(self, poll_seconds=POLL_SECONDS):
+        self.poll_seconds = poll_seconds
+        self.version = 0
+        self.polls = 0
+        self.errors = 0
+        self.skipped = 0
+        self.pushes = 0
+        self.last_poll = None
+        self._subscriptions = {}
+        self._streamed = set()
+        self._fetched = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    # Replace a session's subscription called name with symbols at (interval, period)
+    def subscribe(self, session_id, symbols, interval="1m", period="1d", name="default"):
+        key = (session_id, name)
+        with self._lock:
+            previous = self._subscriptions.get(key)
+            if symbols:
+                self._subscriptions[key] = ((interval, period), frozenset(symbols), time.time() + LEASE_SECONDS)
+            else:
+                self._subscriptions.pop(key, None)
+            # The poller may be asleep until an exchange opens; symbols it has not seen need it now
+            current = self._subscriptions.get(key)
+            if (previous and previous[:2]) != (current and current[:2]):
+                self._wake.set()
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="market-data-poller", daemon=True)
+                self._thread.start()
+
+    # Drop every subscription of a session, e.g. when it leaves a page or logs out, rather than wait for the leases
+    def unsubscribe(self, session_id):
+        with self._lock:
+            keys = [key for key in self._subscriptions if key[0] == session_id]
+            for key in keys:
+                del self._subscriptions[key]
+            # Streams nobody wants any more are dropped on the poller's next pass
+            if keys:
+                self._wake.set()
+
+    # Union of subscribed symbols per (interval, period), after dropping expired leases and closed sessions
+    def subscribed(self):
+        now = time.time()
+        with self._lock:
+            for key, (_, _, lease) in list(self._subscriptions.items()):
+                if lease <= now or not _session_alive(key[0]):
+                    del self._subscriptions[key]
+            topics = {}
+            for topic, symbols, _ in self._subscriptions.values():
+                topics.setdefault(topic, set()).update(symbols)
+            return topics
+
+    # Subscribe the 1m symbols with the provider when it streams and drop the ones no session wants any more;
+    # returns the symbols now streamed
+    def _update_streams(self, topics):
+        provider = providers.provider
+        wanted = set()
+        if provider.streaming:
+            for (interval, _), symbols in topics.items():
+                if interval == STREAM_INTERVAL:
+                    wanted.update(symbols)
+        if self._streamed - wanted:
+            provider.unsubscribe(self._streamed - wanted, self._on_bars)
+        if wanted - self._streamed:
+            provider.subscribe(wanted - self._streamed, self._on_bars)
+        self._streamed = wanted
+        return wanted
+
+    # Called by the provider, on its own thread, with the newest bars of a streamed symbol
+    def _on_bars(self, symbol, interval, bars):
+        if intraday_store.store.push(symbol, interval, bars):
+            self.pushes += 1
+            self.version += 1
+
+    # Poll the subscribed symbols that can have new bars; returns the Unix time the next one is due
+    def poll_once(self):
+        now = market_calendar.current_time()
+        next_due = None
+        topics = self.subscribed()
+        streamed = self._update_streams(topics)
+        for topic, symbols in topics.items():
+            interval, period = topic
+            if interval == STREAM_INTERVAL:
+                symbols = symbols - streamed
+            due = [symbol for symbol in sorted(symbols)
+                   if market_calendar.next_fetch(symbol, self._fetched.get((topic, symbol)), now) <= now]
+            self.skipped += len(symbols) - len(due)
+            fetched = {}
+            if due:
+                try:
+                    fetched = intraday_store.store.update(due, interval, period)
+                except Exception:
+                    self.errors += 1
+                for symbol in fetched:
+                    self._fetched[(topic, symbol)] = now
+            for symbol in symbols:
+                if symbol in due and symbol not in fetched:
+                    # Failed to load; try again on the next poll
+                    due_at = now
+                else:
+                    due_at = market_calendar.next_fetch(symbol, self._fetched.get((topic, symbol)), now)
+                if due_at is not None and (next_due is None or due_at < next_due):
+                    next_due = due_at
+        self.polls += 1
+        self.version += 1
+        self.last_poll = time.time()
+        return next_due
+
+    def _run(self):
+        while True:
+            next_due = self.poll_once()
+            # Wake just after the next bar boundary so new bars are picked up as soon as Yahoo publishes them,
+            # or, while every subscribed exchange is closed, just after the first one opens again.
+            # Both are on the calendar's clock; a replay runs it faster than real time.
+            now = market_calendar.current_time()
+            boundary = (now // self.poll_seconds + 1) * self.poll_seconds
+            timeout = None if next_due is None else (
+                (max(next_due, boundary) - now + market_data.SETTLE_SECONDS) / market_calendar.clock_speed
+            )
+            # Streams of sessions that went away are only dropped when the leases are checked
+            if self._streamed:
+                timeout = LEASE_SECONDS if timeout is None else min(timeout, LEASE_SECONDS)
+            self._wake.wait(timeout)
+            self._wake.clear()
+
+    def stats(self):
+        with self._lock:
+            sessions = len({session_id for session_id, _ in self._subscriptions})
+        return {
+            "sessions": sessions,
+            "symbols": sum(len(symbols) for symbols in self.subscribed().values()),
+            "polls": self.polls,
+            "errors": self.errors,
+            "skipped": self.skipped,
+            "pushes": self.pushes,
+            "streamed": len(self._streamed),
+            "last_poll": self.last_poll,
+        }
+
+
+poller = Poller()
+
+
+def _samples():
+    stats = poller.stats()
+    return [
+        ("poller_sessions", "gauge", stats["sessions"], {}),
+        ("poller_symbols", "gauge", stats["symbols"], {}),
+        ("poller_polls_total", "counter", stats["polls"], {}),
+        ("poller_errors_total", "counter", stats["errors"], {}),
+        ("poller_skipped_symbols_total", "counter", stats["skipped"], {}),
+        ("poller_pushes_total", "counter", stats["pushes"], {}),
+        ("poller_streamed_symbols", "gauge", stats["streamed"], {}),
+    ]
+
+
+metrics.register_collector(_samples)
+
+
+# Subscribe the Streamlit session running this script to symbols under name; an empty list unsubscribes it
+def subscribe(symbols, interval="1m", period="1d", name="default"):
+    ctx = get_script_run_ctx()
+    if ctx is not None:
+        poller.subscribe(ctx.session_id, symbols, interval, period, name)
+
+
+# Drop every subscription of the Streamlit session running this script
+def unsubscribe():
+    ctx = get_script_run_ctx()
+    if ctx is not None:
+        poller.unsubscribe(ctx.session_id)
+
+
+# Seconds between chart redraws for symbols: every STREAM_REFRESH_SECONDS while the provider streams bars,
+# otherwise the poll interval while any of their exchanges is open, shortened by a replay's speed-up.
+def refresh_seconds(symbols):
+    if providers.provider.streaming:
+        return STREAM_REFRESH_SECONDS
+    seconds = POLL_SECONDS if market_calendar.any_open(symbols) else CLOSED_REFRESH_SECONDS
+    return seconds / market_calendar.clock_speed
@@ -0,0 +1,376 @@
+import atexit
+import os
+import shutil
+import tempfile
+import threading
+import time
+import zlib
+
+import numpy as np
+import pandas as pd
+
+import market_calendar
+import market_data
+import metrics
+import ohlcv_store
+import resample
+
+# Setting PROVIDER_VARIABLE to one of PROVIDERS switches a server process away from Yahoo Finance
+PROVIDER_VARIABLE = "DASHBOARD_PROVIDER"
+DIRECTORY_VARIABLE = "DASHBOARD_PROVIDER_DIR"
+
+# Bars served by the local-file provider, laid out like the local store; `python replay.py record` fills it
+LOCAL_DIR = os.path.join("data", "replay")
+
+# How bars combine into one longer bar
+AGGREGATION = {"Open": "first", "High": "max", "Low": "min", "Close": "last", "Volume": "sum"}
+
+# Bins for intervals longer than a day, built from the daily bars the way Yahoo labels them
+CALENDAR_RULES = {"1wk": "W-MON", "1mo": "MS", "3mo": "QS"}
+
+# Simulated market: seconds between ticks, days of 1m history, daily bars before that, and the
+# standard deviation of the log return per minute and per day
+SIMULATED_TICK_SECONDS = 1
+SIMULATED_DAYS = 5
+SIMULATED_DAILY_BARS = 260
+SIMULATED_MINUTE_VOLATILITY = 0.0005
+SIMULATED_DAILY_VOLATILITY = 0.01
+
+
+def _timezone(symbol):
+    exchange = market_calendar.exchange_for(symbol)
+    return market_calendar.EXCHANGES[exchange][0] if exchange else "UTC"
+
+
+# The bars of the period ending at the last bar, or the bars at or after start, as Yahoo answers them
+def _slice(bars, period=None, start=None):
+    if start is not None:
+        start = pd.Timestamp(start)
+        if bars.index.tz is not None and start.tz is None:
+            start = start.tz_localize(bars.index.tz)
+        return bars.iloc[bars.index.searchsorted(start):]
+    if period is not None:
+        return bars.iloc[ohlcv_store.window_start(bars.index, period):]
+    return bars
+
+
+# One daily bar per exchange date from 1m bars, stamped on the naive date like the store's daily bars
+def daily_from_minutes(minutes, tz):
+    local = minutes.tz_convert(tz)
+    days = local.groupby(local.index.date).agg(AGGREGATION)
+    days.index = pd.DatetimeIndex(days.index, name=minutes.index.name)
+    return days
+
+
+# Where the pages' bars come from. history answers the requests market_data sends upstream; quotes gives the
+# dashboard header's prices; a provider with streaming set also pushes new 1m bars to subscribed callbacks
+# as callback(symbol, interval, bars), so charts update without waiting for a poll.
+class Provider:
+    name = None
+    streaming = False
+
+    # {symbol: bars} for the period, or for the bars at or after start; symbols without bars are left out
+    def history(self, symbols, interval="1d", period=None, start=None, **kwargs):
+        raise NotImplementedError
+
+    # {symbol: (price, previous close)} from the cached daily bars: the last completed session's close
+    # against the one before, as the dashboard header has always shown them
+    def quotes(self, symbols):
+        daily = market_data.get_history_many(symbols, interval="1d", period="5d")
+        return {
+            symbol: (hist['Close'].iloc[-2], hist['Close'].iloc[-3])
+            for symbol, hist in daily.items() if len(hist) >= 3
+        }
+
+    def subscribe(self, symbols, callback):
+        raise NotImplementedError(f"{self.name} does not stream bars")
+
+    def unsubscribe(self, symbols, callback):
+        pass
+
+    def stats(self):
+        return {"streamed_symbols": 0}
+
+
+# Yahoo Finance through yfinance, with the single flight, rate limit and backoff in market_data
+class YahooProvider(Provider):
+    name = "yahoo"
+
+    def __init__(self):
+        self._upstream = market_data._fetch_upstream
+
+    def history(self, symbols, interval="1d", period=None, start=None, **kwargs):
+        if period is not None:
+            kwargs["period"] = period
+        if start is not None:
+            kwargs["start"] = start
+        return self._upstream(symbols, interval=interval, **kwargs)
+
+
+# Bars read from files in the local store's layout, served as they are whatever the time
+class LocalFileProvider(Provider):
+    name = "local"
+
+    def __init__(self, directory=LOCAL_DIR):
+        self.directory = directory
+
+    def history(self, symbols, interval="1d", period=None, start=None, **kwargs):
+        frames = {}
+        for symbol in symbols:
+            bars = ohlcv_store.read(symbol, interval, directory=self.directory)
+            if bars is None and ohlcv_store.is_intraday(interval):
+                minutes = ohlcv_store.read(symbol, "1m", directory=self.directory)
+                bars = None if minutes is None else resample.resample(minutes, interval, symbol)
+            if bars is None:
+                continue
+            bars = _slice(bars, period, start)
+            if not bars.empty:
+                frames[symbol] = bars
+        return frames
+
+
+# Provider whose bars all derive from a 1m series per symbol, as of the market calendar's clock: intraday
+# intervals aggregate the 1m bars, and the current day's daily bar is built from its 1m bars so far.
+# Subclasses supply _minutes(symbol, now) and, for the days before, _daily(symbol).
+class MinuteBarProvider(Provider):
+    def __init__(self):
+        self.requests = 0
+
+    def _minutes(self, symbol, now):
+        raise NotImplementedError
+
+    def _daily(self, symbol):
+        return None
+
+    def _daily_until(self, symbol, now):
+        tz = _timezone(symbol)
+        today = now.tz_convert(tz).normalize()
+        minutes = self._minutes(symbol, now)
+        daily = self._daily(symbol)
+        if daily is not None:
+            daily = daily.iloc[:daily.index.searchsorted(today.tz_localize(None))]
+        if minutes is not None:
+            session = minutes.iloc[minutes.index.searchsorted(today):]
+            if not session.empty:
+                bar = daily_from_minutes(session, tz)
+                daily = bar if daily is None else pd.concat([daily, bar])
+        return daily
+
+    def _bars_until(self, symbol, interval, now):
+        if interval == "1m":
+            return self._minutes(symbol, now)
+        if ohlcv_store.is_intraday(interval):
+            minutes = self._minutes(symbol, now)
+            return None if minutes is None else resample.resample(minutes, interval, symbol)
+        daily = self._daily_until(symbol, now)
+        if daily is None or interval == "1d":
+            return daily
+        if interval not in CALENDAR_RULES:
+            return None
+        return daily.resample(CALENDAR_RULES[interval], label="left", closed="left").agg(AGGREGATION).dropna(subset=["Close"])
+
+    def history(self, symbols, interval="1d", period=None, start=None, **kwargs):
+        now = pd.Timestamp(market_calendar.current_time(), unit="s", tz="UTC")
+        frames = {}
+        for symbol in symbols:
+            bars = self._bars_until(symbol, interval, now)
+            if bars is None:
+                continue
+            bars = _slice(bars, period, start)
+            if not bars.empty:
+                frames[symbol] = bars
+        self.requests += 1
+        return frames
+
+
+# Random-walk OHLCV bars at the given index, opening at open_price
+def _random_bars(rng, index, open_price, volatility):
+    closes = open_price * np.exp(np.cumsum(rng.normal(0, volatility, len(index))))
+    opens = np.concatenate([[open_price], closes[:-1]])
+    spread = np.abs(rng.normal(0, volatility / 2, len(index)))
+    return pd.DataFrame({
+        "Open": opens,
+        "High": np.maximum(opens, closes) * (1 + spread),
+        "Low": np.minimum(opens, closes) * (1 - spread),
+        "Close": closes,
+        "Volume": rng.integers(1_000, 100_000, len(index)).astype("int64"),
+    }, index=index)
+
+
+# Made-up prices for any symbol, round the clock: SIMULATED_DAYS of 1m bars up to now, after a year of daily
+# bars, extended every SIMULATED_TICK_SECONDS while a symbol is subscribed. Every tick moves the price of
+# the forming 1m bar and pushes it, with the bar before it, to the symbol's subscribers. For demos and for
+# measuring the push path without a streaming feed.
+class SimulatedProvider(MinuteBarProvider):
+    name = "simulated"
+    streaming = True
+
+    def __init__(self, tick_seconds=SIMULATED_TICK_SECONDS, seed=0):
+        super().__init__()
+        self.tick_seconds = tick_seconds
+        self.seed = seed
+        self.ticks = 0
+        self._completed = {}
+        self._forming = {}
+        self._daily_bars = {}
+        self._rngs = {}
+        self._subscribers = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    # Bring a symbol's completed bars up to the minute before minute and start the bar of minute
+    def _extend(self, symbol, minute):
+        forming = self._forming.get(symbol)
+        if forming is not None and forming.index[0] == minute:
+            return
+        if symbol not in self._rngs:
+            rng = self._rngs[symbol] = np.random.default_rng(self.seed + zlib.crc32(symbol.encode()))
+            start = minute - pd.Timedelta(days=SIMULATED_DAYS)
+            first_day = start.tz_convert(_timezone(symbol)).tz_localize(None).normalize()
+            days = pd.bdate_range(end=first_day - pd.Timedelta(days=1), periods=SIMULATED_DAILY_BARS, name="timestamp")
+            daily = _random_bars(rng, days, float(rng.uniform(100, 5000)), SIMULATED_DAILY_VOLATILITY)
+            self._daily_bars[symbol] = daily
+            completed = None
+            last_close = daily["Close"].iloc[-1]
+        else:
+            rng = self._rngs[symbol]
+            completed = self._completed[symbol]
+            if forming is not None:
+                completed = pd.concat([completed, forming])
+            last_close = completed["Close"].iloc[-1]
+            start = completed.index[-1] + pd.Timedelta(minutes=1)
+        gap = pd.date_range(start, minute, freq="min", inclusive="left", name="timestamp")
+        if len(gap):
+            bars = _random_bars(rng, gap, last_close, SIMULATED_MINUTE_VOLATILITY)
+            completed = bars if completed is None else pd.concat([completed, bars]).iloc[-SIMULATED_DAYS * 1440:]
+            last_close = bars["Close"].iloc[-1]
+        self._completed[symbol] = completed
+        self._forming[symbol] = pd.DataFrame(
+            {"Open": [last_close], "High": [last_close], "Low": [last_close], "Close": [last_close], "Volume": [0]},
+            index=pd.DatetimeIndex([minute], name="timestamp"),
+        )
+
+    def _minutes(self, symbol, now):
+        with self._lock:
+            self._extend(symbol, now.floor("min"))
+            return pd.concat([self._completed[symbol], self._forming[symbol]])
+
+    def _daily(self, symbol):
+        with self._lock:
+            daily = self._daily_bars.get(symbol)
+            minutes = self._completed.get(symbol)
+        if daily is None or minutes is None or minutes.empty:
+            return daily
+        return pd.concat([daily, daily_from_minutes(minutes, _timezone(symbol))])
+
+    # Quotes from the latest tick against the previous day's close
+    def quotes(self, symbols):
+        now = pd.Timestamp(market_calendar.current_time(), unit="s", tz="UTC")
+        quotes = {}
+        for symbol in symbols:
+            daily = self._daily_until(symbol, now)
+            if daily is not None and len(daily) >= 2:
+                quotes[symbol] = (daily['Close'].iloc[-1], daily['Close'].iloc[-2])
+        return quotes
+
+    def subscribe(self, symbols, callback):
+        with self._lock:
+            for symbol in symbols:
+                self._subscribers.setdefault(symbol, set()).add(callback)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="simulated-ticks", daemon=True)
+                self._thread.start()
+
+    def unsubscribe(self, symbols, callback):
+        with self._lock:
+            for symbol in symbols:
+                callbacks = self._subscribers.get(symbol, set())
+                callbacks.discard(callback)
+                if not callbacks:
+                    self._subscribers.pop(symbol, None)
+
+    # Move every subscribed symbol's price one step and push its last two bars
+    def tick(self):
+        now = pd.Timestamp(market_calendar.current_time(), unit="s", tz="UTC")
+        pushes = []
+        with self._lock:
+            ticks_per_minute = max(60 / self.tick_seconds, 1)
+            for symbol, callbacks in self._subscribers.items():
+                self._extend(symbol, now.floor("min"))
+                forming = self._forming[symbol].copy()
+                close = forming["Close"].iloc[0] * np.exp(
+                    self._rngs[symbol].normal(0, SIMULATED_MINUTE_VOLATILITY / np.sqrt(ticks_per_minute))
+                )
+                forming["Close"] = close
+                forming["High"] = max(forming["High"].iloc[0], close)
+                forming["Low"] = min(forming["Low"].iloc[0], close)
+                forming["Volume"] += int(self._rngs[symbol].integers(10, 1_000))
+                self._forming[symbol] = forming
+                pushes.append((symbol, list(callbacks), pd.concat([self._completed[symbol].iloc[-1:], forming])))
+            self.ticks += 1
+        for symbol, callbacks, bars in pushes:
+            for callback in callbacks:
+                callback(symbol, "1m", bars)
+
+    def _run(self):
+        while True:
+            time.sleep(self.tick_seconds)
+            self.tick()
+
+    def stats(self):
+        with self._lock:
+            return {"streamed_symbols": len(self._subscribers)}
+
+
+# Yahoo Finance unless PROVIDER_VARIABLE names another provider
+provider = YahooProvider()
+
+# Providers PROVIDER_VARIABLE can name
+PROVIDERS = {
+    "yahoo": YahooProvider,
+    "local": lambda: LocalFileProvider(os.environ.get(DIRECTORY_VARIABLE) or LOCAL_DIR),
+    "simulated": SimulatedProvider,
+}
+
+
+# The local store Yahoo's bars are written through to
+_live_store_dir = ohlcv_store.STORE_DIR
+
+
+# Send every upstream request of this process to new_provider. Only Yahoo's bars go to the live store;
+# any other provider writes through to a temporary store of its own, removed at exit, so its bars are
+# never served as real history once the process is back on Yahoo.
+def use(new_provider):
+    global provider, _live_store_dir
+    if isinstance(provider, YahooProvider):
+        _live_store_dir = ohlcv_store.STORE_DIR
+    provider = new_provider
+    if isinstance(new_provider, YahooProvider):
+        market_data._fetch_upstream = new_provider._upstream
+        ohlcv_store.STORE_DIR = _live_store_dir
+    else:
+        market_data._fetch_upstream = metrics.timed("upstream")(new_provider.history)
+        store_dir = tempfile.mkdtemp(prefix=f"dashboard-{new_provider.name}-")
+        atexit.register(shutil.rmtree, store_dir, True)
+        ohlcv_store.STORE_DIR = store_dir
+    market_data.cache.clear()
+
+
+# Switch providers if PROVIDER_VARIABLE is set; called by app.py before anything is fetched
+def install_from_env():
+    name = os.environ.get(PROVIDER_VARIABLE)
+    if name and name != provider.name:
+        if name not in PROVIDERS:
+            raise ValueError(f"Unknown {PROVIDER_VARIABLE} {name!r}; choose one of {', '.join(PROVIDERS)}")
+        use(PROVIDERS[name]())
+
+
+def _samples():
+    stats = provider.stats()
+    return [
+        ("provider", "gauge", 1, {"name": provider.name}),
+        ("provider_streamed_symbols", "gauge", stats["streamed_symbols"], {}),
+    ]
+
+
+metrics.register_collector(_samples)
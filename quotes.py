@@ -0,0 +1,105 @@
+import threading
+import time
+
+import fetch_engine
+import metrics
+import providers
+
+# Seconds a quote is served as it is before a background refresh is started. Yahoo quotes come from daily bars
+# cached for up to market_data.MAX_TTL_SECONDS, so most refreshes are answered from the cache and only the
+# first one after the cache expires reaches Yahoo.
+QUOTE_TTL_SECONDS = 60
+
+
+# Last price of a symbol with its change against the previous close, and when it was fetched
+class Quote:
+    def __init__(self, price, change, change_percentage, fetched_at):
+        self.price = price
+        self.change = change
+        self.change_percentage = change_percentage
+        self.fetched_at = fetched_at
+
+
+# Quotes shared by every session and served from memory (stale-while-revalidate): a symbol seen for the
+# first time is fetched inline, and a quote older than the TTL is still returned at once while a background
+# task fetches all stale symbols in one batch.
+class QuoteService:
+    def __init__(self, ttl_seconds=QUOTE_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self.refreshes = 0
+        self.errors = 0
+        self._quotes = {}
+        self._errors = {}
+        self._refreshing = set()
+        self._lock = threading.Lock()
+
+    # Quotes for symbols and, for symbols without one, the error of the last attempt to fetch them
+    @metrics.timed("fetch")
+    def latest(self, symbols):
+        now = time.time()
+        with self._lock:
+            missing = [symbol for symbol in symbols if symbol not in self._quotes]
+            stale = [
+                symbol for symbol in symbols
+                if symbol in self._quotes and now - self._quotes[symbol].fetched_at >= self.ttl_seconds
+                and symbol not in self._refreshing
+            ]
+            self._refreshing.update(stale)
+        if missing:
+            self.refresh(missing)
+        if stale:
+            fetch_engine.executor.submit(self._refresh_in_background, stale)
+        with self._lock:
+            quotes = {symbol: self._quotes[symbol] for symbol in symbols if symbol in self._quotes}
+            errors = {symbol: self._errors.get(symbol, ValueError("no data returned")) for symbol in symbols if symbol not in quotes}
+        return quotes, errors
+
+    # Fetch symbols from the market-data provider in one batch and replace their quotes; a failed symbol keeps
+    # its previous quote
+    def refresh(self, symbols):
+        fetched_at = time.time()
+        try:
+            prices = providers.provider.quotes(symbols)
+        except Exception as e:
+            prices = {}
+            failures = {symbol: e for symbol in symbols}
+        else:
+            failures = {symbol: ValueError("no data returned") for symbol in symbols if symbol not in prices}
+        quotes = {}
+        for symbol, (price, previous_close) in prices.items():
+            price_change = price - previous_close
+            price_change_percentage = (price_change / previous_close) * 100
+            quotes[symbol] = Quote(price, price_change, price_change_percentage, fetched_at)
+        with self._lock:
+            self._quotes.update(quotes)
+            for symbol in quotes:
+                self._errors.pop(symbol, None)
+            self._errors.update(failures)
+            self.refreshes += 1
+            self.errors += len(failures)
+
+    def _refresh_in_background(self, symbols):
+        try:
+            self.refresh(symbols)
+        finally:
+            with self._lock:
+                self._refreshing.difference_update(symbols)
+
+    def stats(self):
+        with self._lock:
+            return {"quotes": len(self._quotes), "refreshes": self.refreshes, "errors": self.errors}
+
+
+service = QuoteService()
+
+
+def _samples():
+    stats = service.stats()
+    return [
+        ("quotes", "gauge", stats["quotes"], {}),
+        ("quote_refreshes_total", "counter", stats["refreshes"], {}),
+        ("quote_errors_total", "counter", stats["errors"], {}),
+    ]
+
+
+metrics.register_collector(_samples)
@@ -0,0 +1,183 @@
+import argparse
+import os
+import threading
+from datetime import date, datetime
+from zoneinfo import ZoneInfo
+
+import market_calendar
+import market_data
+import metrics
+import ohlcv_store
+import page1
+import page2
+import page3
+import providers
+import quotes
+import scan_snapshots
+import universes
+
+# Recorded market days, laid out like the local store: <REPLAY_DIR>/<symbol>/<interval>/<partition>.parquet.
+# The local-file provider serves the same recordings without a clock.
+REPLAY_DIR = providers.LOCAL_DIR
+
+# Setting DAY_VARIABLE (a date such as 2024-06-14, or "latest") starts the server in replay mode
+DAY_VARIABLE = "DASHBOARD_REPLAY_DAY"
+SPEED_VARIABLE = "DASHBOARD_REPLAY_SPEED"
+START_VARIABLE = "DASHBOARD_REPLAY_START"
+
+# Virtual seconds that pass per real second, and the range it is clamped to
+DEFAULT_SPEED = 1
+MIN_SPEED = 1
+MAX_SPEED = 100
+
+# A replay starts when this exchange opens on the replayed day, unless START_VARIABLE gives another time (HH:MM)
+START_EXCHANGE = "NSE"
+
+# What is recorded per symbol: the last days of 1m bars, and a year of daily bars for previous closes and the scanner
+RECORDINGS = (("1m", "5d"), ("1d", "1y"))
+
+# Serves a recorded market day in place of Yahoo. The market calendar runs on a virtual clock that starts
+# at the day's open and advances speed times faster than real time; every upstream request is answered
+# with the recorded bars up to that clock, so the poller, the caches and the pages see bars arrive as they
+# did on the day. Longer intraday intervals and today's daily bar are built from the 1m bars revealed so far.
+class MarketReplay(providers.MinuteBarProvider):
+    name = "replay"
+
+    def __init__(self, directory=REPLAY_DIR):
+        super().__init__()
+        self.directory = directory
+        self.day = None
+        self.speed = None
+        self._bars = {}
+        self._lock = threading.Lock()
+
+    @property
+    def installed(self):
+        return self.day is not None
+
+    # Read every recording into memory; a day of 1m bars for a few hundred symbols is a few MB
+    def _load(self):
+        for symbol in sorted(os.listdir(self.directory)):
+            for interval, _ in RECORDINGS:
+                bars = ohlcv_store.read(symbol, interval, directory=self.directory)
+                if bars is not None and not bars.empty:
+                    self._bars[(symbol, interval)] = bars
+
+    # Days with 1m bars recorded for START_EXCHANGE's symbols
+    def days(self):
+        tz = ZoneInfo(market_calendar.EXCHANGES[START_EXCHANGE][0])
+        days = set()
+        for (symbol, interval), bars in self._bars.items():
+            if interval == "1m" and market_calendar.exchange_for(symbol) == START_EXCHANGE:
+                days.update(bars.index.tz_convert(tz).date)
+        return sorted(days)
+
+    # Switch this process to the recorded day. Bars fetched during the replay go to a temporary store,
+    # so neither the recording nor the live store ever hold bars from a replayed clock.
+    def install(self, day="latest", speed=DEFAULT_SPEED, start=None):
+        with self._lock:
+            if self.installed:
+                return
+            self._load()
+            days = self.days()
+            if not days:
+                raise ValueError(f"No recorded 1m bars in {self.directory}/; run: python replay.py record")
+            day = days[-1] if day == "latest" else date.fromisoformat(day)
+            if day not in days:
+                raise ValueError(f"No 1m bars recorded for {day}; recorded days: {', '.join(map(str, days))}")
+            tz_name, open_time, _ = market_calendar.EXCHANGES[START_EXCHANGE]
+            start = datetime.strptime(start, "%H:%M").time() if start else open_time
+            speed = min(max(float(speed), MIN_SPEED), MAX_SPEED)
+
+            market_calendar.set_clock(datetime.combine(day, start, tzinfo=ZoneInfo(tz_name)).timestamp(), speed)
+            providers.use(self)
+            # Refresh cadences that are not tied to the bar boundaries speed up with the clock
+            quotes.service.ttl_seconds = quotes.QUOTE_TTL_SECONDS / speed
+            scan_snapshots.job.refresh_seconds = scan_snapshots.SNAPSHOT_SECONDS / speed
+            self.day = day
+            self.speed = speed
+
+    # 1m bars of a symbol up to the virtual clock
+    def _minutes(self, symbol, now):
+        minutes = self._bars.get((symbol, "1m"))
+        if minutes is None:
+            return None
+        return minutes.iloc[:minutes.index.searchsorted(now, side="right")]
+
+    def _daily(self, symbol):
+        return self._bars.get((symbol, "1d"))
+
+    def stats(self):
+        return {
+            "streamed_symbols": 0,
+            "speed": self.speed or 0,
+            "clock": market_calendar.current_time() if self.installed else 0,
+            "symbols": len({symbol for symbol, _ in self._bars}),
+            "requests": self.requests,
+        }
+
+
+replay = MarketReplay()
+
+
+def _samples():
+    stats = replay.stats()
+    return [
+        ("replay_speed", "gauge", stats["speed"], {}),
+        ("replay_clock_seconds", "gauge", stats["clock"], {}),
+        ("replay_symbols", "gauge", stats["symbols"], {}),
+        ("replay_requests_total", "counter", stats["requests"], {}),
+    ]
+
+
+metrics.register_collector(_samples)
+
+
+# Start replay mode if DAY_VARIABLE is set; called by app.py before anything is fetched
+def install_from_env():
+    day = os.environ.get(DAY_VARIABLE)
+    if day:
+        replay.install(day, os.environ.get(SPEED_VARIABLE, DEFAULT_SPEED), os.environ.get(START_VARIABLE))
+
+
+# Every symbol the pages show by default, including each scanner universe
+def page_symbols():
+    symbols = page1.DEFAULT_SYMBOLS + page1.INDEX_SYMBOLS + page2.INDEX_SYMBOLS
+    symbols += list(page3.US_INDICES.values()) + list(page3.EUROPEAN_INDICES.values())
+    for name in universes.names():
+        symbols += universes.load(name)
+    return list(dict.fromkeys(symbols))
+
+
+# Download the recordings for symbols from Yahoo into directory, adding to what is already there
+def record(symbols, directory=REPLAY_DIR):
+    store_dir = ohlcv_store.STORE_DIR
+    ohlcv_store.STORE_DIR = directory
+    try:
+        for interval, period in RECORDINGS:
+            frames = market_data.get_history_many(symbols, interval=interval, period=period)
+            missing = [symbol for symbol in symbols if symbol not in frames or frames[symbol].empty]
+            print(f"{interval}: recorded {len(symbols) - len(missing)} of {len(symbols)} symbols")
+            if missing:
+                print(f"  no bars for {', '.join(missing)}")
+    finally:
+        ohlcv_store.STORE_DIR = store_dir
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Record market days to replay with DASHBOARD_REPLAY_DAY")
+    parser.add_argument("command", choices=["record", "days"])
+    parser.add_argument("--symbols", nargs="+", help="symbols to record (default: every symbol the pages show)")
+    parser.add_argument("--directory", default=REPLAY_DIR)
+    args = parser.parse_args()
+
+    if args.command == "record":
+        record(args.symbols or page_symbols(), args.directory)
+    recording = MarketReplay(args.directory)
+    if os.path.isdir(args.directory):
+        recording._load()
+    print("Recorded days:", ", ".join(str(day) for day in recording.days()) or "none")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+import numpy as np
+import pandas as pd
+
+import market_calendar
+import market_data
+import metrics
+
+# Intervals built from the 1m bars already held instead of being downloaded on their own
+DERIVED_INTERVALS = ("2m", "5m", "15m", "30m", "60m", "90m", "1h")
+
+# Periods Yahoo serves 1m bars for (it keeps about a week of them); longer periods are downloaded at their
+# own interval
+BASE_PERIODS = ("1d", "5d")
+
+NANOSECONDS_PER_DAY = 86_400 * 10**9
+
+
+# Time zone of a symbol's exchange and its session open as nanoseconds after local midnight; symbols on
+# unknown exchanges are binned from midnight UTC
+def _session_origin(symbol):
+    exchange = market_calendar.exchange_for(symbol)
+    if exchange is None:
+        return "UTC", 0
+    tz, open_time, _ = market_calendar.EXCHANGES[exchange]
+    return tz, (open_time.hour * 3600 + open_time.minute * 60) * 10**9
+
+
+# Aggregate 1m bars into bars of interval. Bins are counted from the session open of the symbol's exchange
+# (09:15 for NSE), so 1h bars start at 09:15, 10:15, ... as Yahoo's do. The bars are sorted, so every bin
+# is one contiguous run of rows and each column is aggregated in a single reduceat over its array.
+@metrics.timed("transform")
+def resample(minutes, interval, symbol):
+    minutes = minutes.dropna(subset=["Close"])
+    if minutes.empty:
+        return minutes
+    step = market_data.INTERVAL_SECONDS[interval] * 10**9
+    tz, open_offset = _session_origin(symbol)
+    utc = minutes.index.asi8
+    local = minutes.index.tz_convert(tz).tz_localize(None).asi8
+    origin = local // NANOSECONDS_PER_DAY * NANOSECONDS_PER_DAY + open_offset
+    bins = utc - (local - origin) % step
+    starts = np.flatnonzero(np.concatenate([[True], bins[1:] != bins[:-1]]))
+    ends = np.concatenate([starts[1:], [len(bins)]]) - 1
+    bars = pd.DataFrame(index=pd.DatetimeIndex(bins[starts], tz="UTC", name=minutes.index.name).tz_convert(minutes.index.tz))
+    if "Open" in minutes:
+        bars["Open"] = minutes["Open"].to_numpy()[starts]
+    if "High" in minutes:
+        bars["High"] = np.fmax.reduceat(minutes["High"].to_numpy(), starts)
+    if "Low" in minutes:
+        bars["Low"] = np.fmin.reduceat(minutes["Low"].to_numpy(), starts)
+    bars["Close"] = minutes["Close"].to_numpy()[ends]
+    if "Volume" in minutes:
+        bars["Volume"] = np.add.reduceat(minutes["Volume"].to_numpy(), starts)
+    return bars
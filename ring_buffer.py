@@ -0,0 +1,106 @@
+import numpy as np
+import pandas as pd
+
+# Prices are held as float32 (about seven significant digits, a paisa up to 100,000), volumes and
+# timestamps (nanoseconds since the epoch, UTC) as int64
+PRICE_COLUMNS = ("Open", "High", "Low", "Close")
+PRICE_DTYPE = np.float32
+
+
+def _read_only(array):
+    view = array.view()
+    view.flags.writeable = False
+    return view
+
+
+# Fixed-capacity bar buffer in column arrays. Bars live in one contiguous window [start, end), so every
+# column can be handed out as a zero-copy read-only view. Appending past the capacity copies the window to
+# the front of freshly allocated arrays instead of moving it in place, so views handed out earlier keep
+# showing the bars they were taken from; only a rewrite of the latest bars (the forming bar) shows through.
+# The new arrays leave headroom bars free, so the window moves once per headroom bars appended.
+class BarRingBuffer:
+    def __init__(self, capacity, tz="UTC", headroom=0):
+        self.capacity = capacity
+        self.tz = tz
+        self.headroom = headroom
+        self.start = 0
+        self.end = 0
+        self.compactions = 0
+        self._allocate(capacity)
+
+    # Timestamps are written through the int64 view of a UTC datetime array, so indexes can be cut from it without a copy
+    def _allocate(self, capacity):
+        self._times = pd.array(np.zeros(capacity, dtype="M8[ns]"), dtype=pd.DatetimeTZDtype(tz="UTC"))
+        self.timestamps = self._times.asi8
+        self.prices = np.full((len(PRICE_COLUMNS), capacity), np.nan, dtype=PRICE_DTYPE)
+        self.volumes = np.zeros(capacity, dtype=np.int64)
+        self.capacity = capacity
+
+    @classmethod
+    def from_frame(cls, frame, headroom):
+        tz = frame.index.tz if isinstance(frame.index, pd.DatetimeIndex) and frame.index.tz is not None else "UTC"
+        buffer = cls(len(frame) + headroom, tz, headroom)
+        buffer.append(frame)
+        return buffer
+
+    def __len__(self):
+        return self.end - self.start
+
+    @property
+    def nbytes(self):
+        return self.timestamps.nbytes + self.prices.nbytes + self.volumes.nbytes
+
+    @property
+    def last_timestamp(self):
+        return self.timestamps[self.end - 1] if self.end > self.start else None
+
+    # Move the window to the front of new arrays with room for at least extra more bars
+    def _compact(self, extra):
+        live = len(self)
+        timestamps, prices, volumes = self.timestamps, self.prices, self.volumes
+        self._allocate(max(self.capacity, live + extra + self.headroom))
+        self.timestamps[:live] = timestamps[self.start:self.end]
+        self.prices[:, :live] = prices[:, self.start:self.end]
+        self.volumes[:live] = volumes[self.start:self.end]
+        self.start, self.end = 0, live
+        self.compactions += 1
+
+    # Merge bars with a UTC or tz-aware DatetimeIndex. Bars held at or after the first new timestamp are
+    # replaced, as the last of them was still forming when it was added.
+    def append(self, frame):
+        timestamps = frame.index.asi8
+        if len(timestamps) == 0:
+            return 0
+        split = self.start + int(np.searchsorted(self.timestamps[self.start:self.end], timestamps[0]))
+        count = len(timestamps)
+        if split + count > self.capacity:
+            kept = split - self.start
+            self.end = split
+            self._compact(count)
+            split = self.start + kept
+        self.timestamps[split:split + count] = timestamps
+        for row, column in enumerate(PRICE_COLUMNS):
+            if column in frame:
+                self.prices[row, split:split + count] = frame[column].to_numpy(dtype=PRICE_DTYPE, na_value=np.nan)
+        if "Volume" in frame:
+            self.volumes[split:split + count] = frame["Volume"].fillna(0).to_numpy(dtype=np.int64)
+        self.end = split + count
+        return count
+
+    # Forget the oldest count bars
+    def drop(self, count):
+        self.start = min(self.start + count, self.end)
+
+    def column_view(self, column):
+        if column == "Volume":
+            return _read_only(self.volumes[self.start:self.end])
+        return _read_only(self.prices[PRICE_COLUMNS.index(column), self.start:self.end])
+
+    def index(self):
+        return pd.DatetimeIndex(self._times[self.start:self.end], copy=False, name="timestamp").tz_convert(self.tz)
+
+    # The bars as a DataFrame whose index and columns are views of the buffer, the columns read-only
+    def frame(self, index=None):
+        index = self.index() if index is None else index
+        columns = {column: self.column_view(column) for column in PRICE_COLUMNS + ("Volume",)}
+        return pd.DataFrame(columns, index=index, copy=False)
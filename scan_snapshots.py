@@ -0,0 +1,165 @@
+import threading
+import time
+
+import market_calendar
+import market_data
+import metrics
+import scanner
+
+# Seconds between scans; daily bars are cached for at most this long, so a faster cadence would see the same data
+SNAPSHOT_SECONDS = market_data.MAX_TTL_SECONDS
+
+# A universe no page has asked for in this long stops being scanned
+LEASE_SECONDS = 3 * SNAPSHOT_SECONDS
+
+# Indicator screens offered on the scanner page, each a boolean mask over the scan results
+FILTERS = {
+    "RSI above 60": lambda results: results['RSI (14)'] > 60,
+    "RSI below 40": lambda results: results['RSI (14)'] < 40,
+    "Close above EMA (20)": lambda results: results['Above EMA'],
+    "Close below EMA (20)": lambda results: results['Close'] < results['EMA (20)'],
+    "Volume above 5-day average": lambda results: results['Volume Ratio'] > 1,
+}
+
+
+# Every table the scanner page shows, derived from one set of scan results
+@metrics.timed("transform")
+def build_tables(results):
+    # Remove suffix ".NS" from scrips
+    results = results.copy()
+    results.index = results.index.str.replace('.NS', '', regex=False)
+
+    tables = {
+        "Top 10 Gainers": results['% Change'].nlargest(10).round(2).reset_index(),
+        "Top 10 Losers": results['% Change'].nsmallest(10).round(2).reset_index(),
+        "Stocks with Highest Volume": results['Volume'].nlargest(10).astype('int64').reset_index(),
+    }
+
+    # Stocks with 100% volume increase in the last 5 days, with their price change over the same days
+    volume_increase = results[results['% Volume Change'] >= 100].nlargest(10, '% Volume Change')
+    tables["100% Vol Increase in Last 5 Days"] = volume_increase[['% Volume Change', '% Price Change']].round(2).reset_index()
+
+    for name, mask in FILTERS.items():
+        filtered = results[mask(results)].sort_values('% Change Rank')
+        tables[name] = filtered[['Close', 'EMA (20)', 'RSI (14)', '% Change', 'Volume Ratio']].round(2).reset_index()
+    return tables
+
+
+# Immutable result of one scan, shared by every session until the next one replaces it
+class ScanSnapshot:
+    def __init__(self, version, computed_at, results, tables, missing=(), error=None):
+        self.version = version
+        self.computed_at = computed_at
+        self.results = results
+        self.tables = tables
+        self.missing = list(missing)
+        self.error = error
+
+
+def _scan(symbols):
+    matrices = scanner.load_matrices(symbols)
+    results = scanner.scan(matrices)
+    return results, build_tables(results), matrices.missing, matrices.error
+
+
+# One background thread that rescans every universe a page has asked for on a fixed schedule.
+# Pages only read the latest snapshot, so reruns and widget clicks never touch Yahoo or the scanner.
+class SnapshotJob:
+    def __init__(self, refresh_seconds=SNAPSHOT_SECONDS):
+        self.refresh_seconds = refresh_seconds
+        self.scans = 0
+        self.errors = 0
+        self.skipped = 0
+        self._universes = {}
+        self._snapshots = {}
+        self._lock = threading.Lock()
+        self._scan_lock = threading.Lock()
+        self._thread = None
+
+    # Latest snapshot for a named universe of symbols. The very first request for a universe
+    # runs the scan inline; every later one returns immediately.
+    @metrics.timed("fetch")
+    def latest(self, name, symbols):
+        with self._lock:
+            self._universes[name] = (tuple(symbols), time.time() + LEASE_SECONDS)
+            snapshot = self._snapshots.get(name)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="scan-snapshots", daemon=True)
+                self._thread.start()
+        if snapshot is None:
+            snapshot = self.refresh(name, symbols)
+        return snapshot
+
+    # Scan a universe now and publish the result as its next version
+    def refresh(self, name, symbols):
+        with self._scan_lock:
+            snapshot = self._snapshots.get(name)
+            # Another session may have finished the same scan while this one waited for the lock
+            if snapshot is not None and snapshot.computed_at >= time.time() // self.refresh_seconds * self.refresh_seconds:
+                return snapshot
+            results, tables, missing, error = _scan(list(symbols))
+            version = snapshot.version + 1 if snapshot is not None else 1
+            snapshot = ScanSnapshot(version, time.time(), results, tables, missing, error)
+            with self._lock:
+                self._snapshots[name] = snapshot
+            self.scans += 1
+            return snapshot
+
+    def refresh_all(self):
+        now = time.time()
+        with self._lock:
+            for name, (_, lease) in list(self._universes.items()):
+                if lease <= now:
+                    del self._universes[name]
+                    self._snapshots.pop(name, None)
+            universes = dict(self._universes)
+            snapshots = dict(self._snapshots)
+        for name, (symbols, _) in universes.items():
+            # Nothing moves while the universe's exchanges are closed once a scan has run after their close
+            snapshot = snapshots.get(name)
+            if snapshot is not None:
+                representatives = {market_calendar.exchange_for(symbol): symbol for symbol in symbols}.values()
+                scanned_at = market_calendar.to_clock(snapshot.computed_at)
+                calendar_now = market_calendar.to_clock(now)
+                if all(market_calendar.next_fetch(symbol, scanned_at, calendar_now) > calendar_now for symbol in representatives):
+                    self.skipped += 1
+                    continue
+            try:
+                self.refresh(name, symbols)
+            except Exception:
+                # Keep serving the previous snapshot; the next run tries again
+                self.errors += 1
+
+    def _run(self):
+        while True:
+            # Wake just after the next refresh boundary, when the cached daily bars have expired
+            now = time.time()
+            next_run = (now // self.refresh_seconds + 1) * self.refresh_seconds + market_data.SETTLE_SECONDS
+            time.sleep(next_run - now)
+            self.refresh_all()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "universes": len(self._universes),
+                "snapshots": {name: snapshot.version for name, snapshot in self._snapshots.items()},
+                "scans": self.scans,
+                "errors": self.errors,
+                "skipped": self.skipped,
+            }
+
+
+job = SnapshotJob()
+
+
+def _samples():
+    stats = job.stats()
+    return [
+        ("scan_universes", "gauge", stats["universes"], {}),
+        ("scans_total", "counter", stats["scans"], {}),
+        ("scan_errors_total", "counter", stats["errors"], {}),
+        ("scans_skipped_total", "counter", stats["skipped"], {}),
+    ]
+
+
+metrics.register_collector(_samples)
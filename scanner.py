@@ -0,0 +1,223 @@
+import time
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+import fetch_engine
+import market_data
+import metrics
+
+# Trading sessions the gainers/losers/volume tables look back over
+SCAN_WINDOW = 5
+
+# Daily history loaded so that EMA and RSI have enough bars to warm up
+HISTORY_PERIOD = "3mo"
+
+# Symbols per download; each chunk is turned into matrix columns before the next ones are held in memory
+CHUNK_SIZE = 100
+
+# Chunks fetched concurrently, which bounds how many chunks of frames exist at once
+MAX_CHUNKS_IN_FLIGHT = 2
+
+# Extra attempts for the symbols of a chunk that came back empty or failed, with exponential backoff
+RETRIES = 2
+RETRY_BACKOFF_SECONDS = 1
+
+# Closes are stored in single precision, half the memory of float64, precise to well under a paisa at NSE prices;
+# volumes run into the hundreds of millions and stay in double precision. Metrics are computed in double precision.
+CLOSE_DTYPE = np.float32
+VOLUME_DTYPE = np.float64
+
+
+# Closes and volumes for a chunk of symbols as compact (time x symbol) blocks on the chunk's own date index
+def _block(frames, symbols):
+    symbols = [symbol for symbol in symbols if symbol in frames and not frames[symbol].empty]
+    closes = pd.DataFrame({symbol: frames[symbol]['Close'] for symbol in symbols})
+    volumes = pd.DataFrame({symbol: frames[symbol]['Volume'] for symbol in symbols}).reindex(closes.index)
+    return closes.index, symbols, closes.to_numpy(dtype=CLOSE_DTYPE), volumes.to_numpy(dtype=VOLUME_DTYPE)
+
+
+# Closes and volumes for a whole universe as (time x symbol) matrices on one shared date index
+class ScanMatrices:
+    def __init__(self, index, symbols, closes, volumes, missing=(), error=None):
+        self.index = index
+        self.symbols = symbols
+        self.closes = closes
+        self.volumes = volumes
+        self.missing = list(missing)
+        self.error = error
+
+    # Place per-chunk blocks side by side on the union of their date indexes
+    @classmethod
+    def from_blocks(cls, blocks, missing=(), error=None):
+        blocks = [block for block in blocks if block[1]]
+        index = pd.DatetimeIndex([])
+        for block_index, _, _, _ in blocks:
+            index = index.union(block_index)
+        symbols = [symbol for _, block_symbols, _, _ in blocks for symbol in block_symbols]
+        closes = np.full((len(index), len(symbols)), np.nan, dtype=CLOSE_DTYPE)
+        volumes = np.full((len(index), len(symbols)), np.nan, dtype=VOLUME_DTYPE)
+        column = 0
+        for block_index, block_symbols, block_closes, block_volumes in blocks:
+            rows = index.get_indexer(block_index)
+            columns = slice(column, column + len(block_symbols))
+            closes[rows, columns] = block_closes
+            volumes[rows, columns] = block_volumes
+            column += len(block_symbols)
+        return cls(index, symbols, closes, volumes, missing, error)
+
+
+# Daily bars for one chunk of symbols, retrying the ones that came back empty or failed, and the last
+# error raised while fetching them
+def _fetch_chunk(symbols, period):
+    frames = {}
+    pending = list(symbols)
+    error = None
+    for attempt in range(RETRIES + 1):
+        if attempt:
+            time.sleep(RETRY_BACKOFF_SECONDS * 2 ** (attempt - 1))
+        try:
+            frames.update(market_data.get_history_many(pending, period=period))
+        except Exception as e:
+            error = e
+        pending = [symbol for symbol in pending if symbol not in frames or frames[symbol].empty]
+        if not pending:
+            break
+    if pending:
+        metrics.increment("scanner_failed_symbols_total", len(pending))
+    return _block(frames, symbols), error
+
+
+# Load a universe of any size into scan matrices. Symbols are downloaded in chunks, a few at a time,
+# and each finished chunk is reduced to matrix columns right away, so peak memory grows with the
+# final matrices rather than with a DataFrame holding every downloaded frame.
+def load_matrices(symbols, period=HISTORY_PERIOD, chunk_size=CHUNK_SIZE):
+    symbols = list(dict.fromkeys(symbols))
+    chunks = [symbols[start:start + chunk_size] for start in range(0, len(symbols), chunk_size)]
+    blocks = []
+    error = None
+    in_flight = deque()
+    for chunk in chunks:
+        in_flight.append(fetch_engine.executor.submit(_fetch_chunk, chunk, period))
+        if len(in_flight) >= MAX_CHUNKS_IN_FLIGHT:
+            block, chunk_error = in_flight.popleft().result()
+            blocks.append(block)
+            error = chunk_error or error
+    while in_flight:
+        block, chunk_error = in_flight.popleft().result()
+        blocks.append(block)
+        error = chunk_error or error
+    loaded = {symbol for _, block_symbols, _, _ in blocks for symbol in block_symbols}
+    missing = [symbol for symbol in symbols if symbol not in loaded]
+    return ScanMatrices.from_blocks(blocks, missing=missing, error=error if missing else None)
+
+
+# Carry the last observation forward down each column; leading gaps stay NaN
+def ffill(values):
+    rows = np.arange(values.shape[0])[:, None]
+    positions = np.where(np.isnan(values), 0, rows)
+    np.maximum.accumulate(positions, axis=0, out=positions)
+    return values[positions, np.arange(values.shape[1])]
+
+
+# Column-wise pandas ewm(adjust=False).mean(): the same recurrence as indicators.EWM,
+# stepped through time once with every symbol updated in the same vector operation
+def ewm(values, com, min_periods):
+    alpha = 1. / (1. + com)
+    old_wt_factor = 1. - alpha
+    new_wt = alpha
+    min_periods = max(int(min_periods), 1)
+    out = np.full(values.shape, np.nan)
+    if values.shape[0] == 0:
+        return out
+    weighted = values[0].copy()
+    nobs = (~np.isnan(weighted)).astype(np.int64)
+    old_wt = np.ones(values.shape[1])
+    out[0] = np.where(nobs >= min_periods, weighted, np.nan)
+    with np.errstate(invalid='ignore'):
+        for row in range(1, values.shape[0]):
+            cur = values[row]
+            is_observation = ~np.isnan(cur)
+            nobs += is_observation
+            started = ~np.isnan(weighted)
+            old_wt = np.where(started, old_wt * old_wt_factor, old_wt)
+            blended = (old_wt * weighted + new_wt * cur) / (old_wt + new_wt)
+            weighted = np.where(started & is_observation & (weighted != cur), blended, weighted)
+            old_wt = np.where(started & is_observation, 1., old_wt)
+            weighted = np.where(~started & is_observation, cur, weighted)
+            out[row] = np.where(nobs >= min_periods, weighted, np.nan)
+    return out
+
+
+# Same values as ta's EMAIndicator, for every column at once
+def ema(closes, window):
+    return ewm(closes, (window - 1) / 2, window)
+
+
+# Same values as ta's RSIIndicator, for every column at once
+def rsi(closes, window=14):
+    diff = np.full(closes.shape, np.nan)
+    diff[1:] = closes[1:] - closes[:-1]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        up = ewm(np.where(diff > 0, diff, 0.0), (1 - 1 / window) / (1 / window), window)
+        down = ewm(-np.where(diff < 0, diff, 0.0), (1 - 1 / window) / (1 / window), window)
+        return np.where(down == 0, 100, 100 - (100 / (1 + up / down)))
+
+
+# Percentage change of the last row against the one before, after forward-filling gaps
+def last_pct_change(values):
+    filled = ffill(values)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return (filled[-1] / filled[-2] - 1) * 100
+
+
+# Percentage change of the last row against the first
+def window_pct_change(values):
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return (values[-1] - values[0]) / values[0] * 100
+
+
+# Last row divided by the mean of the rows before it
+def last_to_mean_ratio(values):
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return values[-1] / np.nanmean(values[:-1], axis=0)
+
+
+# 1 for the largest value in a vector, NaN for missing values
+def rank_descending(values):
+    ranks = np.full(values.shape, np.nan)
+    valid = ~np.isnan(values)
+    order = np.argsort(-values[valid], kind='stable')
+    valid_ranks = np.empty(order.shape)
+    valid_ranks[order] = np.arange(1, len(order) + 1)
+    ranks[valid] = valid_ranks
+    return ranks
+
+
+# Every scanner metric for every symbol, one row per symbol. Each metric is a single pass over the matrices,
+# so adding a metric or filter costs the same whether the universe has 50 symbols or 2000.
+@metrics.timed("transform")
+def scan(matrices, window=SCAN_WINDOW, ema_window=20, rsi_window=14):
+    closes = matrices.closes.astype(np.float64)
+    recent_closes = closes[-window:]
+    recent_volumes = matrices.volumes[-window:]
+    last_close = ffill(closes)[-1]
+    ema_last = ema(closes, ema_window)[-1]
+    results = pd.DataFrame({
+        '% Change': last_pct_change(recent_closes),
+        'Close': last_close,
+        'Volume': recent_volumes[-1],
+        '% Volume Change': window_pct_change(recent_volumes),
+        '% Price Change': window_pct_change(recent_closes),
+        'Volume Ratio': last_to_mean_ratio(recent_volumes),
+        f'EMA ({ema_window})': ema_last,
+        f'RSI ({rsi_window})': rsi(closes, rsi_window)[-1],
+    }, index=pd.Index(matrices.symbols, name='Scrip'))
+    results['% Change Rank'] = rank_descending(results['% Change'].to_numpy())
+    results['Volume Rank'] = rank_descending(results['Volume'].to_numpy())
+    results['Above EMA'] = last_close > ema_last
+    return results
+
+
+metrics.describe("scanner_failed_symbols_total", "Scanned symbols that still had no bars after every retry")
@@ -0,0 +1,43 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import ta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import indicators
+
+# Minute closes with a few gaps Yahoo leaves as NaN
+MINUTES = pd.date_range("2026-10-16 03:45", periods=200, freq="1min", tz="UTC")
+CLOSES = 100 + np.cumsum(np.random.default_rng(0).normal(0, 0.2, len(MINUTES)))
+CLOSES[[40, 41, 90, 150]] = np.nan
+
+
+# What ta returns for the same bars, one array per output column
+def _ta(close, name):
+    if name == "ema":
+        return [ta.trend.EMAIndicator(close, window=20).ema_indicator()]
+    if name == "rsi":
+        return [ta.momentum.RSIIndicator(close, window=14).rsi()]
+    macd = ta.trend.MACD(close)
+    return [macd.macd(), macd.macd_signal(), macd.macd_diff()]
+
+
+def test_streamed_indicators_are_bit_identical_to_ta():
+    engine = indicators.IndicatorEngine()
+    params = {"ema": {"window": 20}, "rsi": {"window": 14}, "macd": {}}
+
+    # Each refresh sees the bar before it completed and a new bar still forming, whose close then changes
+    for end in range(30, len(MINUTES) + 1):
+        bars = pd.DataFrame({"Close": CLOSES[:end]}, index=MINUTES[:end])
+        forming = bars.copy()
+        forming.iloc[-1, 0] += 0.5
+        for frame in (forming, bars):
+            for name, kwargs in params.items():
+                streamed = engine.compute("TEST", frame, name, **kwargs)
+                for column, expected in zip(streamed.columns, _ta(frame["Close"], name)):
+                    assert np.array_equal(streamed[column].to_numpy(), expected.to_numpy(), equal_nan=True), (end, column)
+
+    assert engine.full_runs == len(params)
@@ -0,0 +1,61 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import intraday_store
+import market_data
+import ohlcv_store
+
+# Thirty 1m bars of the current session
+MINUTES = pd.date_range(end=pd.Timestamp.now(tz="UTC").floor("min"), periods=30, freq="1min", name="Datetime")
+
+
+# A batched download where BAD.NS has no bars: yf.download returns its columns filled with NaN
+def fake_download(symbols, **kwargs):
+    prices = np.linspace(100, 101, len(MINUTES))
+    good = pd.DataFrame({"Open": prices, "High": prices, "Low": prices, "Close": prices, "Volume": 1000.}, index=MINUTES)
+    return pd.concat({symbol: good if symbol != "BAD.NS" else good * np.nan for symbol in symbols}, axis=1)
+
+
+def test_symbol_without_bars_does_not_stop_refreshes(tmp_path, monkeypatch):
+    monkeypatch.setattr(market_data.yf, "download", fake_download)
+    monkeypatch.setattr(ohlcv_store, "STORE_DIR", str(tmp_path))
+    market_data.cache.clear()
+    store = intraday_store.IntradayStore()
+
+    series = store.update(["GOOD.NS", "BAD.NS"], "1m", "1d")
+    assert {symbol: len(series.bars) for symbol, series in series.items()} == {"GOOD.NS": 30}
+
+    series["GOOD.NS"].expires_at = 0
+    series = store.update(["GOOD.NS", "BAD.NS"], "1m", "1d")
+    assert list(series) == ["GOOD.NS"]
+    assert store.incremental_loads == 1
+    assert store.full_loads == 2
+
+
+def test_pct_change_extends_with_each_append():
+    minutes = pd.date_range("2026-10-16 03:45", periods=400, freq="1min", tz="UTC")
+    closes = 100 + np.cumsum(np.random.default_rng(0).normal(0, 0.1, len(minutes)))
+    bars = pd.DataFrame({"Open": closes, "High": closes, "Low": closes, "Close": closes, "Volume": 1000}, index=minutes)
+    series = intraday_store.IntradaySeries(bars.iloc[:100], "1d", "1m")
+    series.pct_change_from(100.0)
+    cached = series._pct[100.0]
+
+    # Each poll replaces the forming bar and adds the next one, with the forming bar's close still moving
+    for end in range(101, len(bars)):
+        new_bars = bars.iloc[end - 2:end].copy()
+        new_bars.iloc[-1, new_bars.columns.get_loc("Close")] += 0.05
+        series.append(new_bars)
+        pct = series.pct_change_from(100.0)
+        expected = (series.bars["Close"].to_numpy() / np.float32(100.0) - 1) * 100
+        assert np.array_equal(pct.to_numpy(), expected)
+        assert pct.index.equals(series.bars.index)
+
+    # The cached values were only rebuilt when the ring buffer moved its bars to new arrays
+    assert series._ring.compactions > 0
+    assert series._pct[100.0] is not cached
+    assert series._pct[100.0].prices is series._ring.prices
@@ -0,0 +1,52 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import market_data
+import ohlcv_store
+
+# A 10% dividend on the fifth day: adjusted closes before it are 10% lower than the traded ones
+DAYS = pd.bdate_range(end=pd.Timestamp.now().normalize(), periods=10, name="Date")
+TRADED = np.linspace(100, 109, len(DAYS))
+ADJUSTED = np.where(np.arange(len(DAYS)) < 4, TRADED * 0.9, TRADED)
+
+
+def _bars(auto_adjust):
+    bars = pd.DataFrame({"Open": TRADED, "High": TRADED, "Low": TRADED, "Volume": 1000}, index=DAYS)
+    bars["Close"] = ADJUSTED if auto_adjust else TRADED
+    if not auto_adjust:
+        bars["Adj Close"] = ADJUSTED
+    return bars
+
+
+# Stand-ins with yfinance 0.2.40's defaults: Ticker.history adjusts, yf.download does not
+class FakeTicker:
+    def __init__(self, symbol, session=None):
+        self.symbol = symbol
+
+    def history(self, auto_adjust=True, **kwargs):
+        return _bars(auto_adjust)
+
+
+def fake_download(symbols, auto_adjust=False, **kwargs):
+    return pd.concat({symbol: _bars(auto_adjust) for symbol in symbols}, axis=1)
+
+
+def _stored_closes(tmp_path, monkeypatch, symbols):
+    monkeypatch.setattr(market_data.yf, "Ticker", FakeTicker)
+    monkeypatch.setattr(market_data.yf, "download", fake_download)
+    monkeypatch.setattr(ohlcv_store, "STORE_DIR", str(tmp_path / "-".join(symbols)))
+    market_data.cache.clear()
+    market_data.get_history_many(symbols, interval="1d", period="1mo")
+    return ohlcv_store.read(symbols[0], "1d")["Close"].to_numpy()
+
+
+def test_single_and_batched_fetches_store_the_same_closes(tmp_path, monkeypatch):
+    single = _stored_closes(tmp_path, monkeypatch, ["AAA.NS"])
+    batched = _stored_closes(tmp_path, monkeypatch, ["AAA.NS", "BBB.NS"])
+    np.testing.assert_allclose(single, batched)
+    np.testing.assert_allclose(single, ADJUSTED)
@@ -0,0 +1,27 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import market_data
+import ohlcv_store
+import providers
+
+
+def test_simulated_bars_stay_out_of_the_live_store(tmp_path, monkeypatch):
+    live = str(tmp_path / "ohlcv")
+    monkeypatch.setattr(ohlcv_store, "STORE_DIR", live)
+    monkeypatch.setattr(providers, "provider", providers.provider)
+    monkeypatch.setattr(market_data, "_fetch_upstream", market_data._fetch_upstream)
+    market_data.cache.clear()
+    yahoo = providers.provider
+
+    providers.use(providers.SimulatedProvider())
+    assert "RELIANCE.NS" in market_data.get_history_many(["RELIANCE.NS"], interval="1d", period="5d")
+    assert ohlcv_store.read("RELIANCE.NS", "1d") is not None
+    assert not os.path.exists(live)
+
+    providers.use(yahoo)
+    assert ohlcv_store.STORE_DIR == live
+    assert ohlcv_store.read("RELIANCE.NS", "1d") is None
+    market_data.cache.clear()
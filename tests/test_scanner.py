@@ -0,0 +1,39 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import market_data
+import ohlcv_store
+import scanner
+
+DAYS = pd.bdate_range(end=pd.Timestamp.now().normalize(), periods=30, name="Date")
+
+
+# An upstream that returns no bars for FLAKY.NS the first time it is asked
+class FlakyUpstream:
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, symbols, **kwargs):
+        self.calls.append(list(symbols))
+        closes = np.linspace(100, 110, len(DAYS))
+        bars = pd.DataFrame({"Open": closes, "High": closes, "Low": closes, "Close": closes, "Volume": 1000.}, index=DAYS)
+        return {symbol: bars if symbol != "FLAKY.NS" or len(self.calls) > 1 else bars.iloc[:0] for symbol in symbols}
+
+
+def test_symbols_without_bars_are_retried_upstream(tmp_path, monkeypatch):
+    upstream = FlakyUpstream()
+    monkeypatch.setattr(market_data, "_fetch_upstream", upstream)
+    monkeypatch.setattr(ohlcv_store, "STORE_DIR", str(tmp_path))
+    monkeypatch.setattr(scanner, "RETRY_BACKOFF_SECONDS", 0)
+    market_data.cache.clear()
+
+    matrices = scanner.load_matrices(["A.NS", "FLAKY.NS"])
+    assert upstream.calls == [["A.NS", "FLAKY.NS"], ["FLAKY.NS"]]
+    assert matrices.symbols == ["A.NS", "FLAKY.NS"]
+    assert matrices.missing == []
+    market_data.cache.clear()
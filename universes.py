@@ -0,0 +1,53 @@
+import csv
+import os
+
+# Directory of universe files; each <Name>.csv lists one symbol per row and shows up on the scanner as "Name"
+UNIVERSE_DIR = "universes"
+
+DEFAULT_UNIVERSE = "Nifty 50"
+
+# Header of the symbol column in NSE's index constituent lists (ind_nifty500list.csv) and equity list (EQUITY_L.csv)
+SYMBOL_COLUMNS = ("Symbol", "SYMBOL")
+
+# Yahoo suffix for NSE listings
+EXCHANGE_SUFFIX = ".NS"
+
+
+def _path(name):
+    return os.path.join(UNIVERSE_DIR, name.replace(" ", "_") + ".csv")
+
+
+# Names of every universe file, default first
+def names():
+    try:
+        found = sorted(name[:-len(".csv")].replace("_", " ") for name in os.listdir(UNIVERSE_DIR) if name.endswith(".csv"))
+    except FileNotFoundError:
+        return []
+    if DEFAULT_UNIVERSE in found:
+        found.remove(DEFAULT_UNIVERSE)
+        found.insert(0, DEFAULT_UNIVERSE)
+    return found
+
+
+# Yahoo symbols of a universe, in file order without duplicates. Bare NSE symbols get the ".NS" suffix;
+# symbols that already carry a suffix, and index symbols, are kept as they are.
+def load(name):
+    with open(_path(name), 'r', encoding='utf-8', newline='') as file:
+        rows = list(csv.reader(file))
+    if not rows:
+        return []
+    header = [column.strip() for column in rows[0]]
+    column = next((header.index(candidate) for candidate in SYMBOL_COLUMNS if candidate in header), None)
+    if column is None:
+        column = 0
+    else:
+        rows = rows[1:]
+    symbols = []
+    for row in rows:
+        if len(row) <= column or not row[column].strip():
+            continue
+        symbol = row[column].strip().upper()
+        if "." not in symbol and not symbol.startswith("^"):
+            symbol += EXCHANGE_SUFFIX
+        symbols.append(symbol)
+    return list(dict.fromkeys(symbols))
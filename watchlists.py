@@ -0,0 +1,145 @@
+import atexit
+import json
+import os
+import tempfile
+import threading
+import time
+from urllib.parse import quote
+
+import metrics
+
+# One JSON file per user: <WATCHLIST_DIR>/<username>.json
+WATCHLIST_DIR = "watchlists"
+
+# The list every user shared before watchlists were per user; it seeds the watchlist of anyone without one yet
+LEGACY_FILE = "additional_symbols.json"
+
+# Watchlist groups, in the order the dashboard shows them
+GROUPS = ("stocks", "indexes")
+
+# Seconds edits wait in memory before being written, so a burst of edits is written once
+FLUSH_SECONDS = 2
+
+# Owner of the watchlist when a page runs without anyone logged in
+GUEST = "guest"
+
+
+def _path(username):
+    return os.path.join(WATCHLIST_DIR, quote(username, safe="") + ".json")
+
+
+# Symbols of a watchlist file, per group, as insertion-ordered dicts so lookups and edits are O(1)
+def _read(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, "r") as file:
+        data = json.load(file)
+    if not isinstance(data, dict):
+        data = {}
+    return {group: dict.fromkeys(data.get(group) or []) for group in GROUPS}
+
+
+# Write to a temporary file in the same directory and rename it over the old one, so a crash or a
+# concurrent reader never sees a half-written file
+def _write(path, watchlist):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    with os.fdopen(fd, "w") as file:
+        json.dump({group: list(symbols) for group, symbols in watchlist.items()}, file)
+    os.replace(tmp_path, path)
+
+
+# Watchlists keyed by username, read once and kept in memory. Edits only change memory and mark the
+# watchlist dirty; a background thread writes dirty watchlists every FLUSH_SECONDS.
+class WatchlistStore:
+    def __init__(self, flush_seconds=FLUSH_SECONDS):
+        self.flush_seconds = flush_seconds
+        self.writes = 0
+        self.errors = 0
+        self._watchlists = {}
+        self._dirty = set()
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._thread = None
+
+    def _load(self, username):
+        watchlist = self._watchlists.get(username)
+        if watchlist is None:
+            watchlist = _read(_path(username)) or _read(LEGACY_FILE) or {group: {} for group in GROUPS}
+            self._watchlists[username] = watchlist
+        return watchlist
+
+    # A copy of a user's watchlist as {group: [symbols]}
+    def get(self, username):
+        with self._lock:
+            return {group: list(symbols) for group, symbols in self._load(username).items()}
+
+    # Add symbol to a group; False when it is already there
+    def add(self, username, group, symbol):
+        with self._lock:
+            symbols = self._load(username)[group]
+            if symbol in symbols:
+                return False
+            symbols[symbol] = None
+            self._mark_dirty(username)
+            return True
+
+    # Remove symbol from a group; False when it was not there
+    def remove(self, username, group, symbol):
+        with self._lock:
+            symbols = self._load(username)[group]
+            if symbol not in symbols:
+                return False
+            del symbols[symbol]
+            self._mark_dirty(username)
+            return True
+
+    def _mark_dirty(self, username):
+        self._dirty.add(username)
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="watchlist-writer", daemon=True)
+            self._thread.start()
+
+    # Write every watchlist edited since the last flush
+    def flush(self):
+        with self._write_lock:
+            with self._lock:
+                pending = {username: {group: dict(symbols) for group, symbols in self._watchlists[username].items()}
+                           for username in self._dirty}
+                self._dirty.clear()
+            for username, watchlist in pending.items():
+                try:
+                    _write(_path(username), watchlist)
+                    self.writes += 1
+                except Exception:
+                    self.errors += 1
+                    with self._lock:
+                        self._dirty.add(username)
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_seconds)
+            self.flush()
+
+    def stats(self):
+        with self._lock:
+            return {"watchlists": len(self._watchlists), "pending": len(self._dirty), "writes": self.writes, "errors": self.errors}
+
+
+store = WatchlistStore()
+
+# Write the edits still waiting in memory when the server shuts down
+atexit.register(lambda: store.flush())
+
+
+def _samples():
+    stats = store.stats()
+    return [
+        ("watchlists", "gauge", stats["watchlists"], {}),
+        ("watchlist_pending_writes", "gauge", stats["pending"], {}),
+        ("watchlist_writes_total", "counter", stats["writes"], {}),
+        ("watchlist_write_errors_total", "counter", stats["errors"], {}),
+    ]
+
+
+metrics.register_collector(_samples)